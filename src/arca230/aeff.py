@@ -1,7 +1,16 @@
+import logging
+
 import pandas as pd
 import numpy as np
 
-from arca230.coordinates import fraction_at_zenith
+from arca230.coordinates import transient_visibility_matrix, visibility_matrix
+from arca230.flux import integrate_dNdE
+from arca230.instrumentation import count, timed
+from arca230.irfcache import load_component
+from arca230.memo import memoised
+
+
+logger = logging.getLogger(__name__)
 
 
 class EffectiveArea:
@@ -10,80 +19,124 @@ class EffectiveArea:
     The effective area is stored as a function of cos(zen) and true neutrino energy
     """
 
-    def __init__(self, file_path="../data/aeff_coszen_numu_track.csv"):
-        self.file_path = file_path
+    data_table = "effective_area_data"
+    grid_arrays = ("logE_edges", "coszen_edges", "aeff_grid", "aeff_cumulative", "logE_centers", "energy_bin_width")
 
-        self.effective_area_data = None
-        self.load_effective_area_data()
+    def __init__(self, file_path="../data/aeff_coszen_numu_track.csv", cache_dir=None):
+        self.file_path = file_path
 
         self.binsize_coszen = 0.05
         self.tolerance = 1e-5  # for comparing floats
 
+        self.effective_area_data = None
+        self.logE_edges = None
+        self.coszen_edges = None
+        self.aeff_grid = None
+        self.aeff_cumulative = None
+        self.logE_centers = None
+        self.energy_bin_width = None
+        self.kernel_cache = {}  # (sin(dec) tuple, livetime) -> flux response kernel
+        load_component(
+            self, self.data_table, self.grid_arrays, self.load_effective_area_data, self.build_effective_area_grid, cache_dir
+        )
+
     def load_effective_area_data(self):
         """
         Loads the data for the effective area
         """
         try:
             self.effective_area_data = pd.read_csv(self.file_path, delimiter=",")
-            print("Effective Area data loaded successfully.")
+            logger.info("Effective Area data loaded successfully.")
         except FileNotFoundError:
-            print(f"Error: File '{self.file_path}' not found.")
+            raise RuntimeError(f"File '{self.file_path}' not found.")
         except Exception as e:
-            print(f"An error occurred while loading the data: {e}")
+            raise RuntimeError(f"An error occurred while loading the data: {e}")
 
-    def effective_area_at_sindec(self, sindec, nsamples=1000):
+    def build_effective_area_grid(self):
         """
-        Calculate the effective area for a source location. This is obtained by weighting the effective area
-        cos(zen) bands with the visibility for that cos(zen)
+        Store the effective area as a dense array with shape (n_energy, n_coszen) together with the bin edges
+        """
+        data = self.effective_area_data
 
-        Parameters:
-        - sindec: Source location
-        - nsamples: number of samples in calculation visibility
+        self.logE_edges = np.union1d(data["log10(nu_E [GeV]) low"], data["log10(nu_E [GeV]) high"])
+        self.coszen_edges = np.union1d(data["cos(zen) low"], data["cos(zen) high"])
 
-        Returns:
-        - Dataframe with the effective area as a function of true neutrino energy
-        """
-        if np.abs(sindec) > 1:
-            raise ValueError(f"abs(sindec) should be < 1 {sindec}")
+        index_energy = np.searchsorted(self.logE_edges, data["log10(nu_E [GeV]) center"].to_numpy()) - 1
+        index_coszen = np.searchsorted(self.coszen_edges, data["cos(zen) center"].to_numpy()) - 1
 
-        # copy the zenith bands
-        zenith_bands = self.effective_area_data[["cos(zen) low", "cos(zen) center", "cos(zen) high"]].copy()
-        zenith_bands = zenith_bands.drop_duplicates(keep="first")
+        self.aeff_grid = np.zeros((len(self.logE_edges) - 1, len(self.coszen_edges) - 1))
+        self.aeff_grid[index_energy, index_coszen] = data["aeff [m^2]"].to_numpy()
 
-        # calculate the visibility for each zenith band
-        zenith_bands = fraction_at_zenith(zenith_bands, sindec, nsamples)  # src/coordinates.py
+        # prefix sum along cos(zen) with a leading zero, such that any band is the difference of two columns
+        self.aeff_cumulative = np.zeros((len(self.logE_edges) - 1, len(self.coszen_edges)))
+        self.aeff_cumulative[:, 1:] = np.cumsum(self.aeff_grid, axis=1)
 
-        # make a copy of the effective area for storing the result
-        effective_area_source = self.effective_area_data[["log10(nu_E [GeV]) low", "log10(nu_E [GeV]) center", "log10(nu_E [GeV]) high", "aeff [m^2]"]].copy()
-        effective_area_source["aeff [m^2]"] = 0
-        effective_area_source = effective_area_source.drop_duplicates(keep="first")
+        self.logE_centers = 0.5 * (self.logE_edges[1:] + self.logE_edges[:-1])
+        self.energy_bin_width = np.power(10, self.logE_edges[1:]) - np.power(10, self.logE_edges[:-1])
 
-        # iterate over each zenith band
-        for _, row_zenith in zenith_bands.iterrows():
-            # Extract values for calculations
-            cos_zen_low = row_zenith["cos(zen) low"]
+    @timed("EffectiveArea.effective_area_matrix")
+    def effective_area_matrix(self, sindec, ra=None, t_start=None, t_stop=None):
+        """
+        Calculate the effective area for many source locations at once by weighting the cos(zen) bands with the
+        visibility of each source. The visibility is the daily average, or the average over a time window for
+        transient sources when the window is given (see coordinates.transient_visibility_matrix).
+
+        Parameters:
+        - sindec: Source locations, array of length n_sindec
+        - ra: right ascensions in degrees, array of length n_sindec, only used with a time window
+        - t_start: start of the time windows, astropy Time, numpy datetime64 in UTC or modified julian dates
+        - t_stop: end of the time windows, like t_start
 
-            # visibility
-            weight = row_zenith["weight"]
+        Returns:
+        - Array with shape (n_sindec, n_energy) with the effective area in m^2 per true neutrino energy bin
+        """
+        sindec = np.atleast_1d(np.asarray(sindec, dtype=float))
+        if np.any(np.abs(sindec) > 1):
+            raise ValueError(f"abs(sindec) should be < 1 {sindec}")
 
-            effective_area_zenith_band = self.effective_area_data[self.effective_area_data["cos(zen) low"] == cos_zen_low]
+        if t_start is None:
+            weights = visibility_matrix(sindec, self.coszen_edges[:-1], self.coszen_edges[1:])
+        else:
+            if ra is None or t_stop is None:
+                raise ValueError("A time window needs ra, t_start and t_stop")
+            bands = (self.coszen_edges[:-1], self.coszen_edges[1:])
+            weights = transient_visibility_matrix(ra, sindec, t_start, t_stop, *bands)
+        return weights @ self.aeff_grid.T
+
+    @timed("EffectiveArea.effective_area_at_sindec")
+    @memoised
+    def effective_area_at_sindec(self, sindec, nsamples=1000, ra=None, t_start=None, t_stop=None):
+        """
+        Calculate the effective area for a source location. This is obtained by weighting the effective area
+        cos(zen) bands with the visibility for that cos(zen), averaged over a day or over the time window of a
+        transient source
 
-            merged_df = pd.merge(
-                effective_area_source,
-                effective_area_zenith_band,
-                on=["log10(nu_E [GeV]) low", "log10(nu_E [GeV]) center", "log10(nu_E [GeV]) high"],
-                how="left",
-                suffixes=("_df1", "_df2"),
-            )
+        Parameters:
+        - sindec: Source location
+        - nsamples: unused, kept for backwards compatibility. The visibility is calculated analytically
+        - ra: right ascension in degrees, only used with a time window
+        - t_start: start of the time window, modified julian date, numpy datetime64 in UTC or astropy Time
+        - t_stop: end of the time window, like t_start
 
-            merged_df["aeff [m^2]"] = merged_df["aeff [m^2]_df1"] + merged_df["aeff [m^2]_df2"] * weight
+        Returns:
+        - Dataframe with the effective area as a function of true neutrino energy
+        """
+        if np.abs(sindec) > 1:
+            raise ValueError(f"abs(sindec) should be < 1 {sindec}")
 
-            effective_area_source = merged_df[
-                ["log10(nu_E [GeV]) low", "log10(nu_E [GeV]) center", "log10(nu_E [GeV]) high", "aeff [m^2]"]
-            ]
+        effective_area_source = pd.DataFrame(
+            {
+                "log10(nu_E [GeV]) low": self.logE_edges[:-1],
+                "log10(nu_E [GeV]) center": self.logE_centers,
+                "log10(nu_E [GeV]) high": self.logE_edges[1:],
+                "aeff [m^2]": self.effective_area_matrix(sindec, ra, t_start, t_stop)[0],
+            }
+        )
 
         return effective_area_source[effective_area_source["aeff [m^2]"] > 0]
 
+    @timed("EffectiveArea.effective_area_zenith_band")
+    @memoised
     def effective_area_zenith_band(self, cos_zen_low, cos_zen_high):
         """
         Calculate the effective area for a zenith band. The instrument response function is already stored as a function
@@ -97,76 +150,81 @@ class EffectiveArea:
         Returns:
         - Dataframe with the effective area as a function of true neutrino energy for the given zenith band
         """
-        rounded_binsize = round(self.binsize_coszen, 5)  # Round binsize to the desired precision
+        aeff_band = pd.DataFrame(
+            {
+                "log10(nu_E [GeV]) low": self.logE_edges[:-1],
+                "log10(nu_E [GeV]) center": self.logE_centers,
+                "log10(nu_E [GeV]) high": self.logE_edges[1:],
+                "aeff [m^2]": self.effective_area_bands(cos_zen_low, cos_zen_high)[0],
+            }
+        )
 
-        if (
-            abs(round(cos_zen_low / rounded_binsize) - cos_zen_low / rounded_binsize) > self.tolerance
-            or abs(round(cos_zen_high / rounded_binsize) - cos_zen_high / rounded_binsize) > self.tolerance
-        ):
-            raise ValueError(f"cos_zen_low and cos_zen_high need to be factors of the binning of 0.05: {cos_zen_low} {cos_zen_high}")
+        return aeff_band[aeff_band["aeff [m^2]"] > 0]
 
-        if cos_zen_low > cos_zen_high:
-            raise ValueError(f"cos_zen_high needs to be higher than cos_zen_low: {cos_zen_low} {cos_zen_high}")
+    def coszen_edge_index(self, cos_zen):
+        """
+        Find the index of the cos(zen) bin edges matching the given values within the tolerance
 
-        if abs(cos_zen_low) > 1 or abs(cos_zen_high) > 1:
-            raise ValueError(f"cos_zen_low and cos_zen_high need to be within 1 and -1: {cos_zen_low} {cos_zen_high}")
+        Parameters:
+        - cos_zen: values of cos(zen), array
 
-        # how many zenith bands are merged
-        number_zenith_bands = round((cos_zen_high - cos_zen_low) / self.binsize_coszen)
+        Returns:
+        - Integer index into coszen_edges
+        """
+        cos_zen = np.asarray(cos_zen, dtype=float)
 
-        # copy the first zenith band
-        aeff_data = self.effective_area_data
-        aeff_band = aeff_data[
-            (aeff_data["cos(zen) low"] == cos_zen_low)
-            & (aeff_data["cos(zen) high"] == round(cos_zen_low + self.binsize_coszen, 2))
-        ].copy()
-        aeff_band = aeff_band.drop(columns=["cos(zen) low", "cos(zen) center", "cos(zen) high"])
+        if np.any(np.abs(cos_zen) > 1):
+            raise ValueError(f"cos_zen_low and cos_zen_high need to be within 1 and -1: {cos_zen}")
 
-        # iterate over the other zenith bands
-        cos_zen_list = np.linspace(cos_zen_low, cos_zen_high, number_zenith_bands + 1)
+        index = np.clip(np.searchsorted(self.coszen_edges, cos_zen - self.tolerance), 0, len(self.coszen_edges) - 1)
+        if np.any(np.abs(self.coszen_edges[index] - cos_zen) > self.tolerance):
+            raise ValueError(f"cos_zen_low and cos_zen_high need to be factors of the binning of {self.binsize_coszen}: {cos_zen}")
 
-        for i in range(1, len(cos_zen_list) - 1):
-            cos_zen_low_tmp = round(cos_zen_list[i], 2)
-            cos_zen_high_tmp = round(cos_zen_list[i] + self.binsize_coszen, 2)
+        return index
 
-            aeff_band_tmp = aeff_data[(aeff_data["cos(zen) low"] == cos_zen_low_tmp) & (aeff_data["cos(zen) high"] == cos_zen_high_tmp)].copy()
-            aeff_band_tmp = aeff_band_tmp.drop(columns=["cos(zen) low", "cos(zen) center", "cos(zen) high"])
+    def effective_area_bands(self, cos_zen_low, cos_zen_high):
+        """
+        Calculate the effective area averaged over many zenith bands at once from the cumulative sum of the
+        effective area along cos(zen)
 
-            aeff_band_merged = pd.merge(
-                aeff_band,
-                aeff_band_tmp,
-                on=["log10(nu_E [GeV]) low", "log10(nu_E [GeV]) center", "log10(nu_E [GeV]) high"],
-                how="left",
-                suffixes=("_df1", "_df2"),
-            )
-            aeff_band_merged["aeff [m^2]"] = aeff_band_merged["aeff [m^2]_df1"] + aeff_band_merged["aeff [m^2]_df2"]
-            aeff_band_merged = aeff_band_merged.drop(columns=["aeff [m^2]_df1", "aeff [m^2]_df2"])
+        Parameters:
+        - cos_zen_low: low bounds of the cos(zen) bands, array of length n_band
+        - cos_zen_high: high bounds of the cos(zen) bands, array of length n_band
 
-            aeff_band = aeff_band_merged.copy()
+        Returns:
+        - Array with shape (n_band, n_energy) with the band averaged effective area in m^2
+        """
+        index_low = self.coszen_edge_index(np.atleast_1d(cos_zen_low))
+        index_high = self.coszen_edge_index(np.atleast_1d(cos_zen_high))
 
-        aeff_band["aeff [m^2]"] = aeff_band["aeff [m^2]"] / number_zenith_bands
+        if np.any(index_low >= index_high):
+            raise ValueError(f"cos_zen_high needs to be higher than cos_zen_low: {cos_zen_low} {cos_zen_high}")
 
-        return aeff_band[aeff_band["aeff [m^2]"] > 0]
+        number_zenith_bands = index_high - index_low
+        return (self.aeff_cumulative[:, index_high] - self.aeff_cumulative[:, index_low]).T / number_zenith_bands[:, np.newaxis]
 
-    def event_rate(self, flux, sindec, livetime=365.25 * 24 * 60 * 60):
+    @timed("EffectiveArea.event_rate")
+    def event_rate(self, flux, sindec, livetime=365.25 * 24 * 60 * 60, ra=None, t_start=None, t_stop=None):
         """
         Calculate the event rate based on a given flux and position in the sky: sin(dec)
 
         Parameters:
         - flux: PointSourceFlux object (see flux.py)
         - sindec: Source location
-        - livetime: in seconds
+        - livetime: in seconds, for a transient usually the length of the time window
+        - ra: right ascension in degrees, only used with a time window
+        - t_start: start of the time window of a transient source (see effective_area_at_sindec)
+        - t_stop: end of the time window
 
         Returns:
         - Dataframe with the event rate appended to the selected effective area rows
           corresponding to the source sin(dec)
         """
 
-        effective_area_source = self.effective_area_at_sindec(sindec)
+        effective_area_source = self.effective_area_at_sindec(sindec, ra=ra, t_start=t_start, t_stop=t_stop)
 
-        effective_area_source["energy_bin_width"] = np.power(
-            10, effective_area_source["log10(nu_E [GeV]) high"]
-        ) - np.power(10, effective_area_source["log10(nu_E [GeV]) low"])
+        # the rows of effective_area_at_sindec keep their index into the energy bins of the grid
+        effective_area_source["energy_bin_width"] = self.energy_bin_width[effective_area_source.index]
 
         effective_area_source["rate [livetime^-1]"] = (
             effective_area_source["aeff [m^2]"]
@@ -175,4 +233,99 @@ class EffectiveArea:
             * livetime
         )
 
+        count("EffectiveArea.event_rate.rows", len(effective_area_source))
         return effective_area_source
+
+    @timed("EffectiveArea.event_rate_matrix")
+    def event_rate_matrix(self, flux, sindec, livetime=365.25 * 24 * 60 * 60):
+        """
+        Calculate the event rates for many sources at once
+
+        Parameters:
+        - flux: PointSourceFlux object (see flux.py) shared by all sources, or a list with one per source
+        - sindec: Source locations, array of length n_sindec
+        - livetime: in seconds
+
+        Returns:
+        - Array with shape (n_sindec, n_energy) with the event rate per true neutrino energy bin
+          of the effective area binning (see logE_edges)
+        """
+        if isinstance(flux, (list, tuple)):
+            dNdE = np.array([f.dNdE(self.logE_centers) for f in flux])
+        else:
+            dNdE = flux.dNdE(self.logE_centers)
+
+        return self.effective_area_matrix(sindec) * dNdE * self.energy_bin_width * livetime
+
+    kernel_cache_size = 256
+
+    def flux_kernel(self, sindec, livetime=365.25 * 24 * 60 * 60):
+        """
+        Rate per unit flux: the number of events per neutrino per m^2 integrated over each true energy bin.
+        Kernels are cached per set of source locations and livetime.
+
+        Parameters:
+        - sindec: Source locations, array of length n_sindec
+        - livetime: in seconds
+
+        Returns:
+        - Read-only array with shape (n_sindec, n_energy), effective area times livetime in m^2 s
+        """
+        sindec = np.atleast_1d(np.asarray(sindec, dtype=float))
+        key = (tuple(sindec), float(livetime))
+
+        count("EffectiveArea.flux_kernel.hit" if key in self.kernel_cache else "EffectiveArea.flux_kernel.miss")
+        if key not in self.kernel_cache:
+            if len(self.kernel_cache) >= self.kernel_cache_size:
+                self.kernel_cache.pop(next(iter(self.kernel_cache)))
+            kernel = self.effective_area_matrix(sindec) * livetime
+            kernel.setflags(write=False)
+            self.kernel_cache[key] = kernel
+
+        return self.kernel_cache[key]
+
+    def bin_integrated_flux(self, flux):
+        """
+        Integrate a flux over the true energy bins of the effective area
+
+        Parameters:
+        - flux: spectral model (see flux.py) with an integral method, or any object with a dNdE method
+
+        Returns:
+        - Array with shape flux.shape + (n_energy,) with the number of neutrinos per m^2 s per energy bin
+        """
+        if hasattr(flux, "integral"):
+            return flux.integral(self.logE_edges[:-1], self.logE_edges[1:])
+        return integrate_dNdE(flux.dNdE, self.logE_edges[:-1], self.logE_edges[1:])
+
+    def event_rate_kernel(self, flux, sindec, livetime=365.25 * 24 * 60 * 60):
+        """
+        Calculate the event rates per true energy bin for a grid of spectral hypotheses, using bin-integrated fluxes
+
+        Parameters:
+        - flux: spectral model (see flux.py), possibly with arrays of parameters
+        - sindec: Source locations, array of length n_sindec
+        - livetime: in seconds
+
+        Returns:
+        - Array with shape flux.shape + (n_sindec, n_energy) with the event rate per true neutrino energy bin
+        """
+        return self.bin_integrated_flux(flux)[..., np.newaxis, :] * self.flux_kernel(sindec, livetime)
+
+    @timed("EffectiveArea.expected_rates")
+    def expected_rates(self, flux, sindec, livetime=365.25 * 24 * 60 * 60):
+        """
+        Calculate the total event rates for a grid of spectral hypotheses as a single matrix product of the
+        bin-integrated fluxes with the flux kernel
+
+        Parameters:
+        - flux: spectral model (see flux.py), possibly with arrays of parameters
+        - sindec: Source locations, array of length n_sindec
+        - livetime: in seconds
+
+        Returns:
+        - Array with shape flux.shape + (n_sindec,) with the total event rate
+        """
+        integrated = self.bin_integrated_flux(flux)
+        kernel = self.flux_kernel(sindec, livetime)
+        return (integrated.reshape(-1, kernel.shape[1]) @ kernel.T).reshape(integrated.shape[:-1] + (kernel.shape[0],))
@@ -1,6 +1,15 @@
+import logging
+
 import pandas as pd
 import numpy as np
 
+from arca230.coordinates import cap_intersection_area
+from arca230.instrumentation import count, timed
+from arca230.irfcache import load_component
+
+
+logger = logging.getLogger(__name__)
+
 
 class BackgroundComponent:
     """
@@ -9,11 +18,24 @@ class BackgroundComponent:
     and atmospheric neutrinos
     """
 
-    def __init__(self, file_path="../data/bkg_track.csv"):
+    data_table = "background_data"
+    grid_arrays = ("sindec_edges", "logE_edges", "rate_grid")
+
+    def __init__(self, file_path="../data/bkg_track.csv", cache_dir=None):
         self.sindec_binwidth = 0.05
         self.file_path = file_path
+
         self.background_data = None
-        self.load_background_data()
+        self.sindec_edges = None
+        self.logE_edges = None
+        self.rate_grid = None
+        load_component(
+            self, self.data_table, self.grid_arrays, self.load_background_data, self.build_background_grid, cache_dir
+        )
+
+        # rate per solid angle in s^-1 sr^-1, each sin(dec) bin covers 2 pi times its width
+        self.sindec_centers = 0.5 * (self.sindec_edges[1:] + self.sindec_edges[:-1])
+        self.density_grid = self.rate_grid / (2 * np.pi * np.diff(self.sindec_edges))[:, np.newaxis]
 
     def load_background_data(self):
         """
@@ -21,12 +43,177 @@ class BackgroundComponent:
         """
         try:
             self.background_data = pd.read_csv(self.file_path, delimiter=",")
-            print("Background data loaded successfully.")
+            logger.info("Background data loaded successfully.")
         except FileNotFoundError:
             raise RuntimeError(f"File '{self.file_path}' not found.")
         except Exception as e:
             raise RuntimeError(f"An error occurred while loading the data: {e}")
 
+    def build_background_grid(self):
+        """
+        Store the background rate as a dense array with shape (n_sindec, n_energy) in s^-1, together with the
+        sin(dec) and reconstructed energy bin edges
+        """
+        data = self.background_data
+
+        self.sindec_edges = np.union1d(data["sin(dec) low"], data["sin(dec) high"])
+        self.logE_edges = np.union1d(data["log10(reco_E [GeV]) low"], data["log10(reco_E [GeV]) high"])
+
+        index_sindec = np.searchsorted(self.sindec_edges, data["sin(dec) center"].to_numpy()) - 1
+        index_energy = np.searchsorted(self.logE_edges, data["log10(reco_E [GeV]) center"].to_numpy()) - 1
+
+        self.rate_grid = np.zeros((len(self.sindec_edges) - 1, len(self.logE_edges) - 1))
+        self.rate_grid[index_sindec, index_energy] = data["rate [s^-1]"].to_numpy()
+
+    def fraction_in_cone(self, angle_max):
+        """
+        Fraction of the solid angle of a sin(dec) bin covered by a search cone. This assumes that the cone lies
+        within the bin, see cone_event_rate_matrix for the exact integration over neighbouring bins
+
+        Parameters:
+        - angle_max : size of the search cone in degrees, scalar or array
+
+        Returns:
+        - Fraction of the background of the sin(dec) bin within the cone
+        """
+        angle_max = np.asarray(angle_max, dtype=float)
+        return 4 * np.pi * np.power(np.sin(angle_max * np.pi / 180 / 2), 2) / (2 * np.pi * self.sindec_binwidth)
+
+    def sindec_index(self, sindec):
+        """
+        Find the sin(dec) bins of the background for the given source locations. A source at sin(dec) = 1
+        is assigned to the last bin.
+
+        Parameters:
+        - sindec: Source locations, array
+
+        Returns:
+        - Index of the sin(dec) bin
+        """
+        sindec = np.asarray(sindec, dtype=float)
+        if np.any(np.abs(sindec) > 1):
+            raise ValueError(f"abs(sindec) should be < 1 {sindec}")
+
+        return np.clip(np.searchsorted(self.sindec_edges, sindec, side="right") - 1, 0, len(self.sindec_edges) - 2)
+
+    @timed("BackgroundComponent.event_rate_matrix")
+    def event_rate_matrix(self, sindec, angle_max, livetime=365.25 * 24 * 60 * 60):
+        """
+        Calculate the background event rates within the search cones for many source locations at once
+
+        Parameters:
+        - sindec: Source locations, array of length n_sindec
+        - angle_max : sizes of the search cone in degrees, array of length n_cone
+        - livetime: in seconds
+
+        Returns:
+        - Array with shape (n_sindec, n_cone, n_energy) with the event rate per reconstructed energy bin
+        """
+        rates = self.rate_grid[self.sindec_index(np.atleast_1d(sindec))] * livetime
+        return rates[:, np.newaxis, :] * self.fraction_in_cone(np.atleast_1d(angle_max))[:, np.newaxis]
+
+    def rate_density(self, sindec, interpolate=False):
+        """
+        Background rate per solid angle at the given source locations
+
+        Parameters:
+        - sindec: Source locations, array of any shape
+        - interpolate: interpolate linearly in sin(dec) between the bin centers, constant beyond the outermost
+          centers. Otherwise the rate is constant within each sin(dec) bin
+
+        Returns:
+        - Array with shape sindec.shape + (n_energy,) with the rate in s^-1 sr^-1 per reconstructed energy bin
+        """
+        sindec = np.asarray(sindec, dtype=float)
+        if not interpolate:
+            return self.density_grid[self.sindec_index(sindec)]
+
+        if np.any(np.abs(sindec) > 1):
+            raise ValueError(f"abs(sindec) should be < 1 {sindec}")
+
+        position = np.interp(sindec, self.sindec_centers, np.arange(len(self.sindec_centers)))
+        low = np.clip(position.astype(int), 0, len(self.sindec_centers) - 2)
+        t = (position - low)[..., np.newaxis]
+        return (1 - t) * self.density_grid[low] + t * self.density_grid[low + 1]
+
+    @timed("BackgroundComponent.cone_event_rate_matrix")
+    def cone_event_rate_matrix(
+        self, sindec, angle_max, livetime=365.25 * 24 * 60 * 60, interpolate=False, subdivisions=8
+    ):
+        """
+        Calculate the background event rates within search cones by integrating the rate per solid angle over the
+        cone. The solid angle of the cone in each sin(dec) bin follows from the intersection of the cone with the
+        caps above the bin edges (see coordinates.cap_intersection_area), so cones that extend over neighbouring
+        bins or over a pole are exact. For cones within one bin this equals event_rate_matrix.
+
+        Parameters:
+        - sindec: Source locations, array of length n_sindec
+        - angle_max : sizes of the search cone in degrees, at most 90, array of length n_cone
+        - livetime: in seconds
+        - interpolate: interpolate the rate linearly in sin(dec), see rate_density
+        - subdivisions: number of pieces per sin(dec) bin over which the interpolated rate is integrated
+
+        Returns:
+        - Array with shape (n_sindec, n_cone, n_energy) with the event rate per reconstructed energy bin
+        """
+        sindec = np.atleast_1d(np.asarray(sindec, dtype=float))
+        angle_max = np.atleast_1d(np.asarray(angle_max, dtype=float))
+        if np.any(np.abs(sindec) > 1):
+            raise ValueError(f"abs(sindec) should be < 1 {sindec}")
+        if np.any((angle_max <= 0) | (angle_max > 90)):
+            raise ValueError(f"angle_max needs to be within 0 and 90 degrees: {angle_max}")
+
+        # with a constant rate per bin the bin edges are enough for an exact integration
+        pieces = subdivisions if interpolate else 1
+        fraction = np.arange(pieces) / pieces
+        edges = self.sindec_edges[:-1, np.newaxis] + np.diff(self.sindec_edges)[:, np.newaxis] * fraction
+        edges = np.append(edges.ravel(), self.sindec_edges[-1])
+
+        # solid angle of each cone above every edge, the difference is the solid angle within each piece
+        distance = np.arccos(np.clip(sindec, -1, 1))[:, np.newaxis, np.newaxis]
+        radius = np.radians(angle_max)[:, np.newaxis]
+        above = cap_intersection_area(distance, radius, np.arccos(np.clip(edges, -1, 1)))
+        solid_angle = above[..., :-1] - above[..., 1:]
+
+        density = self.rate_density(0.5 * (edges[1:] + edges[:-1]), interpolate)
+        return solid_angle @ density * livetime
+
+    @timed("BackgroundComponent.sky_map")
+    def sky_map(self, sindec, angle_max=None, livetime=365.25 * 24 * 60 * 60, interpolate=False, pixel_area=None):
+        """
+        Calculate the background over the whole sky in one call, for pixel centers of any shape, for example of
+        coordinates.equal_area_grid. The background only depends on the declination, so it is calculated once per
+        distinct sin(dec) of the pixels.
+
+        Parameters:
+        - sindec: sin(dec) of the pixel centers, array of any shape
+        - angle_max: size of the search cone in degrees around each pixel, for scans of the sky. Without cone the
+          events within each pixel are calculated
+        - livetime: in seconds
+        - interpolate: interpolate the rate linearly in sin(dec), see rate_density
+        - pixel_area: solid angle of the pixels in steradian, scalar or array with the shape of sindec. Required
+          without cone
+
+        Returns:
+        - Array with shape sindec.shape + (n_energy,) with the background events per reconstructed energy bin
+        """
+        sindec = np.asarray(sindec, dtype=float)
+        unique, inverse = np.unique(sindec.ravel(), return_inverse=True)
+
+        if angle_max is None:
+            if pixel_area is None:
+                raise ValueError("A sky map without search cone needs the pixel_area")
+            events = self.rate_density(unique, interpolate) * livetime
+            events = events[inverse].reshape(sindec.shape + (-1,))
+            events = events * np.asarray(pixel_area, dtype=float)[..., np.newaxis]
+        else:
+            events = self.cone_event_rate_matrix(unique, [angle_max], livetime, interpolate)[:, 0]
+            events = events[inverse].reshape(sindec.shape + (-1,))
+
+        count("BackgroundComponent.sky_map.pixels", sindec.size)
+        return events
+
+    @timed("BackgroundComponent.event_rate")
     def event_rate(self, sindec, angle_max, livetime=365.25 * 24 * 60 * 60):
         """
         Calculate the background event rate as a function of reconstructed energy
@@ -41,24 +228,19 @@ class BackgroundComponent:
         - Dataframe with the event rate per reconstructed energy
           corresponding to the source sin(dec)
         """
-        try:
-            # Select rows where sindec is within the bounds
-            selected_rows = self.background_data[(self.background_data["sin(dec) low"] <= sindec) & (sindec < self.background_data["sin(dec) high"])].copy()
-
-            if not selected_rows.empty:
-                fraction_in_cone = (
-                    4 * np.pi * np.power(np.sin(angle_max * np.pi / 180 / 2), 2) / (2 * np.pi * self.sindec_binwidth)
-                )
-
-                selected_rows["rate [livetime^-1]"] = selected_rows["rate [s^-1]"] * livetime
-                selected_rows["rate_in_cone [livetime^-1]"] = selected_rows["rate [livetime^-1]"] * fraction_in_cone
-
-                return selected_rows
-            else:
-                print(f"No rows found for the given sindec value {sindec}.")
-                return None
-        except KeyError as e:
-            print(f"Error: {e} not found in the loaded data columns.")
-        except Exception as e:
-            print(f"An error occurred while calculating event rate: {e}")
+        # select the rows of the sin(dec) bin of the source, a source at sin(dec) = 1 belongs to the last bin
+        data = self.background_data
+        low_edge = self.sindec_edges[self.sindec_index(sindec)]
+        selected_rows = data[np.isclose(data["sin(dec) low"].to_numpy(), low_edge)].copy()
+
+        if selected_rows.empty:
+            raise ValueError(f"No rows found for the given sindec value {sindec}.")
+
+        fraction_in_cone = self.fraction_in_cone(angle_max)
+
+        selected_rows["rate [livetime^-1]"] = selected_rows["rate [s^-1]"] * livetime
+        selected_rows["rate_in_cone [livetime^-1]"] = selected_rows["rate [livetime^-1]"] * fraction_in_cone
+
+        count("BackgroundComponent.event_rate.rows", len(selected_rows))
+        return selected_rows
 
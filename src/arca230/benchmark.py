@@ -0,0 +1,631 @@
+import argparse
+import json
+import os
+import pkgutil
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+
+# maximum import time in seconds of a submodule in a fresh interpreter, including its dependencies. Modules that
+# import pandas get the default budget, the modules below only need numpy.
+default_import_budget = 1.0
+import_budgets = {
+    "arca230.benchmark": 0.3,
+    "arca230.coordinates": 0.3,
+    "arca230.flux": 0.3,
+    "arca230.instrumentation": 0.3,
+    "arca230.memo": 0.3,
+    "arca230.utils": 0.3,
+}
+
+# dependencies that should only be imported on first use
+deferred_modules = ("astropy", "scipy")
+
+# point of the reference pipeline used for the golden outputs
+golden_point = {"sindec": 0.475, "cone": 1.0, "gamma": 2.0, "norm": 5e-5, "livetime": 365.25 * 24 * 60 * 60}
+
+# outputs of the baseline implementation at golden_point per channel, with the relative tolerance of the check. The
+# tolerances cover two documented changes of the algorithms: the analytic daily visibility replaced the astropy
+# sampling at a fixed epoch (rates ~0.2%), and the trapezoidal containment tables replaced the 500-step Riemann sum,
+# which overestimates the fraction within the 1 degree cone by 1.6% for showers. discovery_nobs is computed in the
+# steps of 0.1 of the baseline scan. The background and mean_limit are unchanged.
+golden_values = {
+    "track": {
+        "rate [livetime^-1]": (5.660006346621482, 3e-3),
+        "signal_in_cone [livetime^-1]": (4.984445728876256, 3e-3),
+        "background_in_cone [livetime^-1]": (5.904394226015313, 1e-9),
+        "mean_limit_nobs": (4.4493926898741325, 1e-9),
+        "discovery_nobs": (8.8, 1e-9),
+    },
+    "shower": {
+        "rate [livetime^-1]": (0.7500915774611674, 3e-3),
+        "signal_in_cone [livetime^-1]": (0.11461529905527378, 2e-2),
+        "background_in_cone [livetime^-1]": (0.0314992952317664, 1e-9),
+        "mean_limit_nobs": (2.321003185587866, 1e-9),
+        "discovery_nobs": (1.7, 1e-9),
+    },
+}
+
+
+def measure_import(module, repeat=3):
+    """
+    Measures the import time of a module in fresh interpreters with python -X importtime
+
+    Parameters:
+    - module: name of the module
+    - repeat: number of interpreters started, the fastest import is reported
+
+    Returns:
+    - Tuple with the import time in seconds and the deferred modules that were imported anyway
+    """
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(path for path in sys.path if path))
+    code = f"import sys, {module}; print(' '.join(m for m in {deferred_modules!r} if m in sys.modules))"
+
+    best = None
+    for _ in range(repeat):
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", code], env=env, capture_output=True, text=True, check=True
+        )
+        # the last line of the report is the module itself, the second column its cumulative time in us
+        cumulative = int(result.stderr.strip().splitlines()[-1].split("|")[1]) * 1e-6
+        best = cumulative if best is None else min(best, cumulative)
+
+    return best, result.stdout.split()
+
+
+def package_budgets():
+    """
+    Lists every submodule of the package with its import budget, so that new modules are covered automatically
+
+    Returns:
+    - Dictionary with module names and the maximum import time in seconds
+    """
+    modules = pkgutil.iter_modules([os.path.dirname(os.path.abspath(__file__))], prefix="arca230.")
+    return {name: import_budgets.get(name, default_import_budget) for name in sorted(module.name for module in modules)}
+
+
+def check_import_budgets(budgets=None, repeat=3):
+    """
+    Measures the import time of every submodule and compares it with its budget. Raises a RuntimeError when a
+    budget is exceeded or when a deferred dependency is imported.
+
+    Parameters:
+    - budgets: dictionary with module names and the maximum import time in seconds, defaults to every submodule
+    - repeat: number of interpreters started per module
+
+    Returns:
+    - Dictionary with the module names and the measured import time in seconds
+    """
+    budgets = package_budgets() if budgets is None else budgets
+
+    timings = {}
+    failures = []
+    for module, budget in budgets.items():
+        timings[module], imported = measure_import(module, repeat)
+        if timings[module] > budget:
+            failures.append(f"{module} imports in {timings[module]:.3f} s, budget {budget:.3f} s")
+        if imported:
+            failures.append(f"{module} imports {', '.join(imported)} at import time")
+
+    if failures:
+        raise RuntimeError("Import budget exceeded:\n" + "\n".join(failures))
+
+    return timings
+
+
+def time_call(function, number=1, repeat=3, setup=None):
+    """
+    Measures the time per call of a function, taking the fastest of several repetitions
+
+    Parameters:
+    - function: function without arguments
+    - number: number of calls per repetition
+    - repeat: number of repetitions
+    - setup: optional function called before every repetition, for example to clear caches
+
+    Returns:
+    - Time per call in seconds
+    """
+    best = None
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        for _ in range(number):
+            function()
+        elapsed = (time.perf_counter() - start) / number
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def reference_pipeline(irfs, sindec, cone, gamma, norm, livetime):
+    """
+    The point source pipeline through the public dataframe interface of every stage
+
+    Parameters:
+    - irfs: tuple with the EffectiveArea, PointSpreadFunction, EnergyResponse and BackgroundComponent
+    - sindec: Source location
+    - cone: size of the search cone in degrees
+    - gamma: spectral index of the power law flux
+    - norm: normalisation of the power law flux
+    - livetime: in seconds
+
+    Returns:
+    - Dictionary with the outputs compared with golden_values
+    """
+    from arca230.flux import PointSourceFlux
+    from arca230.utils import mean_limit, nobs_disc
+
+    aeff, psf, eres, bkg = irfs
+
+    rates = aeff.event_rate(PointSourceFlux(gamma, norm), sindec, livetime)
+    reconstructed = eres.reconstruct_event_table(psf.event_table_within_cone(rates, cone))
+    background = bkg.event_rate(sindec, cone, livetime)["rate_in_cone [livetime^-1]"].sum()
+
+    return {
+        "rate [livetime^-1]": rates["rate [livetime^-1]"].sum(),
+        "signal_in_cone [livetime^-1]": reconstructed["rate_in_cone [livetime^-1]"].sum(),
+        "background_in_cone [livetime^-1]": background,
+        "mean_limit_nobs": mean_limit(background),
+        "discovery_nobs": nobs_disc(background, 0.0026, 0.5, tolerance=0.1),
+    }
+
+
+def reference_mean_limit(mu0, confidence_level=0.90):
+    """
+    Mean limit as a sum over the Poisson probabilities of the observed events, one term at a time
+    """
+    from scipy.stats import poisson
+
+    from arca230.utils import limit
+
+    kmax = int(max(20, mu0 + 5 * np.sqrt(mu0)))
+    return sum(poisson.pmf(k, mu0) * limit(k, mu0, confidence_level) for k in range(kmax))
+
+
+def reference_nobs_disc(mu0, alpha, beta):
+    """
+    Least detectable signal by scanning the observed events and the signal in steps of 0.1
+    """
+    from scipy.stats import poisson
+
+    n_crit = 1
+    while 1 - poisson.cdf(n_crit - 1, mu=mu0) >= alpha:
+        n_crit += 1
+
+    mu_lds = 0.0
+    cont = 0
+    while 1 - poisson.cdf(n_crit - 1, mu=mu0 + mu_lds) <= 1 - beta:
+        cont += 1
+        mu_lds = cont * 0.1
+    return mu_lds
+
+
+def reference_containment(psf, logE, angle_max, nsteps=20000):
+    """
+    Fraction of events within angle_max from the rows of the point spread function table, interpolated linearly in
+    log10(psi) like the original interpolators and integrated over 2 pi sin(psi) dpsi with the trapezoidal rule
+    """
+    from scipy.integrate import trapezoid
+
+    data = psf.psf_data
+    rows = data[(data["log10(nu_E [GeV]) low"] <= logE) & (data["log10(nu_E [GeV]) high"] > logE)]
+    rows = rows.sort_values("log10(psi [degrees])")
+
+    def integral(log_psi_max):
+        log_psi = np.linspace(rows["log10(psi [degrees])"].iloc[0], log_psi_max, nsteps + 1)
+        psi = np.radians(np.power(10, log_psi))
+        dp_domega = np.interp(log_psi, rows["log10(psi [degrees])"], rows["dP/dOmega"])
+        return trapezoid(dp_domega * 2 * np.pi * np.sin(psi), psi)
+
+    total = integral(rows["log10(psi [degrees])"].iloc[-1])
+    return integral(np.log10(angle_max)) / total if total > 0 else 0
+
+
+def reference_effective_area(aeff, sindec, nsamples=100000):
+    """
+    Effective area at sindec from the rows of the effective area table, weighted with the fraction of uniformly
+    spaced hour angles within the zenith band of each row
+    """
+    from arca230.coordinates import detector_latitude
+
+    hour_angle = np.linspace(0, 2 * np.pi, nsamples, endpoint=False)
+    coszen = np.sin(detector_latitude) * sindec + np.cos(detector_latitude) * np.sqrt(1 - sindec**2) * np.cos(hour_angle)
+
+    data = aeff.effective_area_data
+    weights = [np.mean((coszen >= row["cos(zen) low"]) & (coszen < row["cos(zen) high"])) for _, row in data.iterrows()]
+    return (data["aeff [m^2]"] * weights).groupby(data["log10(nu_E [GeV]) center"]).sum()
+
+
+def reference_fraction_between_energy(eres, logE, low, high):
+    """
+    Fraction of events between reconstructed energies by looping over the rows of the energy response
+    """
+    data = eres.eresponse_data
+    rows = data[(data["log10(nu_E [GeV]) low"] <= logE) & (data["log10(nu_E [GeV]) high"] > logE)]
+
+    weight = 0
+    norm = 0
+    for _, row in rows.iterrows():
+        overlap = max(0, min(row["log10(reco_E [GeV]) high"], high) - max(row["log10(reco_E [GeV]) low"], low))
+        norm += row["dP/dlog10(nu_E [GeV])"]
+        weight += row["dP/dlog10(nu_E [GeV])"] * overlap / (row["log10(reco_E [GeV]) high"] - row["log10(reco_E [GeV]) low"])
+
+    return weight / norm if norm > 0 else 0
+
+
+def regression_checks(irfs, channel, nsamples=2000):
+    """
+    Compares every stage with its reference implementation and the pipeline with the golden outputs
+
+    Parameters:
+    - irfs: tuple with the EffectiveArea, PointSpreadFunction, EnergyResponse and BackgroundComponent
+    - channel: 'track' or 'shower', selects the golden outputs
+    - nsamples: number of samples of the astropy visibility
+
+    Returns:
+    - List of tuples with the name of the check, the largest deviation and the tolerance
+    """
+    import pandas as pd
+
+    from arca230.coordinates import (
+        equal_area_grid,
+        fraction_at_zenith,
+        sample_coszen_window,
+        transient_visibility_matrix,
+        transient_visibility_tolerance,
+        visibility_tolerance,
+    )
+    from arca230.utils import mean_limit, nobs_disc
+
+    aeff, psf, eres, bkg = irfs
+    checks = []
+
+    # pipeline outputs with relative tolerances
+    outputs = reference_pipeline(irfs, **golden_point)
+    for name, (value, rtol) in golden_values[channel].items():
+        checks.append((f"golden {name}", abs(outputs[name] / value - 1), rtol))
+
+    # visibility: analytic against astropy sampling, per 0.05 wide cos(zen) band
+    bands = pd.DataFrame({"cos(zen) low": aeff.coszen_edges[:-1], "cos(zen) high": aeff.coszen_edges[1:]})
+    deviation = 0
+    for sindec in (-0.9, -0.3, 0.0, 0.475, 0.9):
+        analytic = fraction_at_zenith(bands.copy(), sindec)["weight"]
+        sampled = fraction_at_zenith(bands.copy(), sindec, nsamples, method="astropy")["weight"]
+        deviation = max(deviation, np.max(np.abs(analytic - sampled)))
+    checks.append(("fraction_at_zenith vs astropy", deviation, visibility_tolerance))
+
+    # transient visibility: analytic time windows against astropy at times spread over the windows
+    windows = [(35.0, -0.6, 60310.0, 60310.05), (200.0, 0.475, 60500.3, 60501.3), (310.0, 0.1, 61000.7, 61003.4)]
+    low, high = bands["cos(zen) low"].to_numpy(), bands["cos(zen) high"].to_numpy()
+    deviation = 0
+    for ra, sindec, t_start, t_stop in windows:
+        analytic = transient_visibility_matrix(ra, sindec, t_start, t_stop, low, high)
+        sampled = sample_coszen_window(ra, sindec, t_start, t_stop, nsamples)[:, np.newaxis]
+        sampled = np.mean((sampled >= low) & (sampled < high), axis=0)
+        deviation = max(deviation, np.max(np.abs(analytic[0] - sampled)))
+    checks.append(("transient_visibility_matrix vs astropy", deviation, transient_visibility_tolerance))
+
+    # effective area: the dense visibility weighted grid against the rows of the table and sampled hour angles
+    deviation = 0
+    for sindec in (-0.9, -0.3, 0.0, 0.475, 0.9):
+        fast = aeff.effective_area_matrix(sindec)[0]
+        reference = reference_effective_area(aeff, sindec).to_numpy()
+        deviation = max(deviation, np.max(np.abs(fast - reference)) / max(reference.max(), np.finfo(float).tiny))
+    checks.append(("effective_area_matrix vs hour angle sampling", deviation, 1e-3))
+
+    # point spread function: containment against a fine integration of the table rows over the sphere
+    deviation = 0
+    for logE in psf.logE_edges[:-1] + 0.5 * np.diff(psf.logE_edges):
+        for cone in (0.1, 1.0, 10.0):
+            reference = reference_containment(psf, logE, cone)
+            deviation = max(deviation, abs(psf.fraction_below_angle(logE, cone) - reference))
+    checks.append(("event_table_within_cone vs table integration", deviation, 1e-4))
+
+    # the event table keeps float columns, without fill_value the containment must not become an object array
+    from arca230.flux import PointSourceFlux
+
+    rates = aeff.event_rate(PointSourceFlux(golden_point["gamma"], golden_point["norm"]), golden_point["sindec"])
+    table = psf.event_table_within_cone(rates, golden_point["cone"])
+    dtypes = [table[column].dtype for column in ("fraction_in_cone", "rate_in_cone [livetime^-1]")]
+    dtypes.append(psf.containment_fraction(psf.logE_edges[:-1] + 0.5 * np.diff(psf.logE_edges), 1.0).dtype)
+    checks.append(("event_table_within_cone float64 columns", sum(dtype != np.float64 for dtype in dtypes), 0))
+
+    # binary cache: the table columns read back from the cache are views of the memory mapped files
+    import tempfile
+
+    from arca230.psf import PointSpreadFunction
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        PointSpreadFunction(file_path=psf.file_path, cache_dir=cache_dir)
+        table = PointSpreadFunction(file_path=psf.file_path, cache_dir=cache_dir).psf_data
+        copied = 0
+        for column in table.columns:
+            values = mapped = table[column].to_numpy()
+            while mapped is not None and not isinstance(mapped, np.memmap):
+                mapped = mapped.base
+            copied += mapped is None or not np.shares_memory(values, mapped)
+        del table, values, mapped
+    checks.append(("irfcache.read_cache zero-copy columns", copied, 0))
+
+    # energy response: migration matrix against the loop over the rows of the energy response
+    deviation = 0
+    for logE in aeff.logE_centers:
+        for low, high in ((1.0, 8.0), (2.0, 4.5), (3.3, 3.6), (5.0, 6.2)):
+            reference = reference_fraction_between_energy(eres, logE, low, high)
+            deviation = max(deviation, abs(eres.fraction_between_energy(logE, low, high) - reference))
+    checks.append(("reconstruct_event_table vs row loop", deviation, 1e-12))
+
+    # background: the dense grid against the selected rows of the background table
+    deviation = 0
+    for sindec in np.linspace(-0.99, 0.99, 67):
+        data = bkg.background_data
+        rows = data[(data["sin(dec) low"] <= sindec) & (sindec < data["sin(dec) high"])]
+        reference = rows["rate [s^-1]"].sum() * golden_point["livetime"] * bkg.fraction_in_cone(1.0)
+        fast = bkg.event_rate_matrix(sindec, [1.0], golden_point["livetime"]).sum()
+        deviation = max(deviation, abs(fast / reference - 1) if reference > 0 else fast)
+    checks.append(("BackgroundComponent.event_rate vs row selection", deviation, 1e-12))
+
+    # background maps: exact cone integration against the bin approximation for cones within a bin, and the
+    # events of all pixels of an equal area map against the total rate
+    centers, cones = bkg.sindec_centers, [0.1, 0.5]
+    approximate = bkg.event_rate_matrix(centers, cones, golden_point["livetime"])
+    exact = bkg.cone_event_rate_matrix(centers, cones, golden_point["livetime"])
+    deviation = np.max(np.abs(exact - approximate) / np.maximum(approximate, np.max(approximate) * 1e-12))
+    checks.append(("cone_event_rate_matrix vs event_rate_matrix", deviation, 1e-9))
+
+    pixel_sindec, _, pixel_area = equal_area_grid(8 * len(centers), 16)
+    total = bkg.sky_map(pixel_sindec, livetime=golden_point["livetime"], pixel_area=pixel_area).sum()
+    deviation = abs(total / (bkg.rate_grid.sum() * golden_point["livetime"]) - 1)
+    checks.append(("sky_map total vs rate grid", deviation, 1e-12))
+
+    # statistics: vectorised against the term by term sums and scans
+    mu0 = np.concatenate([np.logspace(-3, 1, 20), np.linspace(12, 200, 10)])
+    reference = np.array([reference_mean_limit(mu) for mu in mu0])
+    checks.append(("mean_limit vs poisson sum", np.max(np.abs(mean_limit(mu0) / reference - 1)), 1e-9))
+
+    reference = np.array([reference_nobs_disc(mu, 0.0026, 0.5) for mu in mu0])
+    deviation = np.max(np.abs(nobs_disc(mu0, 0.0026, 0.5, tolerance=0.1) - reference))
+    checks.append(("nobs_disc vs 0.1 scan", deviation, 1e-9))
+
+    return checks
+
+
+def joint_regression_checks(bundles):
+    """
+    Compares the combined analysis of several channels with the evaluation of all cone combinations, both for the
+    search of all combinations (exact) and for the default search along the cone path, and, for a single channel
+    with a fixed cone, with sweep.sensitivity_table
+
+    Parameters:
+    - bundles: list of IRFBundles
+
+    Returns:
+    - List of tuples with the name of the check, the largest deviation and the tolerance
+    """
+    from arca230.combination import DiscoverySteps, channel_expectations, combine_channels, joint_sensitivity_table
+    from arca230.sweep import sensitivity_table
+    from arca230.utils import mean_limit, nobs_disc
+
+    sindec = np.linspace(-0.99, 0.99, 67)
+    checks = []
+    for gamma, cones in ((golden_point["gamma"], np.logspace(-1, 1, 21)), (3.0, np.logspace(-1, 1, 41))):
+        signal, background = combine_channels(channel_expectations(bundles, sindec, cones, gamma))
+        discovery_nobs = nobs_disc(background, 0.0026, 0.5)
+        if gamma == golden_point["gamma"]:
+            steps = DiscoverySteps(np.max(background))
+            deviation = np.max(np.abs(steps.nobs(background) - discovery_nobs))
+            checks.append(("DiscoverySteps.nobs vs nobs_disc", deviation, 1e-12))
+
+        for objective, column, statistic in (
+            ("discovery", "discovery_flux [GeV-1 s-1 m-2]", discovery_nobs),
+            ("limit", "mean_limit_flux [GeV-1 s-1 m-2]", mean_limit(background)),
+        ):
+            with np.errstate(divide="ignore"):
+                reference = np.min(np.where(signal > 0, statistic / signal, np.inf), axis=1)
+            for exact in (True, False):
+                table = joint_sensitivity_table(bundles, sindec, cones, gamma, objective=objective, exact=exact)
+                deviation = np.max(np.abs(table[column].to_numpy() / reference - 1))
+                search = "exact" if exact else "path"
+                name = f"joint {objective} {search} vs all cone combinations, gamma {gamma:g}"
+                checks.append((name, deviation, 1e-12))
+
+    joint = joint_sensitivity_table(bundles[:1], sindec, golden_point["cone"], golden_point["gamma"])
+    single = sensitivity_table(bundles[0], sindec, golden_point["cone"], golden_point["gamma"])
+    deviation = 0.0
+    for column in ("signal [norm^-1]", "background", "mean_limit_nobs", "discovery_nobs"):
+        reference = single[column].to_numpy()
+        difference = np.abs(joint[column].to_numpy() - reference)
+        deviation = max(deviation, np.max(difference / np.maximum(reference, np.max(reference) * 1e-12)))
+    checks.append(("joint single channel vs sensitivity_table", deviation, 1e-12))
+
+    return checks
+
+
+def check_regressions(channels=("track", "shower"), data_dir=None, nsamples=2000):
+    """
+    Runs the regression checks for the channels. Raises a RuntimeError when a deviation exceeds its tolerance.
+
+    Parameters:
+    - channels: list of channels, 'track' and/or 'shower'
+    - data_dir: directory with the csv files, defaults to the data directory of the repository
+    - nsamples: number of samples of the astropy visibility
+
+    Returns:
+    - Dictionary with the channels and their list of checks (see regression_checks)
+    """
+    from arca230.sweep import load_channel
+
+    results = {}
+    for channel in channels:
+        results[channel] = regression_checks(load_channel(channel, data_dir), channel, nsamples)
+    if len(channels) > 1:
+        results["+".join(channels)] = joint_regression_checks([load_channel(channel, data_dir) for channel in channels])
+
+    failures = []
+    for channel, checks in results.items():
+        for name, deviation, tolerance in checks:
+            if not deviation <= tolerance:
+                failures.append(f"{channel}: {name} deviates by {deviation:.3g}, tolerance {tolerance:.3g}")
+
+    if failures:
+        raise RuntimeError("Regression check failed:\n" + "\n".join(failures))
+
+    return results
+
+
+def benchmark_stages(channel="track", data_dir=None, repeat=3):
+    """
+    Measures the time per call of every stage of the pipeline at realistic sizes
+
+    Parameters:
+    - channel: 'track' or 'shower'
+    - data_dir: directory with the csv files, defaults to the data directory of the repository
+    - repeat: number of repetitions per measurement
+
+    Returns:
+    - List of tuples with the stage, a description of the size and the time per call in seconds
+    """
+    import pandas as pd
+
+    from arca230 import memo, utils
+    from arca230.bundle import IRFBundle
+    from arca230.coordinates import fraction_at_zenith
+    from arca230.flux import PointSourceFlux
+    from arca230.sweep import expected_events
+
+    point = golden_point
+    timings = []
+
+    # loading always parses the csv files, the binary cache is disabled explicitly
+    cache_dir = os.environ.pop("ARCA230_CACHE_DIR", None)
+    try:
+        for name, jobs in (("csv loading", 1), ("csv loading on 4 threads", 4)):
+            seconds = time_call(lambda: IRFBundle.load(channel, data_dir, jobs=jobs), repeat=repeat)
+            timings.append((name, "4 files", seconds))
+        irfs = IRFBundle.load(channel, data_dir)
+    finally:
+        if cache_dir is not None:
+            os.environ["ARCA230_CACHE_DIR"] = cache_dir
+    aeff, psf, eres, bkg = irfs
+
+    flux = PointSourceFlux(point["gamma"], point["norm"])
+    rates = aeff.event_rate(flux, point["sindec"], point["livetime"])
+    in_cone = psf.event_table_within_cone(rates, point["cone"])
+    bands = pd.DataFrame({"cos(zen) low": aeff.coszen_edges[:-1], "cos(zen) high": aeff.coszen_edges[1:]})
+    mu0 = np.linspace(0.01, 100, 10000)
+
+    stages = [
+        ("effective_area_at_sindec", "1 sindec", lambda: aeff.effective_area_at_sindec(point["sindec"]), None),
+        ("effective_area_zenith_band", "1 band", lambda: aeff.effective_area_zenith_band(-0.5, 0.5), None),
+        ("fraction_at_zenith", f"{len(bands)} bands", lambda: fraction_at_zenith(bands.copy(), point["sindec"]), None),
+        ("event_table_within_cone", f"{len(rates)} rows", lambda: psf.event_table_within_cone(rates, point["cone"]), None),
+        ("reconstruct_event_table", f"{len(in_cone)} rows", lambda: eres.reconstruct_event_table(in_cone), None),
+        ("BackgroundComponent.event_rate", "1 sindec", lambda: bkg.event_rate(point["sindec"], point["cone"]), None),
+        ("mean_limit", f"{len(mu0)} values", lambda: utils.mean_limit(mu0), utils.clear_caches),
+        ("nobs_disc", f"{len(mu0)} values", lambda: utils.nobs_disc(mu0, 0.0026, 0.5), utils.clear_caches),
+        (
+            "expected_events",
+            "1000 sindec x 10 cones",
+            lambda: expected_events(irfs, np.linspace(-0.99, 0.99, 1000), np.logspace(-1, 1, 10), point["gamma"]),
+            None,
+        ),
+    ]
+
+    # setup runs before each repetition and the on-disk memo is off, so memoised results do not hide the cost of the
+    # first call
+    with memo.disabled():
+        for stage, size, function, setup in stages:
+            timings.append((stage, size, time_call(function, repeat=repeat, setup=setup)))
+
+    return timings
+
+
+def benchmark_joint(channels=("track", "shower"), data_dir=None, repeat=3):
+    """
+    Measures the combined analysis of the channels with jointly optimised cones over the declination grid, with
+    the default and the exact search, against the cone optimisation of every single channel
+
+    Parameters:
+    - channels: list of channels
+    - data_dir: directory with the csv files, defaults to the data directory of the repository
+    - repeat: number of repetitions per measurement
+
+    Returns:
+    - List of tuples with the stage, a description of the size and the time per call in seconds
+    """
+    from arca230 import utils
+    from arca230.combination import joint_sensitivity_table
+    from arca230.sweep import load_channel
+
+    bundles = [load_channel(channel, data_dir) for channel in channels]
+    sindec = np.linspace(-0.99, 0.99, 199)
+    cones = np.logspace(-1, 1, 41)
+
+    timings = []
+    for bundle in bundles:
+        seconds = time_call(
+            lambda: joint_sensitivity_table([bundle], sindec, cones), repeat=repeat, setup=utils.clear_caches
+        )
+        timings.append((f"optimised cone {bundle.channel}", f"{len(sindec)} sindec x {len(cones)} cones", seconds))
+
+    seconds = time_call(
+        lambda: joint_sensitivity_table(bundles, sindec, cones), repeat=repeat, setup=utils.clear_caches
+    )
+    size = f"{len(sindec)} sindec x {len(cones)}^{len(bundles)} cones"
+    timings.append((f"optimised cones {'+'.join(channels)}", size, seconds))
+
+    seconds = time_call(
+        lambda: joint_sensitivity_table(bundles, sindec, cones, exact=True), repeat=repeat, setup=utils.clear_caches
+    )
+    timings.append((f"optimised cones {'+'.join(channels)} exact", size, seconds))
+
+    return timings
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks and regression checks of the arca230 package")
+    parser.add_argument("--repeat", type=int, default=3, help="number of repetitions per measurement")
+    parser.add_argument("--channel", action="append", choices=["track", "shower"], help="channels, default both")
+    parser.add_argument("--skip-imports", action="store_true", help="skip the import time budgets")
+    parser.add_argument("--skip-regression", action="store_true", help="skip the regression checks")
+    parser.add_argument("--json", help="write the timings to this json file, to compare runs")
+    args = parser.parse_args()
+
+    channels = args.channel or ["track", "shower"]
+    report = {"imports": {}, "stages": {}}
+
+    if not args.skip_imports:
+        print("Import times")
+        budgets = package_budgets()
+        for module, seconds in check_import_budgets(budgets, repeat=args.repeat).items():
+            report["imports"][module] = seconds
+            print(f"  {module:<40} {1000 * seconds:10.3f} ms   (budget {1000 * budgets[module]:.0f} ms)")
+
+    for channel in channels:
+        print(f"Stage timings {channel}")
+        report["stages"][channel] = {}
+        for stage, size, seconds in benchmark_stages(channel, repeat=args.repeat):
+            report["stages"][channel][stage] = seconds
+            print(f"  {stage:<40} {1000 * seconds:10.3f} ms   ({size})")
+
+    if len(channels) > 1:
+        joint = "+".join(channels)
+        print(f"Stage timings {joint}")
+        report["stages"][joint] = {}
+        for stage, size, seconds in benchmark_joint(channels, repeat=args.repeat):
+            report["stages"][joint][stage] = seconds
+            print(f"  {stage:<40} {1000 * seconds:10.3f} ms   ({size})")
+
+    if not args.skip_regression:
+        for channel, checks in check_regressions(channels).items():
+            print(f"Regression checks {channel}")
+            for name, deviation, tolerance in checks:
+                print(f"  {name:<55} {deviation:10.3g}   (tolerance {tolerance:.3g})")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
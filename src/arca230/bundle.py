@@ -0,0 +1,261 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from arca230.aeff import EffectiveArea
+from arca230.background import BackgroundComponent
+from arca230.energyresponse import EnergyResponse
+from arca230.instrumentation import count, timed
+from arca230.psf import PointSpreadFunction
+
+
+logger = logging.getLogger(__name__)
+
+livetime_1yr = 365.25 * 24 * 60 * 60  # [s]
+
+channel_flavors = {"track": "numu", "shower": "nue"}
+
+# bundles loaded in this process, (channel, data directory, cache directory) -> IRFBundle
+_bundles = {}
+
+
+def data_file_names(channel):
+    """
+    Names of the csv files of the four instrument response functions of a channel
+
+    Parameters:
+    - channel: 'track' or 'shower'
+
+    Returns:
+    - Dictionary with the file names of 'aeff', 'psf', 'eres' and 'bkg'
+    """
+    if channel not in channel_flavors:
+        raise ValueError(f"Unknown channel {channel}, use 'track' or 'shower'")
+
+    flavor = channel_flavors[channel]
+    return {
+        "aeff": f"aeff_coszen_all{flavor}CC_{channel}.csv",
+        "psf": f"psf_{flavor}CC_{channel}.csv",
+        "eres": f"energyresponse_{flavor}CC_{channel}.csv",
+        "bkg": f"bkg_{channel}.csv",
+    }
+
+
+def find_data_dir(channel, data_dir=None):
+    """
+    Locate the directory with the csv files of a channel, independent of the working directory. The candidates
+    are, in this order: the given directory, the environment variable ARCA230_DATA_DIR, the data directory of the
+    repository, and the directories 'data' and '../data' relative to the working directory.
+
+    Parameters:
+    - channel: 'track' or 'shower'
+    - data_dir: directory with the csv files, optional
+
+    Returns:
+    - Absolute path of the first candidate that contains all files of the channel
+    """
+    file_names = data_file_names(channel).values()
+
+    if data_dir is not None:
+        candidates = [data_dir]
+    else:
+        candidates = [
+            os.environ.get("ARCA230_DATA_DIR"),
+            os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "data"),
+            os.path.join(os.getcwd(), "data"),
+            os.path.join(os.getcwd(), "..", "data"),
+        ]
+
+    for candidate in candidates:
+        if candidate and all(os.path.isfile(os.path.join(candidate, name)) for name in file_names):
+            return os.path.realpath(candidate)
+
+    searched = ", ".join(os.path.abspath(c) for c in candidates if c)
+    raise RuntimeError(f"The {channel} csv files were not found, searched: {searched}")
+
+
+def covers(edges, reference, tolerance=1e-5):
+    """
+    Check that a binning covers the full range of the reference edges
+    """
+    return bool(edges[0] <= reference[0] + tolerance and edges[-1] >= reference[-1] - tolerance)
+
+
+def aligned_edges(edges, reference, tolerance=1e-5):
+    """
+    Check that all edges within the range of the reference edges are also reference edges, such that no bin of
+    one binning straddles a bin edge of the other
+    """
+    inside = edges[(edges > reference[0] + tolerance) & (edges < reference[-1] - tolerance)]
+    return bool(np.all(np.min(np.abs(inside[:, np.newaxis] - reference), axis=1, initial=np.inf) < tolerance))
+
+
+class IRFBundle:
+    """
+    The four instrument response functions of one channel, loaded together. The bundle unpacks and indexes like
+    the tuple (EffectiveArea, PointSpreadFunction, EnergyResponse, BackgroundComponent), so it can be passed to
+    every function that takes irfs.
+    """
+
+    def __init__(self, channel, aeff, psf, eres, bkg, data_dir=None):
+        self.channel = channel
+        self.data_dir = data_dir
+        self.aeff = aeff
+        self.psf = psf
+        self.eres = eres
+        self.bkg = bkg
+
+    def __iter__(self):
+        return iter((self.aeff, self.psf, self.eres, self.bkg))
+
+    def __len__(self):
+        return 4
+
+    def __getitem__(self, index):
+        return (self.aeff, self.psf, self.eres, self.bkg)[index]
+
+    def __repr__(self):
+        return f"IRFBundle(channel={self.channel!r}, data_dir={self.data_dir!r})"
+
+    @classmethod
+    @timed("IRFBundle.load")
+    def load(cls, channel, data_dir=None, cache_dir=None, jobs=4, validate=True):
+        """
+        Load the four instrument response functions of a channel concurrently on a thread pool. Parsing the csv
+        files and reading the binary cache release the GIL for most of the time.
+
+        Parameters:
+        - channel: 'track' or 'shower'
+        - data_dir: directory with the csv files, located with find_data_dir when not given
+        - cache_dir: directory of the binary cache (see irfcache.py)
+        - jobs: number of threads, with jobs=1 the files are loaded one after another
+        - validate: check the consistency of the binnings (see validate)
+
+        Returns:
+        - IRFBundle
+        """
+        data_dir = find_data_dir(channel, data_dir)
+        paths = {name: os.path.join(data_dir, file_name) for name, file_name in data_file_names(channel).items()}
+        classes = {
+            "aeff": EffectiveArea,
+            "psf": PointSpreadFunction,
+            "eres": EnergyResponse,
+            "bkg": BackgroundComponent,
+        }
+
+        if jobs == 1:
+            components = {name: classes[name](file_path=paths[name], cache_dir=cache_dir) for name in classes}
+        else:
+            with ThreadPoolExecutor(max_workers=jobs) as pool:
+                futures = {
+                    name: pool.submit(component, file_path=paths[name], cache_dir=cache_dir)
+                    for name, component in classes.items()
+                }
+                components = {name: future.result() for name, future in futures.items()}
+
+        bundle = cls(channel, data_dir=data_dir, **components)
+        if validate:
+            bundle.validate()
+
+        logger.info("Loaded the %s IRFs from %s", channel, data_dir)
+        return bundle
+
+    def validate(self):
+        """
+        Check that the binnings of the four components fit together: the true energy bins of the point spread
+        function and the energy response do not straddle the bins of the effective area, the energy response
+        covers all true energies of the effective area, and the reconstructed energy bins of the energy response
+        and the background are identical. True energies without point spread function produce no events, this is
+        only logged.
+        """
+        aeff_edges = self.aeff.logE_edges
+        channel = self.channel
+
+        if not covers(self.eres.true_logE_edges, aeff_edges):
+            raise ValueError(f"The energy response of the {channel} channel does not cover the effective area energies")
+
+        true_edges = {"point spread function": self.psf.logE_edges, "energy response": self.eres.true_logE_edges}
+        for name, edges in true_edges.items():
+            if not aligned_edges(edges, aeff_edges) or not aligned_edges(aeff_edges, edges):
+                raise ValueError(f"The true energy bins of the {name} and effective area of {channel} differ")
+
+        if not covers(self.psf.logE_edges, aeff_edges):
+            logger.info(
+                "The point spread function of the %s channel only covers true energies from %s to %s",
+                channel,
+                self.psf.logE_edges[0],
+                self.psf.logE_edges[-1],
+            )
+
+        reco_edges = self.eres.reco_logE_edges
+        if len(reco_edges) != len(self.bkg.logE_edges) or not np.allclose(reco_edges, self.bkg.logE_edges, atol=1e-5):
+            raise ValueError(f"The reconstructed energy bins of the energy response and background of {channel} differ")
+
+    @timed("IRFBundle.pipeline")
+    def pipeline(
+        self, flux, sindec, cone=1.0, livetime=livetime_1yr, confidence_level=0.9, significance=0.0026, power=0.5
+    ):
+        """
+        Run the point source pipeline source -> cone -> reconstructed energy -> background in one call:
+        EffectiveArea.event_rate, PointSpreadFunction.event_table_within_cone,
+        EnergyResponse.reconstruct_event_table and BackgroundComponent.event_rate, followed by the mean limit and
+        the discovery potential of the cut-and-count analysis
+
+        Parameters:
+        - flux: PointSourceFlux or spectral model (see flux.py) with a single set of parameters
+        - sindec: Source location
+        - cone: size of the search cone in degrees
+        - livetime: in seconds
+        - confidence_level: confidence level of the limit
+        - significance: p-value for discovery
+        - power: probability to reach the significance for the discovery flux
+
+        Returns:
+        - Dictionary with the tables of the stages ('event_rate', 'within_cone', 'reconstructed' and 'background')
+          and the summed rates and statistics
+        """
+        from arca230.utils import mean_limit, nobs_disc
+
+        event_rate = self.aeff.event_rate(flux, sindec, livetime)
+        within_cone = self.psf.event_table_within_cone(event_rate, cone)
+        reconstructed = self.eres.reconstruct_event_table(within_cone)
+        background = self.bkg.event_rate(sindec, cone, livetime)
+
+        background_in_cone = background["rate_in_cone [livetime^-1]"].sum()
+        count("IRFBundle.pipeline.rows", len(event_rate) + len(within_cone) + len(reconstructed) + len(background))
+
+        return {
+            "event_rate": event_rate,
+            "within_cone": within_cone,
+            "reconstructed": reconstructed,
+            "background": background,
+            "rate [livetime^-1]": event_rate["rate [livetime^-1]"].sum(),
+            "signal_in_cone [livetime^-1]": reconstructed["rate_in_cone [livetime^-1]"].sum(),
+            "background_in_cone [livetime^-1]": background_in_cone,
+            "mean_limit_nobs": mean_limit(background_in_cone, confidence_level),
+            "discovery_nobs": nobs_disc(background_in_cone, significance, power),
+        }
+
+
+def load_bundle(channel, data_dir=None, cache_dir=None):
+    """
+    The IRFBundle of a channel, loaded once per process and shared by all later calls with the same data and
+    cache directory
+
+    Parameters:
+    - channel: 'track' or 'shower'
+    - data_dir: directory with the csv files, located with find_data_dir when not given
+    - cache_dir: directory of the binary cache (see irfcache.py)
+
+    Returns:
+    - IRFBundle
+    """
+    key = (channel, find_data_dir(channel, data_dir), cache_dir)
+    if key in _bundles:
+        count("IRFBundle.hit")
+    else:
+        count("IRFBundle.miss")
+        _bundles[key] = IRFBundle.load(channel, key[1], cache_dir)
+    return _bundles[key]
@@ -0,0 +1,158 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from arca230.flux import PowerLaw
+from arca230.sweep import livetime_1yr, signal_kernel
+from arca230.utils import mean_limit, nobs_disc
+
+
+def catalog_chunks(catalog, chunksize=10000):
+    """
+    Split a source catalog in chunks of rows
+
+    Parameters:
+    - catalog: path to a csv file, a dataframe or an iterable of dataframes
+    - chunksize: number of sources per chunk
+
+    Returns:
+    - Iterator over dataframes with at most chunksize rows, except for an iterable of dataframes that is passed on
+    """
+    if isinstance(catalog, (str, os.PathLike)):
+        return pd.read_csv(catalog, chunksize=chunksize)
+    if isinstance(catalog, pd.DataFrame):
+        return (catalog.iloc[start : start + chunksize] for start in range(0, len(catalog), chunksize))
+    return iter(catalog)
+
+
+class SourceCatalog:
+    """
+    Calculates the expected signal and background of a catalog of point sources for one channel and the
+    sensitivity of a stacked cut-and-count analysis. The catalog is a table with the columns 'ra' and 'dec' in
+    degrees, 'weight' and optionally 'gamma'. Sources are grouped in bins of sin(dec), such that the signal
+    kernel per true energy is calculated once per bin and any spectral index is folded in per source, and the
+    catalog is processed in chunks so memory stays bounded for any catalog size.
+    """
+
+    def __init__(self, irfs, cone=1.0, gamma=2.0, livetime=livetime_1yr, sindec_binwidth=0.01):
+        self.irfs = irfs
+        self.cone = cone
+        self.gamma = gamma
+        self.livetime = livetime
+        self.sindec_binwidth = sindec_binwidth
+
+        self.n_sindec_bins = int(round(2 / sindec_binwidth))
+        # signal events per unit of dN/dE in each true energy bin within the cone, one row per sin(dec) bin
+        n_energy = len(irfs[0].logE_centers)
+        self.signal_kernels = np.zeros((self.n_sindec_bins, n_energy))
+        self.kernel_filled = np.zeros(self.n_sindec_bins, dtype=bool)
+
+    def sindec_bin(self, sindec):
+        """
+        Index of the sin(dec) bin of the catalog grouping for the given source locations
+        """
+        return np.clip(np.floor((sindec + 1) / self.sindec_binwidth).astype(int), 0, self.n_sindec_bins - 1)
+
+    def signal_per_norm(self, sindec_bins, gammas):
+        """
+        Expected signal events for a flux normalisation of 1 GeV-1 s-1 m-2 at the center of the sin(dec) bins.
+        The signal kernels of bins that were not seen before are calculated, the power law of each source is
+        folded in without a cache so the cost does not depend on the number of distinct spectral indices.
+
+        Parameters:
+        - sindec_bins: sin(dec) bin of each source, array
+        - gammas: spectral index of each source, array
+
+        Returns:
+        - Signal events of each source, array
+        """
+        aeff, psf = self.irfs[0], self.irfs[1]
+        missing = np.unique(sindec_bins[~self.kernel_filled[sindec_bins]])
+        if len(missing):
+            centers = -1 + (missing + 0.5) * self.sindec_binwidth
+            fraction_in_cone = psf.containment_fraction(aeff.logE_centers, self.cone, fill_value=0)
+            self.signal_kernels[missing] = signal_kernel(self.irfs, centers, self.livetime) * fraction_in_cone
+            self.kernel_filled[missing] = True
+
+        dNdE = PowerLaw(np.asarray(gammas, dtype=float), 1).dNdE(aeff.logE_centers)
+        return np.einsum("se,se->s", dNdE, self.signal_kernels[sindec_bins])
+
+    def source_expectations(self, sources):
+        """
+        Calculate the signal and background expectations of a chunk of sources
+
+        Parameters:
+        - sources: dataframe with the columns 'ra', 'dec', 'weight' and optionally 'gamma'
+
+        Returns:
+        - Copy of the dataframe with the columns 'sindec', 'signal [norm^-1]' (weighted signal for a flux
+          normalisation of 1 GeV-1 s-1 m-2) and 'background' added
+        """
+        sources = sources.copy()
+        sindec = np.sin(np.radians(sources["dec"].to_numpy(dtype=float)))
+        if "gamma" in sources:
+            gammas = sources["gamma"].to_numpy(dtype=float)
+        else:
+            gammas = np.full(len(sources), float(self.gamma))
+
+        background = self.irfs[3].event_rate_matrix(sindec, [self.cone], self.livetime).sum(axis=2)[:, 0]
+
+        sources["sindec"] = sindec
+        sources["signal [norm^-1]"] = sources["weight"].to_numpy(dtype=float) * self.signal_per_norm(
+            self.sindec_bin(sindec), gammas
+        )
+        sources["background"] = background
+
+        return sources
+
+    def run(self, catalog, chunksize=10000, output=None, confidence_level=0.9, significance=0.0026, power=0.5):
+        """
+        Process a catalog chunk by chunk and calculate the stacked sensitivity. The stacked analysis counts the
+        events in the cones around all sources, assuming the cones do not overlap.
+
+        Parameters:
+        - catalog: path to a csv file, a dataframe or an iterable of dataframes
+        - chunksize: number of sources per chunk
+        - output: optional csv file to which the per-source expectations and sensitivities are written
+        - confidence_level: confidence level of the limit
+        - significance: p-value for discovery
+        - power: probability to reach the significance for the discovery flux
+
+        Returns:
+        - Dictionary with the number of sources, the stacked signal and background, and the stacked mean limit
+          and discovery flux normalisation of the weighted flux
+        """
+        n_sources = 0
+        signal = 0
+        background = 0
+
+        for i, chunk in enumerate(catalog_chunks(catalog, chunksize)):
+            sources = self.source_expectations(chunk)
+
+            n_sources += len(sources)
+            signal += sources["signal [norm^-1]"].sum()
+            background += sources["background"].sum()
+
+            if output is not None:
+                limit_nobs = mean_limit(sources["background"].to_numpy(), confidence_level)
+                discovery_nobs = nobs_disc(sources["background"].to_numpy(), significance, power)
+
+                with np.errstate(divide="ignore"):
+                    sources["mean_limit_flux [GeV-1 s-1 m-2]"] = limit_nobs / sources["signal [norm^-1]"]
+                    sources["discovery_flux [GeV-1 s-1 m-2]"] = discovery_nobs / sources["signal [norm^-1]"]
+
+                sources.to_csv(output, mode="w" if i == 0 else "a", header=i == 0, index=False)
+
+        limit_nobs = mean_limit(background, confidence_level)
+        discovery_nobs = nobs_disc(background, significance, power)
+
+        return {
+            "n_sources": n_sources,
+            "signal [norm^-1]": signal,
+            "background": background,
+            "mean_limit_nobs": limit_nobs,
+            "mean_limit_flux [GeV-1 s-1 m-2]": limit_nobs / signal if signal > 0 else np.inf,
+            "discovery_nobs": discovery_nobs,
+            "discovery_flux [GeV-1 s-1 m-2]": discovery_nobs / signal if signal > 0 else np.inf,
+        }
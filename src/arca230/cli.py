@@ -0,0 +1,453 @@
+import argparse
+import json
+import logging
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import nullcontext
+
+import numpy as np
+
+from arca230 import flux as flux_models
+from arca230.bundle import channel_flavors, livetime_1yr, load_bundle
+from arca230.instrumentation import count
+from arca230.shared import SharedIRFs, attach
+from arca230.sweep import CsvResultWriter, ParquetResultWriter, sensitivity_table
+
+
+logger = logging.getLogger(__name__)
+
+job_columns = [
+    "job",
+    "source",
+    "channel",
+    "sindec",
+    "cone [degrees]",
+    "spectrum",
+    "livetime [s]",
+    "signal [norm^-1]",
+    "background",
+    "mean_limit_nobs",
+    "mean_limit_flux [GeV-1 s-1 m-2]",
+    "discovery_nobs",
+    "discovery_flux [GeV-1 s-1 m-2]",
+]
+
+spectral_models = {
+    "PowerLaw": flux_models.PowerLaw,
+    "BrokenPowerLaw": flux_models.BrokenPowerLaw,
+    "ExponentialCutoffPowerLaw": flux_models.ExponentialCutoffPowerLaw,
+    "LogParabola": flux_models.LogParabola,
+    "TabulatedSpectrum": flux_models.TabulatedSpectrum,
+}
+
+# keys of a job, keys missing in a job are taken from the [defaults] of the job file
+job_keys = {
+    "name",
+    "sources",
+    "sindec",
+    "channels",
+    "cones",
+    "spectra",
+    "livetimes",
+    "livetime_years",
+    "confidence_level",
+    "significance",
+    "power",
+}
+
+job_file_example = """
+example job file (TOML, the same structure is accepted as JSON):
+
+  output = "results.csv"            # or a directory ending in .parquet
+  [defaults]
+  channels = ["track", "shower"]
+  cones = [0.5, 1.0, 2.0]           # degrees
+  spectra = [2.0, {model = "ExponentialCutoffPowerLaw", gamma = 2.0, logE_cut = 6.0}]
+  livetime_years = [1, 10]          # or livetimes in seconds
+
+  [[jobs]]
+  name = "catalog"
+  sources = [{name = "NGC 1068", dec = -0.01}, {name = "TXS 0506+056", sindec = 0.099}]
+
+  [[jobs]]
+  name = "scan"
+  sindec = {start = -0.99, stop = 0.99, num = 199}
+  spectra = [2.5]
+"""
+
+
+def read_job_file(path):
+    """
+    Read a job file, in JSON or TOML format depending on the file extension
+
+    Parameters:
+    - path: path of the .json or .toml file
+
+    Returns:
+    - Dictionary with the content of the file
+    """
+    with open(path, "rb") as f:
+        content = f.read()
+
+    if path.endswith(".toml"):
+        try:
+            import tomllib
+        except ImportError:
+            try:
+                import tomli as tomllib
+            except ImportError:
+                raise RuntimeError("Reading TOML job files requires Python 3.11 or the tomli package") from None
+        return tomllib.loads(content.decode())
+    if path.endswith(".json"):
+        return json.loads(content)
+    raise ValueError(f"Unknown format of the job file {path}, use .json or .toml")
+
+
+def spectrum_from_config(config):
+    """
+    Create the spectral model of a job with a normalisation of 1, such that the limits are in units of the
+    normalisation
+
+    Parameters:
+    - config: spectral index of a power law, or dictionary with the name of the model in flux.py under 'model',
+      its parameters except the normalisation and an optional 'label'
+
+    Returns:
+    - Tuple with the label of the spectrum and the spectral model
+    """
+    if isinstance(config, (int, float)):
+        return f"PowerLaw(gamma={config})", flux_models.PowerLaw(float(config), 1.0)
+
+    parameters = dict(config)
+    label = parameters.pop("label", None)
+    name = parameters.pop("model", None)
+    if name not in spectral_models:
+        raise ValueError(f"Unknown spectral model {name}, use one of {', '.join(spectral_models)}")
+    if "norm" in parameters:
+        raise ValueError(f"The normalisation of {name} is what the limits are calculated for, remove 'norm'")
+
+    try:
+        model = spectral_models[name](norm=1.0, **parameters)
+    except TypeError as e:
+        raise ValueError(f"Invalid parameters of {name}: {e}") from None
+    if model.shape != ():
+        raise ValueError(f"The parameters of {name} must be numbers, give several spectra instead of arrays")
+
+    if label is None:
+        label = f"{name}({', '.join(f'{key}={value}' for key, value in parameters.items())})"
+    return label, model
+
+
+def _as_list(value):
+    return list(value) if isinstance(value, (list, tuple)) else [value]
+
+
+def parse_sources(job):
+    """
+    Source names and locations of a job, from a list of sources with 'dec' in degrees or 'sindec', and/or a grid
+    of sin(dec) given as list or as {start, stop, num}
+
+    Returns:
+    - Tuple with the list of names and the array of sin(dec)
+    """
+    names = []
+    sindec = []
+    for i, source in enumerate(job.get("sources", [])):
+        if not isinstance(source, dict):
+            raise ValueError(f"Source {i} of job {job['name']} is not a table with 'dec' or 'sindec'")
+        if "sindec" in source:
+            sindec.append(float(source["sindec"]))
+        elif "dec" in source:
+            sindec.append(float(np.sin(np.radians(source["dec"]))))
+        else:
+            raise ValueError(f"Source {i} of job {job['name']} has neither 'dec' nor 'sindec'")
+        names.append(str(source.get("name", f"{job['name']}-{i}")))
+
+    grid = job.get("sindec")
+    if isinstance(grid, dict):
+        missing = [key for key in ("start", "stop", "num") if key not in grid]
+        if missing:
+            raise ValueError(f"The sindec grid of job {job['name']} misses {', '.join(missing)} of start, stop, num")
+        try:
+            grid = np.linspace(float(grid["start"]), float(grid["stop"]), int(grid["num"]))
+        except (TypeError, ValueError) as error:
+            raise ValueError(f"The sindec grid of job {job['name']} is not numeric: {error}") from error
+    if grid is not None:
+        grid = np.atleast_1d(np.asarray(grid, dtype=float))
+        sindec.extend(grid.tolist())
+        names.extend([""] * len(grid))
+
+    sindec = np.array(sindec, dtype=float)
+    if len(sindec) == 0:
+        raise ValueError(f"Job {job['name']} has no sources, give 'sources' and/or 'sindec'")
+    if np.any(np.abs(sindec) > 1):
+        raise ValueError(f"Job {job['name']} has sources with |sin(dec)| > 1")
+    return names, sindec
+
+
+def expand_jobs(config):
+    """
+    Combine every job of a job file with the defaults and check it
+
+    Parameters:
+    - config: content of the job file (see read_job_file)
+
+    Returns:
+    - List of dictionaries with the 'name', source 'names' and 'sindec', 'channels', 'cones', 'spectra' (list of
+      spectrum configurations), 'livetimes' in seconds and the 'statistics' of each job
+    """
+    defaults = config.get("defaults", {})
+    jobs = config.get("jobs")
+    if not jobs:
+        raise ValueError("The job file contains no [[jobs]]")
+
+    expanded = []
+    for i, job in enumerate(jobs):
+        job = {**defaults, **job}
+        job.setdefault("name", f"job-{i}")
+
+        unknown = set(job) - job_keys
+        if unknown:
+            raise ValueError(f"Unknown keys in job {job['name']}: {', '.join(sorted(unknown))}")
+
+        names, sindec = parse_sources(job)
+
+        channels = _as_list(job.get("channels", ["track"]))
+        for channel in channels:
+            if channel not in channel_flavors:
+                raise ValueError(f"Unknown channel {channel} in job {job['name']}, use 'track' or 'shower'")
+
+        cones = np.array(_as_list(job.get("cones", [1.0])), dtype=float)
+        if np.any((cones <= 0) | (cones > 90)):
+            raise ValueError(f"Cones of job {job['name']} must be within (0, 90] degrees")
+
+        spectra = _as_list(job.get("spectra", [2.0]))
+        for spectrum in spectra:
+            spectrum_from_config(spectrum)
+
+        if "livetimes" in job:
+            livetimes = [float(livetime) for livetime in _as_list(job["livetimes"])]
+        else:
+            livetimes = [float(years) * livetime_1yr for years in _as_list(job.get("livetime_years", 1.0))]
+
+        statistics = {
+            "confidence_level": float(job.get("confidence_level", 0.9)),
+            "significance": float(job.get("significance", 0.0026)),
+            "power": float(job.get("power", 0.5)),
+        }
+
+        expanded.append(
+            {
+                "name": str(job["name"]),
+                "names": names,
+                "sindec": sindec,
+                "channels": channels,
+                "cones": cones,
+                "spectra": spectra,
+                "livetimes": livetimes,
+                "statistics": statistics,
+            }
+        )
+
+    return expanded
+
+
+def job_tasks(jobs, chunk_size=50):
+    """
+    Split jobs in tasks of at most chunk_size sources for one channel, spectrum and livetime
+
+    Returns:
+    - List of tuples (job, channel, names, sindec, cones, spectrum, livetime, statistics)
+    """
+    tasks = []
+    for job in jobs:
+        for channel in job["channels"]:
+            for spectrum in job["spectra"]:
+                for livetime in job["livetimes"]:
+                    for start in range(0, len(job["sindec"]), chunk_size):
+                        stop = start + chunk_size
+                        tasks.append(
+                            (
+                                job["name"],
+                                channel,
+                                job["names"][start:stop],
+                                job["sindec"][start:stop],
+                                job["cones"],
+                                spectrum,
+                                livetime,
+                                job["statistics"],
+                            )
+                        )
+    return tasks
+
+
+_worker_dirs = {}
+
+
+def _init_worker(channels, data_dir, cache_dir, shared_handle=None):
+    # the IRFs are loaded once per process with load_bundle, mapped from the shared memory of the parent process
+    # when it is available
+    _worker_dirs.update(data_dir=data_dir, cache_dir=cache_dir)
+    if shared_handle is not None:
+        attach(shared_handle)
+    for channel in channels:
+        load_bundle(channel, data_dir, cache_dir)
+
+
+def _run_task(job, channel, names, sindec, cones, spectrum, livetime, statistics):
+    irfs = load_bundle(channel, _worker_dirs.get("data_dir"), _worker_dirs.get("cache_dir"))
+    label, flux = spectrum_from_config(spectrum)
+
+    table = sensitivity_table(irfs, sindec, cones, np.nan, livetime, flux=flux, **statistics)
+    table = table.drop(columns="gamma")
+    table.insert(0, "job", job)
+    table.insert(1, "source", np.repeat(names, len(cones)))
+    table.insert(2, "channel", channel)
+    table.insert(5, "spectrum", label)
+    return table
+
+
+class ProgressDisplay:
+    """
+    Progress of the tasks on a single line of a terminal, with the number of rows and the estimated remaining
+    time. When the stream is not a terminal a line is written at every tenth of the tasks instead.
+    """
+
+    def __init__(self, total, stream=None):
+        self.total = total
+        self.stream = stream if stream is not None else sys.stderr
+        self.interactive = self.stream.isatty()
+        self.start = time.perf_counter()
+        self.rows = 0
+        self.reported = 0
+
+    def update(self, done, rows=0):
+        self.rows += rows
+        elapsed = time.perf_counter() - self.start
+        remaining = elapsed / done * (self.total - done) if done else 0
+        line = f"{done}/{self.total} tasks, {self.rows} rows, {elapsed:.1f} s elapsed, {remaining:.1f} s remaining"
+
+        if self.interactive:
+            self.stream.write(f"\r{line}\033[K")
+            self.stream.flush()
+        elif done == self.total or 10 * done // self.total > self.reported:
+            self.reported = 10 * done // self.total
+            self.stream.write(line + "\n")
+
+    def close(self):
+        if self.interactive:
+            self.stream.write("\n")
+        self.stream.flush()
+
+
+def run_jobs(
+    jobs, output, n_jobs=None, data_dir=None, cache_dir=None, chunk_size=50, progress=None, shared_memory=True
+):
+    """
+    Calculate the expected signal and background, mean limit and discovery potential of all jobs. The tasks run
+    on a process pool and their rows are written to the output as soon as they finish. The IRFs of each channel
+    are loaded once for all jobs, and shared with the workers through shared memory (see shared.py).
+
+    Parameters:
+    - jobs: jobs from expand_jobs
+    - output: path of the output, a csv file or a directory of Parquet files if the path ends with '.parquet'
+    - n_jobs: number of worker processes, defaults to the number of cpus. With n_jobs=1 no pool is started
+    - data_dir: directory with the csv files, located with bundle.find_data_dir when not given
+    - cache_dir: directory of the binary cache (see irfcache.py)
+    - chunk_size: number of sources per task
+    - progress: optional function called with the number of finished tasks and the number of new rows
+    - shared_memory: publish the IRFs in shared memory for the worker processes
+
+    Returns:
+    - Number of rows written
+    """
+    if str(output).endswith(".parquet"):
+        writer = ParquetResultWriter(output, job_columns)
+    else:
+        writer = CsvResultWriter(output, job_columns)
+    writer.open(resume=False)
+
+    tasks = job_tasks(jobs, chunk_size)
+    channels = sorted({channel for job in jobs for channel in job["channels"]})
+    logger.info("%d jobs with %d tasks for the channels %s", len(jobs), len(tasks), ", ".join(channels))
+    _init_worker(channels, data_dir, cache_dir)
+
+    written = 0
+
+    def deliver(i, rows):
+        nonlocal written
+        writer.write(rows)
+        written += len(rows)
+        count("cli.rows_written", len(rows))
+        if progress is not None:
+            progress(i + 1, len(rows))
+
+    if n_jobs == 1:
+        for i, task in enumerate(tasks):
+            deliver(i, _run_task(*task))
+    else:
+        bundles = [load_bundle(channel, data_dir, cache_dir) for channel in channels]
+        shared = SharedIRFs.publish(bundles) if shared_memory else nullcontext()
+        with shared:
+            initargs = (channels, data_dir, cache_dir, shared.handle if shared_memory else None)
+            with ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_worker, initargs=initargs) as pool:
+                futures = [pool.submit(_run_task, *task) for task in tasks]
+                for i, future in enumerate(as_completed(futures)):
+                    deliver(i, future.result())
+
+    return written
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="arca230",
+        description="Expected events, sensitivity and discovery potential of the KM3NeT/ARCA230 detector for the "
+        "sources, channels, search cones, spectra and livetimes of a job file",
+        epilog=job_file_example,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("job_file", help="job file in JSON or TOML format")
+    parser.add_argument("-o", "--output", help="csv file, or directory of Parquet files ending in .parquet")
+    parser.add_argument("-j", "--jobs", type=int, help="number of worker processes, default the number of cpus")
+    parser.add_argument("--data-dir", help="directory with the IRF csv files")
+    parser.add_argument("--cache-dir", help="directory of the binary IRF cache (see irfcache.py)")
+    parser.add_argument("--chunk-size", type=int, default=50, help="number of sources per task")
+    parser.add_argument("--no-progress", action="store_true", help="do not display the progress")
+    parser.add_argument("-v", "--verbose", action="store_true", help="log the steps of the calculation")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING, format="%(name)s: %(message)s")
+
+    try:
+        config = read_job_file(args.job_file)
+        output = args.output or config.get("output")
+        if output is None:
+            raise ValueError("No output given, use --output or 'output' in the job file")
+        jobs = expand_jobs(config)
+
+        start = time.perf_counter()
+        display = None if args.no_progress else ProgressDisplay(len(job_tasks(jobs, args.chunk_size)))
+        try:
+            written = run_jobs(
+                jobs,
+                output,
+                n_jobs=args.jobs,
+                data_dir=args.data_dir or config.get("data_dir"),
+                cache_dir=args.cache_dir or config.get("cache_dir"),
+                chunk_size=args.chunk_size,
+                progress=display.update if display is not None else None,
+            )
+        finally:
+            if display is not None:
+                display.close()
+    except (ImportError, OSError, RuntimeError, ValueError) as e:
+        print(f"arca230: error: {e}", file=sys.stderr)
+        return 1
+
+    print(f"Wrote {written} rows to {output} in {time.perf_counter() - start:.1f} s", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
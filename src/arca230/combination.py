@@ -0,0 +1,499 @@
+from functools import lru_cache, partial
+
+import numpy as np
+import pandas as pd
+
+from arca230.bundle import livetime_1yr
+from arca230.instrumentation import count, timed
+from arca230.sweep import expected_events
+from arca230.toys import toy_expectations
+from arca230.utils import critical_nobs, mean_limit, nobs_disc
+
+
+def channel_cones(bundles, cones):
+    """
+    Search cones of every channel
+
+    Parameters:
+    - bundles: list of IRFBundles (see bundle.py)
+    - cones: sizes of the search cone in degrees, an array used for all channels or a dictionary with an array
+      per channel. A single cone fixes the cone of a channel
+
+    Returns:
+    - List with an array of cones per bundle
+    """
+    if isinstance(cones, dict):
+        missing = [bundle.channel for bundle in bundles if bundle.channel not in cones]
+        if missing:
+            raise ValueError(f"No cones given for the channels {', '.join(missing)}")
+        return [np.atleast_1d(np.asarray(cones[bundle.channel], dtype=float)) for bundle in bundles]
+    return [np.atleast_1d(np.asarray(cones, dtype=float)) for _ in bundles]
+
+
+@timed("combination.channel_expectations")
+def channel_expectations(bundles, sindec, cones, gamma, livetime=livetime_1yr, flux=None):
+    """
+    Calculate the expected signal and background events of all channels for all source locations and search
+    cones, with one vectorised evaluation per channel (see sweep.expected_events)
+
+    Parameters:
+    - bundles: list of IRFBundles (see bundle.py)
+    - sindec: Source locations, array of length n_sindec
+    - cones: sizes of the search cone in degrees (see channel_cones)
+    - gamma: spectral index of the power law flux
+    - livetime: in seconds
+    - flux: optional spectral model (see flux.py) with a normalisation of 1, used instead of the power law
+
+    Returns:
+    - List with a tuple of the signal and background events per channel, arrays with shape (n_sindec, n_cone)
+    """
+    return [
+        expected_events(bundle, sindec, channel_cone, gamma, livetime, flux)
+        for bundle, channel_cone in zip(bundles, channel_cones(bundles, cones))
+    ]
+
+
+def combine_channels(expectations):
+    """
+    Sum the expected events of the channels for every combination of search cones, the total counts of the
+    combined cut-and-count analysis
+
+    Parameters:
+    - expectations: list with a tuple of the signal and background events per channel (see channel_expectations)
+
+    Returns:
+    - Tuple of the signal and background events, arrays with shape (n_sindec, n_cone_1 * n_cone_2 * ...), the
+      cone combinations are in row-major order of the channels
+    """
+    n_channel = len(expectations)
+    signal = 0
+    background = 0
+    for i, (channel_signal, channel_background) in enumerate(expectations):
+        # the cones of channel i along axis i + 1
+        shape = (len(channel_signal),) + tuple(-1 if j == i else 1 for j in range(n_channel))
+        signal = signal + channel_signal.reshape(shape)
+        background = background + channel_background.reshape(shape)
+
+    n_sindec = len(expectations[0][0])
+    return signal.reshape(n_sindec, -1), background.reshape(n_sindec, -1)
+
+
+def optimal_combination(signal, background, statistic, drop=None, stride=8):
+    """
+    Find the cone combination with the lowest flux statistic(background) / signal for every source location,
+    without evaluating the statistic for every combination. Sorted by background, only combinations with more
+    signal than all combinations with less background (the Pareto front) can be optimal when the statistic
+    increases with the background, as the mean limit does. The statistic of an evaluated combination bounds it
+    from below for all combinations with more background, so the front is refined in levels: every stride^2-th
+    combination, every stride-th and finally all, each level only evaluating the combinations whose bound can
+    still beat the best flux found so far. Statistics that can decrease with the background, like the number of
+    events for discovery (see DiscoverySteps.drop), give the largest decrease with drop; the bound is lowered by it
+    and the combinations behind the front are checked in a last level. Both cases give the same result as the
+    evaluation of all combinations.
+
+    Parameters:
+    - signal: signal events, array with shape (n_sindec, n_combination)
+    - background: background events, array with shape (n_sindec, n_combination)
+    - statistic: function of an array of background events giving the required number of signal events
+    - drop: function of an array of background events giving the largest decrease of the statistic for more
+      background, None for statistics that never decrease with the background
+    - stride: refinement factor between the levels
+
+    Returns:
+    - Tuple with the index of the optimal combination and its number of signal events from the statistic,
+      arrays of length n_sindec
+    """
+    n_sindec, n_combination = background.shape
+    order = np.argsort(background, axis=1, kind="stable")
+    sorted_background = np.take_along_axis(background, order, axis=1).ravel()
+    sorted_signal = np.take_along_axis(signal, order, axis=1).ravel()
+
+    previous_max = np.full((n_sindec, n_combination), -np.inf)
+    previous_max[:, 1:] = np.maximum.accumulate(sorted_signal.reshape(n_sindec, n_combination), axis=1)[:, :-1]
+    front = np.flatnonzero(sorted_signal > previous_max.ravel())
+
+    # the first combination of every row is on the front and evaluated in the first level, so every other
+    # combination has an evaluated combination with less background in its row
+    row_start = np.searchsorted(front, np.arange(n_sindec) * n_combination)
+    rank = np.arange(len(front)) - row_start[front // n_combination]
+    levels = [front[rank % (stride * stride) == 0], front[rank % stride == 0], front]
+    if drop is not None:
+        levels.append(None)
+
+    nobs = np.full(len(sorted_background), np.nan)
+    max_drop = np.zeros(len(sorted_background))
+    evaluated = np.zeros(len(sorted_background), dtype=bool)
+    best = np.full(n_sindec, np.inf)
+    best_index = np.zeros(n_sindec, dtype=int)
+
+    for i, level in enumerate(levels):
+        if level is None:
+            # combinations behind the front, only those with enough signal to beat the best flux with the lowest
+            # bound of their row
+            floor = np.full(n_sindec, np.inf)
+            np.minimum.at(floor, np.flatnonzero(evaluated) // n_combination, (nobs - max_drop)[evaluated])
+            with np.errstate(divide="ignore", invalid="ignore"):
+                enough = sorted_signal > np.repeat(floor / best, n_combination)
+            level = np.flatnonzero(enough & ~evaluated)
+        level = level[~evaluated[level]]
+        if i > 0:
+            # lower bound from the last evaluated combination with less background
+            evaluated_index = np.flatnonzero(evaluated)
+            last = evaluated_index[np.searchsorted(evaluated_index, level) - 1]
+            lower = nobs[last]
+            if drop is not None:
+                lower = lower - np.minimum(sorted_background[level] - sorted_background[last], max_drop[last])
+            with np.errstate(invalid="ignore"):
+                level = level[lower < best[level // n_combination] * sorted_signal[level]]
+
+        nobs[level] = statistic(sorted_background[level])
+        if drop is not None:
+            max_drop[level] = drop(sorted_background[level])
+        evaluated[level] = True
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            flux = np.where(sorted_signal[level] > 0, nobs[level] / sorted_signal[level], np.inf)
+        rows = level // n_combination
+        np.minimum.at(best, rows, flux)
+        optimal = flux == best[rows]
+        best_index[rows[optimal]] = level[optimal]
+
+    n_evaluated = int(evaluated.sum())
+    count("combination.evaluated", n_evaluated)
+    count("combination.skipped", n_sindec * n_combination - n_evaluated)
+
+    # the combination in the order of the inputs
+    rows = np.arange(n_sindec)
+    return order[rows, best_index - rows * n_combination], nobs[best_index]
+
+
+@lru_cache(maxsize=64)
+def _quantile_table(n_max, probability):
+    # gammaincinv(n, probability) for n = 1 ... n_max
+    from scipy.special import gammaincinv
+
+    return gammaincinv(np.arange(1, n_max + 1), probability)
+
+
+class DiscoverySteps:
+    """
+    Steps of the critical number of events (see utils.critical_nobs) up to a largest background, tabulated once
+    for the many backgrounds of the cone combinations. The critical number of events increases to n + 1 where the
+    p-value of n events reaches the significance. Within a step the number of events for discovery falls linearly
+    with the background, so its local minima lie just below the ends of the steps, and the minima increase with n.
+    """
+
+    def __init__(self, max_background, significance=0.0026, power=0.5):
+        n_max = int(critical_nobs(max_background, significance)) + 1
+        self.step_ends = _quantile_table(n_max, significance)
+        # the signal for which P(N >= n_crit) = 1 - power, for n_crit = 1, 2, ...
+        self.required = _quantile_table(n_max + 1, 1 - power)
+
+    def step(self, background):
+        """
+        Index of the step of the background, the critical number of events minus 1
+        """
+        return np.searchsorted(self.step_ends, background, side="right")
+
+    def nobs(self, background):
+        """
+        utils.nobs_disc from the tabulated steps, without the per value cache. The benchmark compares both.
+        """
+        return np.clip(self.required[self.step(background)] - background, 0, None)
+
+    def drop(self, background):
+        """
+        Largest decrease of the number of events for discovery for more background than the given background, the
+        distance to the end of its step (see optimal_combination)
+        """
+        return self.step_ends[self.step(background)] - background
+
+    def optimal_combination(self, signal, background):
+        """
+        The combination with the lowest discovery flux for every source location, like optimal_combination but
+        evaluating all combinations, which the tabulated steps make cheaper than the search
+
+        Parameters:
+        - signal: signal events, array with shape (n_sindec, n_combination)
+        - background: background events, array with shape (n_sindec, n_combination)
+
+        Returns:
+        - Tuple with the index of the optimal combination and its number of signal events for discovery, arrays of
+          length n_sindec
+        """
+        nobs = self.nobs(background)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            flux = np.where(signal > 0, nobs / signal, np.inf)
+        index = np.argmin(flux, axis=1)
+        return index, nobs[np.arange(len(index)), index]
+
+    def refined_combination(self, expectations, best, before=12, after=4):
+        """
+        Improve cone combinations, e.g. of path_combination, at the ends of the steps around their background. Below
+        the end of a step, every combination of the cones of the other channels is completed with the cone of the
+        last channel with the most signal. Ends of steps are skipped where the lowest number of events for
+        discovery of the step cannot beat the flux of the given combination with the most signal of every channel
+        below the end, and so are the combinations of the other channels that cannot beat it with the most signal
+        of the last channel.
+
+        Parameters:
+        - expectations: list with a tuple of the signal and background events per channel (see channel_expectations)
+        - best: index of the combinations in the row-major order of combine_channels, array of length n_sindec
+        - before: number of steps before the step of the given combination
+        - after: number of steps after the step of the given combination
+
+        Returns:
+        - Index of the improved combinations, array of length n_sindec
+        """
+        shape = tuple(channel_signal.shape[1] for channel_signal, _ in expectations)
+        if len(shape) == 1:
+            return best
+
+        rows = np.arange(len(best))
+        cone_index = np.unravel_index(best, shape)
+        signal = sum(channel_signal[rows, index] for (channel_signal, _), index in zip(expectations, cone_index))
+        background = sum(
+            channel_background[rows, index] for (_, channel_background), index in zip(expectations, cone_index)
+        )
+        with np.errstate(divide="ignore", invalid="ignore"):
+            flux = np.where(signal > 0, self.nobs(background) / signal, np.inf)
+
+        n_window = before + 1 + after
+        first = self.step(background) - before
+        window = first[:, np.newaxis] + np.arange(n_window)
+        in_table = (window >= 0) & (window < len(self.step_ends))
+        window = np.clip(window, 0, len(self.step_ends) - 1)
+        end = self.step_ends[window]
+        floor = self.required[window] - end
+
+        # the most signal of every channel below the ends of the steps, a cone is below the end of every step from
+        # its own step on, so the cones sorted by background are counted per step of the window
+        most_signal = []
+        for n_cone, (channel_signal, channel_background) in zip(shape, expectations):
+            order = np.argsort(channel_background, axis=1, kind="stable")
+            running_max = np.zeros((len(rows), n_cone + 1))
+            running_max[:, 1:] = np.maximum.accumulate(np.take_along_axis(channel_signal, order, axis=1), axis=1)
+            relative = np.clip(self.step(channel_background) - first[:, np.newaxis], -1, n_window) + 1
+            bins = (relative + rows[:, np.newaxis] * (n_window + 2)).ravel()
+            counts = np.bincount(bins, minlength=len(rows) * (n_window + 2)).reshape(len(rows), n_window + 2)
+            n_below = np.cumsum(counts, axis=1)[:, 1:-1]
+            most_signal.append(np.take_along_axis(running_max, n_below, axis=1))
+        row, step = np.nonzero(in_table & (floor < flux[:, np.newaxis] * sum(most_signal)))
+
+        # every combination of the other channels below the end of the step, that can beat the flux with the most
+        # signal of the last channel
+        other_signal, other_background = combine_channels(expectations[:-1])
+        budget = end[row, step][:, np.newaxis] - other_background[row]
+        bound = other_signal[row] + most_signal[-1][row, step][:, np.newaxis]
+        pair, other = np.nonzero((budget > 0) & (floor[row, step][:, np.newaxis] < flux[row][:, np.newaxis] * bound))
+        row = row[pair]
+        budget = budget[pair, other]
+
+        # the cone of the last channel with the most signal within the budget
+        last_signal, last_background = expectations[-1]
+        order = np.argsort(last_background, axis=1, kind="stable")
+        sorted_background = np.take_along_axis(last_background, order, axis=1)
+        sorted_signal = np.take_along_axis(last_signal, order, axis=1)
+        running_max = np.maximum.accumulate(sorted_signal, axis=1)
+        most_position = np.maximum.accumulate(np.where(sorted_signal == running_max, np.arange(shape[-1]), 0), axis=1)
+        n_within = np.sum(sorted_background[row] < budget[:, np.newaxis], axis=1)
+        row, other, n_within = row[n_within > 0], other[n_within > 0], n_within[n_within > 0]
+        last = order[row, most_position[row, n_within - 1]]
+        count("combination.refined", len(row))
+
+        candidate_signal = other_signal[row, other] + last_signal[row, last]
+        candidate_background = other_background[row, other] + last_background[row, last]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            candidate_flux = np.where(candidate_signal > 0, self.nobs(candidate_background) / candidate_signal, np.inf)
+
+        np.minimum.at(flux, row, candidate_flux)
+        better = candidate_flux == flux[row]
+        best = best.copy()
+        best[row[better]] = other[better] * shape[-1] + last[better]
+        return best
+
+
+def cone_path(expectations):
+    """
+    Cone combinations along a path through the grid of all combinations, from the first to the last cone of every
+    channel. Every step moves one channel to its next cone, the channel that gains the most signal per additional
+    background event, limited by the gains of its earlier steps. For cones in increasing order the path follows
+    the combinations with the most signal for their background, where the optimum of a statistic that increases
+    with the background lies, with n_cone_1 + n_cone_2 + ... - n_channel + 1 instead of n_cone_1 * n_cone_2 * ...
+    combinations.
+
+    Parameters:
+    - expectations: list with a tuple of the signal and background events per channel (see channel_expectations)
+
+    Returns:
+    - Cone index of every channel along the path, array with shape (n_sindec, n_path, n_channel)
+    """
+    gains = []
+    steps = []
+    for i, (signal, background) in enumerate(expectations):
+        added_signal = np.diff(signal, axis=1)
+        added_background = np.diff(background, axis=1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            gain = np.where(added_background > 0, added_signal / added_background, np.inf)
+        # the cones of a channel are taken in order, so a step cannot come before an earlier one with less gain
+        gains.append(np.minimum.accumulate(gain, axis=1))
+        steps.append(np.full(gain.shape, i))
+
+    order = np.argsort(-np.concatenate(gains, axis=1), axis=1, kind="stable")
+    steps = np.take_along_axis(np.concatenate(steps, axis=1), order, axis=1)
+
+    path = np.zeros((len(steps), steps.shape[1] + 1, len(expectations)), dtype=int)
+    for i in range(len(expectations)):
+        path[:, 1:, i] = np.cumsum(steps == i, axis=1)
+    return path
+
+
+def path_combination(expectations, search):
+    """
+    Find the best cone combination along cone_path for every source location, instead of searching all
+    combinations. For a statistic that increases with the background, like the mean limit, the optimum is normally
+    on the path; the benchmark compares it with the search of all combinations. The number of events for discovery
+    has its minima in between the combinations of the path, see DiscoverySteps.refined_combination.
+
+    Parameters:
+    - expectations: list with a tuple of the signal and background events per channel (see channel_expectations)
+    - search: function of the signal and background events of the candidates with the signature and result of
+      optimal_combination, e.g. optimal_combination with the statistic or DiscoverySteps.optimal_combination
+
+    Returns:
+    - Index of the combination in the row-major order of combine_channels, array of length n_sindec
+    """
+    shape = tuple(channel_signal.shape[1] for channel_signal, _ in expectations)
+    rows = np.arange(len(expectations[0][0]))[:, np.newaxis]
+
+    path = cone_path(expectations)
+    signal = sum(channel_signal[rows, path[:, :, i]] for i, (channel_signal, _) in enumerate(expectations))
+    background = sum(channel_background[rows, path[:, :, i]] for i, (_, channel_background) in enumerate(expectations))
+    on_path, _ = search(signal, background)
+    return np.ravel_multi_index(tuple(path[rows[:, 0], on_path].T), shape)
+
+
+@timed("combination.joint_sensitivity_table")
+def joint_sensitivity_table(
+    bundles,
+    sindec,
+    cones=None,
+    gamma=2.0,
+    livetime=livetime_1yr,
+    objective="discovery",
+    confidence_level=0.9,
+    significance=0.0026,
+    power=0.5,
+    flux=None,
+    exact=False,
+):
+    """
+    Calculate the mean limit and discovery potential of the combined cut-and-count analysis of several channels,
+    in which the events within the search cones of all channels are counted together. The cone of every channel
+    is optimised jointly for each source location. By default the combinations along cone_path are searched,
+    refined at the ends of the steps of the discovery potential (see DiscoverySteps.refined_combination), which
+    the benchmark compares with the search of all combinations of the cones of the channels that exact selects.
+
+    Parameters:
+    - bundles: list of IRFBundles (see bundle.py), e.g. [load_bundle("track"), load_bundle("shower")]
+    - sindec: Source locations, array
+    - cones: sizes of the search cone in degrees, an array for all channels or a dictionary with an array per
+      channel. A single cone per channel gives the combination without optimisation. By default 41 cones
+      between 0.1 and 10 degrees
+    - gamma: spectral index of the power law flux
+    - livetime: in seconds
+    - objective: 'discovery' to minimise the discovery flux or 'limit' to minimise the mean limit on the flux
+    - confidence_level: confidence level of the limit
+    - significance: p-value for discovery
+    - power: probability to reach the significance for the discovery flux
+    - flux: optional spectral model (see flux.py) with a normalisation of 1, used instead of the power law
+    - exact: search all cone combinations with optimal_combination
+
+    Returns:
+    - Dataframe with one row per source location with the optimal cone, signal and background of every channel
+      and the combined signal, background, mean limit and discovery potential
+    """
+    if objective not in ("discovery", "limit"):
+        raise ValueError(f"Unknown objective {objective}, use 'discovery' or 'limit'")
+    if cones is None:
+        cones = np.logspace(-1, 1, 41)
+
+    sindec = np.atleast_1d(np.asarray(sindec, dtype=float))
+    expectations = channel_expectations(bundles, sindec, cones, gamma, livetime, flux)
+    cones = channel_cones(bundles, cones)
+
+    if objective == "discovery":
+        # the steps of the critical number of events up to the largest background of all combinations
+        steps = DiscoverySteps(sum(np.max(background) for _, background in expectations), significance, power)
+        if exact:
+            statistic = partial(nobs_disc, alpha=significance, beta=power)
+            best, _ = optimal_combination(*combine_channels(expectations), statistic, steps.drop)
+        else:
+            best = steps.refined_combination(expectations, path_combination(expectations, steps.optimal_combination))
+    else:
+        search = partial(optimal_combination, statistic=partial(mean_limit, confidence_level=confidence_level))
+        if exact:
+            best, _ = search(*combine_channels(expectations))
+        else:
+            best = path_combination(expectations, search)
+
+    rows = np.arange(len(sindec))
+    table = pd.DataFrame({"sindec": sindec})
+    cone_index = np.unravel_index(best, tuple(len(channel_cone) for channel_cone in cones))
+    for bundle, channel_cone, index, (channel_signal, channel_background) in zip(
+        bundles, cones, cone_index, expectations
+    ):
+        table[f"cone_{bundle.channel} [degrees]"] = channel_cone[index]
+        table[f"signal_{bundle.channel} [norm^-1]"] = channel_signal[rows, index]
+        table[f"background_{bundle.channel}"] = channel_background[rows, index]
+
+    total_signal = sum(table[f"signal_{bundle.channel} [norm^-1]"].to_numpy() for bundle in bundles)
+    total_background = sum(table[f"background_{bundle.channel}"].to_numpy() for bundle in bundles)
+    limit_nobs = mean_limit(total_background, confidence_level)
+    disc_nobs = nobs_disc(total_background, significance, power)
+
+    with np.errstate(divide="ignore"):
+        table["objective"] = objective
+        table["gamma"] = float(gamma)
+        table["livetime [s]"] = float(livetime)
+        table["signal [norm^-1]"] = total_signal
+        table["background"] = total_background
+        table["mean_limit_nobs"] = limit_nobs
+        table["mean_limit_flux [GeV-1 s-1 m-2]"] = limit_nobs / total_signal
+        table["discovery_nobs"] = disc_nobs
+        table["discovery_flux [GeV-1 s-1 m-2]"] = disc_nobs / total_signal
+
+    return table
+
+
+def joint_expectations(bundles, sindec, gamma, cones, livetime=livetime_1yr):
+    """
+    Signal and background expectations of all channels as one set of bins, per channel, ring of angular distance
+    and reconstructed energy bin (see toys.toy_expectations). The channels are independent, so the product of
+    their Poisson likelihoods is the likelihood of the concatenated bins, which can be passed directly to
+    likelihood.fit_signal_events and toys.run_pseudo_experiments for the joint likelihood analysis.
+
+    Parameters:
+    - bundles: list of IRFBundles (see bundle.py)
+    - sindec: Source location
+    - gamma: spectral index of the power law flux
+    - cones: outer radii of the psi rings in degrees, an array for all channels or a dictionary with an array
+      per channel (see toys.toy_expectations)
+    - livetime: in seconds
+
+    Returns:
+    - Tuple of arrays with the signal events for a flux normalisation of 1 GeV-1 s-1 m-2 and the background
+      events of all bins, and a list with the slice of the bins of every channel
+    """
+    signals = []
+    backgrounds = []
+    slices = []
+    start = 0
+    for bundle, channel_cone in zip(bundles, channel_cones(bundles, cones)):
+        signal, background = toy_expectations(bundle, sindec, gamma, channel_cone, livetime)
+        signals.append(signal.ravel())
+        backgrounds.append(background.ravel())
+        slices.append(slice(start, start + signal.size))
+        start += signal.size
+
+    return np.concatenate(signals), np.concatenate(backgrounds), slices
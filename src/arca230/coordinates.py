@@ -1,29 +1,134 @@
-from astropy.coordinates import EarthLocation, AltAz, ICRS
-from astropy.time import Time
-import astropy.units as u
+from functools import lru_cache
+
 import numpy as np
-import pandas as pd
+
+from arca230.instrumentation import timed
+from arca230.memo import memoised
 
 
 detector_latitude = 0.633407  # [radians]
 detector_longitude = 0.278819  # [radians]
-detector_location = EarthLocation.from_geodetic(lat=detector_latitude * u.rad, lon=detector_longitude * u.rad)
-observing_time = Time("2020-01-01 02:02:02")  # dummy observing time needed for the functions
+
+# Maximum absolute difference between the analytic and the astropy daily fractions per 0.05 wide cos(zen) band.
+# The astropy path evaluates the apparent position at observing_time, which is precessed by ~0.1 degree with respect
+# to ICRS and moves up to ~0.005 of the day between neighbouring bands. A latitude off by half a degree moves 0.03.
+visibility_tolerance = 0.01
+# Same for the fractions of transient time windows. These are precessed to the epoch of the window, the deviation is
+# below 0.001 plus the quantisation of the astropy sampling.
+transient_visibility_tolerance = 0.002
 
 
-def fraction_at_zenith(zenith_dataframe, sindec, nsamples=1000):
+def cos_zenith_cdf(cos_zen, sindec, latitude=detector_latitude):
     """
-    Calculates the relative time spent per day for
-    a source at given sindec for the specified zenith bands
+    Calculates the fraction of a sidereal day that a source at sindec spends below cos_zen. During a day the
+    hour angle H of the source is uniform, and cos(zen) = sin(lat) sin(dec) + cos(lat) cos(dec) cos(H),
+    so the fraction follows in closed form.
+
+    Parameters:
+    - cos_zen: Cosine of the zenith, scalar or array
+    - sindec: Source location, scalar or array broadcastable with cos_zen
+    - latitude: detector latitude in radians
+
+    Returns:
+    - Fraction of time with cos(zen) < cos_zen, with the broadcast shape of the inputs
+    """
+    cos_zen = np.asarray(cos_zen, dtype=float)
+    sindec = np.asarray(sindec, dtype=float)
+
+    if np.any(np.abs(sindec) > 1):
+        raise ValueError(f"abs(sindec) should be < 1 {sindec}")
+
+    a = np.sin(latitude) * sindec
+    b = np.cos(latitude) * np.sqrt(1 - sindec**2)
+
+    # for sources at the poles b vanishes and the source stays at a fixed zenith
+    with np.errstate(divide="ignore", invalid="ignore"):
+        x = np.where(b > 0, (cos_zen - a) / b, np.where(cos_zen > a, 1.0, -1.0))
+
+    return 1 - np.arccos(np.clip(x, -1, 1)) / np.pi
+
+
+@lru_cache(maxsize=None)
+def get_detector_location():
+    """
+    Location of the detector as astropy EarthLocation
+    """
+    from astropy.coordinates import EarthLocation
+    import astropy.units as u
+
+    return EarthLocation.from_geodetic(lat=detector_latitude * u.rad, lon=detector_longitude * u.rad)
+
+
+@lru_cache(maxsize=None)
+def get_observing_time():
+    """
+    Dummy observing time needed for the astropy transformations
+    """
+    from astropy.time import Time
+
+    return Time("2020-01-01 02:02:02")
+
+
+def __getattr__(name):
+    # detector_location and observing_time are only created on first access, because importing astropy is slow
+    if name == "detector_location":
+        return get_detector_location()
+    if name == "observing_time":
+        return get_observing_time()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+@lru_cache(maxsize=256)
+def _visibility_matrix(sindec, cos_zen_low, cos_zen_high, latitude):
+    sindec = np.array(sindec)[:, np.newaxis]
+    matrix = cos_zenith_cdf(np.array(cos_zen_high), sindec, latitude) - cos_zenith_cdf(
+        np.array(cos_zen_low), sindec, latitude
+    )
+    matrix.setflags(write=False)
+    return matrix
+
+
+@timed("coordinates.visibility_matrix")
+def visibility_matrix(sindec, cos_zen_low, cos_zen_high, latitude=detector_latitude):
+    """
+    Calculates the relative time spent per day in each zenith band for an array of source declinations.
+    Results are memoised per declinations and band definition, the returned array is read-only.
+
+    Parameters:
+    - sindec: Source locations, array of length n_sindec
+    - cos_zen_low: low edges of the cos(zen) bands, array of length n_band
+    - cos_zen_high: high edges of the cos(zen) bands, array of length n_band
+    - latitude: detector latitude in radians
+
+    Returns:
+    - Array with shape (n_sindec, n_band) with the fraction of time spent in each zenith band
+    """
+    return _visibility_matrix(
+        tuple(np.atleast_1d(sindec).astype(float)),
+        tuple(np.atleast_1d(cos_zen_low).astype(float)),
+        tuple(np.atleast_1d(cos_zen_high).astype(float)),
+        float(latitude),
+    )
+
+
+@memoised
+def sample_coszen(sindec, nsamples=1000):
+    """
+    Transforms nsamples right ascensions at the given declination to the detector frame at observing_time with
+    astropy. This is the reference for the analytic calculation.
 
     Parameters:
-    - zenith_dataframe: Pandas dataframe with zenith bands ('cos(zen) low', 'cos(zen) high')
     - sindec: Source location
     - nsamples: number of samples in right ascension
 
     Returns:
-    - Dataframe with the zenith bands and the fraction of time spent in each zenith band
+    - Array with cos(zen) of each sample
     """
+    from astropy.coordinates import AltAz, ICRS
+    import astropy.units as u
+
+    observing_time = get_observing_time()
+    detector_location = get_detector_location()
 
     right_ascensions = np.array([i * 2 * np.pi / nsamples for i in range(nsamples)])
     declinations = np.array([np.arcsin(sindec) for i in range(nsamples)])
@@ -36,17 +141,353 @@ def fraction_at_zenith(zenith_dataframe, sindec, nsamples=1000):
 
     # Get zenith and azimuth from AltAz coordinates
     zeniths = 90.0 * u.deg - altaz_coords.alt
-    coszen = np.cos(zeniths.value * np.pi / 180)
+    return np.cos(zeniths.value * np.pi / 180)
+
+
+# range of the default sidereal table, modified julian dates of 2000-01-01 and 2050-01-01
+sidereal_table_range = (51544.0, 69807.0)
+
+
+def to_mjd(times):
+    """
+    Convert times to modified julian dates in UTC
+
+    Parameters:
+    - times: astropy Time, numpy datetime64 in UTC or modified julian dates, scalar or array
+
+    Returns:
+    - Array of modified julian dates
+    """
+    if hasattr(times, "mjd"):
+        return np.asarray(times.utc.mjd, dtype=float)
+
+    times = np.asarray(times)
+    if np.issubdtype(times.dtype, np.datetime64):
+        return (times - np.datetime64("1858-11-17T00:00:00")) / np.timedelta64(1, "D")
+    return times.astype(float)
+
+
+@memoised
+def _sidereal_angles(start_mjd, stop_mjd, step, longitude):
+    import warnings
+
+    from astropy.time import Time
+    import astropy.units as u
+
+    mjd = np.arange(start_mjd, stop_mjd + step, step)
+    with warnings.catch_warnings():
+        # erfa warns about leap seconds that are not known yet for dates in the future
+        warnings.simplefilter("ignore")
+        angles = Time(mjd, format="mjd", scale="utc").sidereal_time("mean", longitude=longitude * u.rad).rad
+    return mjd, np.unwrap(angles)
+
+
+class SiderealTable:
+    """
+    Local mean sidereal angle of the detector against time, tabulated with astropy and interpolated linearly. The
+    angle is unwrapped, so it increases continuously with time and the hour angle swept by a source during a time
+    window is the difference of two table lookups. Between the nodes of the default step of 6 hours the linear
+    interpolation deviates by less than 0.1 ms of time.
+    """
+
+    def __init__(
+        self,
+        start_mjd=sidereal_table_range[0],
+        stop_mjd=sidereal_table_range[1],
+        step=0.25,
+        longitude=detector_longitude,
+    ):
+        """
+        Parameters:
+        - start_mjd: first time of the table, modified julian date
+        - stop_mjd: last time of the table, modified julian date
+        - step: distance between the nodes in days
+        - longitude: detector longitude in radians
+        """
+        self.mjd, self.angle = _sidereal_angles(float(start_mjd), float(stop_mjd), float(step), float(longitude))
+        self.mjd.setflags(write=False)
+        self.angle.setflags(write=False)
+
+    def local_sidereal_angle(self, times):
+        """
+        Local mean sidereal angle in radians, unwrapped, for times within the table
+
+        Parameters:
+        - times: astropy Time, numpy datetime64 in UTC or modified julian dates, scalar or array
+
+        Returns:
+        - Array of angles with the shape of times
+        """
+        mjd = to_mjd(times)
+        if np.any((mjd < self.mjd[0]) | (mjd > self.mjd[-1])) or np.any(np.isnan(mjd)):
+            raise ValueError(f"Times need to be within MJD {self.mjd[0]} and {self.mjd[-1]} of the sidereal table")
+        return np.interp(mjd, self.mjd, self.angle)
+
+
+@lru_cache(maxsize=None)
+def default_sidereal_table():
+    """
+    The sidereal table of the detector from 2000 to 2050, created on first use and memoised on disk (see memo.py)
+    """
+    return SiderealTable()
+
+
+def precess_to_date(ra, sindec, mjd):
+    """
+    Rotates positions from J2000 to the mean equator and equinox of date with the IAU 1976 precession angles
+    zeta, z and theta. Nutation and aberration, which move a source by less than 30 arcsec, are neglected.
+
+    Parameters:
+    - ra: right ascension in ICRS in radians, array
+    - sindec: Source location, array
+    - mjd: modified julian date, array
+
+    Returns:
+    - Tuple with the right ascension in radians and the sin(dec) of date, with the broadcast shape of the inputs
+    """
+    t = (np.asarray(mjd, dtype=float) - 51544.5) / 36525  # julian centuries since J2000
+    zeta = np.radians((2306.2181 * t + 0.30188 * t**2 + 0.017998 * t**3) / 3600)
+    z = np.radians((2306.2181 * t + 1.09468 * t**2 + 0.018203 * t**3) / 3600)
+    theta = np.radians((2004.3109 * t - 0.42665 * t**2 - 0.041833 * t**3) / 3600)
+
+    cosdec = np.sqrt(1 - np.minimum(np.square(sindec), 1))
+    a = cosdec * np.sin(ra + zeta)
+    b = np.cos(theta) * cosdec * np.cos(ra + zeta) - np.sin(theta) * sindec
+    c = np.sin(theta) * cosdec * np.cos(ra + zeta) + np.cos(theta) * sindec
+    return np.arctan2(a, b) + z, np.clip(c, -1, 1)
+
+
+def _hour_angle_measure(hour_angle, half_width):
+    # measure of the hour angles h in [-pi, hour_angle] with |h| <= half_width modulo 2 pi
+    shifted = hour_angle + np.pi
+    periods = np.floor(shifted / (2 * np.pi))
+    remainder = shifted - 2 * np.pi * periods
+    return periods * 2 * half_width + np.clip(remainder - np.pi + half_width, 0, 2 * half_width)
+
+
+def window_cos_zenith_cdf(cos_zen, sindec, hour_angle_start, hour_angle_stop, latitude=detector_latitude):
+    """
+    Calculates the fraction of a time window that a source at sindec spends below cos_zen. The hour angle H of the
+    source increases uniformly during the window and cos(zen) = sin(lat) sin(dec) + cos(lat) cos(dec) cos(H), so
+    the fraction follows in closed form from the hour angles at the start and end of the window. Windows of zero
+    length give the indicator of the instantaneous position.
+
+    Parameters:
+    - cos_zen: Cosine of the zenith, array
+    - sindec: Source location, array broadcastable with cos_zen
+    - hour_angle_start: hour angle of the source at the start of the window in radians, broadcastable
+    - hour_angle_stop: hour angle of the source at the end of the window in radians, broadcastable
+    - latitude: detector latitude in radians
+
+    Returns:
+    - Fraction of the window with cos(zen) < cos_zen, with the broadcast shape of the inputs
+    """
+    cos_zen = np.asarray(cos_zen, dtype=float)
+    sindec = np.asarray(sindec, dtype=float)
+
+    if np.any(np.abs(sindec) > 1):
+        raise ValueError(f"abs(sindec) should be < 1 {sindec}")
+
+    a = np.sin(latitude) * sindec
+    b = np.cos(latitude) * np.sqrt(1 - sindec**2)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        x = np.where(b > 0, (cos_zen - a) / b, np.where(cos_zen > a, 1.0, -1.0))
+
+    # the source is above cos_zen for hour angles within half_width of its culmination
+    half_width = np.arccos(np.clip(x, -1, 1))
+    span = hour_angle_stop - hour_angle_start
+    above = _hour_angle_measure(hour_angle_stop, half_width) - _hour_angle_measure(hour_angle_start, half_width)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(span > 0, 1 - above / span, np.cos(hour_angle_start) < x)
+
+
+@timed("coordinates.transient_visibility_matrix")
+def transient_visibility_matrix(
+    ra, sindec, t_start, t_stop, cos_zen_low, cos_zen_high, table=None, latitude=detector_latitude
+):
+    """
+    Calculates the fraction of a time window spent in each zenith band for many transient sources at once, e.g. for
+    the follow-up of alerts. The hour angles at the start and end of each window come from the sidereal table. The
+    ICRS positions are precessed to the mean equator and equinox at the start of the window (see precess_to_date).
+    For windows of 0.05 days or longer the fractions agree with astropy AltAz to 0.001 per 0.05 wide cos(zen) band,
+    shorter windows are more sensitive to the neglected nutation and aberration.
+
+    Parameters:
+    - ra: right ascensions in degrees, array of length n_source
+    - sindec: Source locations, array of length n_source
+    - t_start: start of the windows, astropy Time, numpy datetime64 in UTC or modified julian dates, length n_source
+    - t_stop: end of the windows, like t_start
+    - cos_zen_low: low edges of the cos(zen) bands, array of length n_band
+    - cos_zen_high: high edges of the cos(zen) bands, array of length n_band
+    - table: SiderealTable, defaults to default_sidereal_table()
+    - latitude: detector latitude in radians
+
+    Returns:
+    - Array with shape (n_source, n_band) with the fraction of each window spent in each zenith band
+    """
+    table = table or default_sidereal_table()
+
+    ra = np.radians(np.atleast_1d(np.asarray(ra, dtype=float)))[:, np.newaxis]
+    sindec = np.atleast_1d(np.asarray(sindec, dtype=float))[:, np.newaxis]
+    ra, sindec = precess_to_date(ra, sindec, to_mjd(t_start).reshape(-1, 1))
+    angle_start = np.atleast_1d(table.local_sidereal_angle(t_start))[:, np.newaxis]
+    angle_stop = np.atleast_1d(table.local_sidereal_angle(t_stop))[:, np.newaxis]
+
+    if np.any(angle_stop < angle_start):
+        raise ValueError("The end of a window lies before its start")
+
+    hour_angle_start = angle_start - ra
+    hour_angle_stop = angle_stop - ra
+
+    cos_zen_low = np.atleast_1d(np.asarray(cos_zen_low, dtype=float))
+    cos_zen_high = np.atleast_1d(np.asarray(cos_zen_high, dtype=float))
+    high = window_cos_zenith_cdf(cos_zen_high, sindec, hour_angle_start, hour_angle_stop, latitude)
+    low = window_cos_zenith_cdf(cos_zen_low, sindec, hour_angle_start, hour_angle_stop, latitude)
+    return high - low
+
+
+def sample_coszen_window(ra, sindec, t_start, t_stop, nsamples=1000):
+    """
+    Transforms a source to the detector frame with astropy at nsamples times spread uniformly over a time window.
+    This is the reference for transient_visibility_matrix.
+
+    Parameters:
+    - ra: right ascension in degrees
+    - sindec: Source location
+    - t_start: start of the window, astropy Time, numpy datetime64 in UTC or modified julian date
+    - t_stop: end of the window, like t_start
+    - nsamples: number of times
+
+    Returns:
+    - Array with cos(zen) at each time
+    """
+    from astropy.coordinates import AltAz, ICRS
+    from astropy.time import Time
+    import astropy.units as u
+
+    start, stop = to_mjd(t_start), to_mjd(t_stop)
+    times = Time(start + (np.arange(nsamples) + 0.5) / nsamples * (stop - start), format="mjd", scale="utc")
+
+    source = ICRS(ra=ra * u.deg, dec=np.arcsin(sindec) * u.rad)
+    altaz = source.transform_to(AltAz(obstime=times, location=get_detector_location()))
+    return np.sin(altaz.alt.rad)
+
+
+def cap_intersection_area(distance, radius1, radius2):
+    """
+    Solid angle of the intersection of two spherical caps, e.g. a search cone and the part of the sky above a
+    declination. The caps partially overlap when |radius1 - radius2| < distance < radius1 + radius2, for which the
+    area is 2 (pi - C0 - C1 cos(radius1) - C2 cos(radius2)) with the angles C0, C1 and C2 of the spherical
+    triangle formed by the two centers and an intersection point. Caps larger than a hemisphere are handled via
+    their complement.
+
+    Parameters:
+    - distance: angular distance between the centers in radians, array
+    - radius1: angular radius of the first cap in radians, at most pi / 2, array
+    - radius2: angular radius of the second cap in radians, array
+
+    Returns:
+    - Solid angle in steradian with the broadcast shape of the inputs
+    """
+    distance, radius1, radius2 = np.broadcast_arrays(
+        *(np.asarray(value, dtype=float) for value in (distance, radius1, radius2))
+    )
+
+    def hemisphere_caps(d, r1, r2):
+        with np.errstate(divide="ignore", invalid="ignore"):
+            c0 = np.arccos(np.clip((np.cos(d) - np.cos(r1) * np.cos(r2)) / (np.sin(r1) * np.sin(r2)), -1, 1))
+            c1 = np.arccos(np.clip((np.cos(r2) - np.cos(d) * np.cos(r1)) / (np.sin(d) * np.sin(r1)), -1, 1))
+            c2 = np.arccos(np.clip((np.cos(r1) - np.cos(d) * np.cos(r2)) / (np.sin(d) * np.sin(r2)), -1, 1))
+        partial = 2 * (np.pi - c0 - c1 * np.cos(r1) - c2 * np.cos(r2))
+        contained = 2 * np.pi * (1 - np.cos(np.minimum(r1, r2)))
+        return np.where(d >= r1 + r2, 0, np.where(d <= np.abs(r1 - r2), contained, partial))
+
+    large = radius2 > np.pi / 2
+    area = hemisphere_caps(distance, radius1, np.where(large, np.pi - radius2, radius2))
+    complement = 2 * np.pi * (1 - np.cos(radius1)) - hemisphere_caps(np.pi - distance, radius1, np.pi - radius2)
+    return np.where(large, complement, area)
+
+
+def equal_area_grid(n_sindec, n_ra):
+    """
+    Pixels of equal solid angle covering the sky, uniform in sin(dec) and right ascension
 
-    for index, row in zenith_dataframe.iterrows():
-        # Update counts for rows where the condition is satisfied
-        count = np.sum((coszen >= row["cos(zen) low"]) & (coszen < row["cos(zen) high"]))
-        zenith_dataframe.loc[index, "weight"] = count / nsamples
+    Parameters:
+    - n_sindec: number of pixels in sin(dec)
+    - n_ra: number of pixels in right ascension
+
+    Returns:
+    - Tuple with the sin(dec) and right ascension in degrees of the pixel centers, arrays with shape
+      (n_sindec, n_ra), and the solid angle of a pixel in steradian
+    """
+    sindec = -1 + (np.arange(n_sindec) + 0.5) * 2 / n_sindec
+    ra = (np.arange(n_ra) + 0.5) * 360 / n_ra
+    sindec, ra = np.meshgrid(sindec, ra, indexing="ij")
+    return sindec, ra, 4 * np.pi / (n_sindec * n_ra)
+
+
+def validate_visibility(sindec, cos_zen_low, cos_zen_high, nsamples=1000):
+    """
+    Compares the analytic zenith band fractions with the astropy reference and raises a RuntimeError
+    when they differ by more than visibility_tolerance
+
+    Parameters:
+    - sindec: Source locations, array
+    - cos_zen_low: low edges of the cos(zen) bands, array
+    - cos_zen_high: high edges of the cos(zen) bands, array
+    - nsamples: number of samples in right ascension for the astropy reference
+
+    Returns:
+    - Maximum absolute difference of the fractions over all declinations and bands
+    """
+    cos_zen_low = np.asarray(cos_zen_low, dtype=float)
+    cos_zen_high = np.asarray(cos_zen_high, dtype=float)
+    analytic = visibility_matrix(sindec, cos_zen_low, cos_zen_high)
+
+    difference = 0
+    for i, s in enumerate(np.atleast_1d(sindec)):
+        coszen = sample_coszen(s, nsamples)[:, np.newaxis]
+        reference = np.sum((coszen >= cos_zen_low) & (coszen < cos_zen_high), axis=0) / nsamples
+        difference = max(difference, np.max(np.abs(analytic[i] - reference)))
+
+    if difference > visibility_tolerance:
+        raise RuntimeError(f"Analytic visibility deviates {difference} from astropy, tolerance {visibility_tolerance}")
+
+    return difference
+
+
+@timed("coordinates.fraction_at_zenith")
+def fraction_at_zenith(zenith_dataframe, sindec, nsamples=1000, method="analytic"):
+    """
+    Calculates the relative time spent per day for
+    a source at given sindec for the specified zenith bands
+
+    Parameters:
+    - zenith_dataframe: Pandas dataframe with zenith bands ('cos(zen) low', 'cos(zen) high')
+    - sindec: Source location
+    - nsamples: number of samples in right ascension, only used by the astropy method
+    - method: 'analytic' for the closed form calculation or 'astropy' for sampling with astropy
+
+    Returns:
+    - Dataframe with the zenith bands and the fraction of time spent in each zenith band
+    """
+    cos_zen_low = zenith_dataframe["cos(zen) low"].to_numpy(dtype=float)
+    cos_zen_high = zenith_dataframe["cos(zen) high"].to_numpy(dtype=float)
+
+    if method == "analytic":
+        zenith_dataframe["weight"] = visibility_matrix(sindec, cos_zen_low, cos_zen_high)[0]
+    elif method == "astropy":
+        coszen = sample_coszen(sindec, nsamples)[:, np.newaxis]
+        zenith_dataframe["weight"] = np.sum((coszen >= cos_zen_low) & (coszen < cos_zen_high), axis=0) / nsamples
+    else:
+        raise ValueError(f"Unknown method {method}, use 'analytic' or 'astropy'")
 
     return zenith_dataframe
 
 
-def visibility_below_coszen(cos_zen_cut, sindec, nsamples=1000):
+def visibility_below_coszen(cos_zen_cut, sindec, nsamples=1000, method="analytic"):
     """
     Calculates the visibility - the fraction of time in a day -
     for which the source is below the cos_zen_cut
@@ -54,28 +495,23 @@ def visibility_below_coszen(cos_zen_cut, sindec, nsamples=1000):
     Parameters:
     - cos_zen_cut: Cosine of the zenith that defines visible or not
     - sindec: Source location
-    - nsamples: number of samples in right ascension
+    - nsamples: number of samples in right ascension, only used by the astropy method
+    - method: 'analytic' for the closed form calculation or 'astropy' for sampling with astropy
 
     Returns:
     - Fraction of time spent below cos_zen_cut
     """
-    right_ascensions = np.array([i * 2 * np.pi / nsamples for i in range(nsamples)])
-    declinations = np.array([np.arcsin(sindec) for i in range(nsamples)])
-
-    # Create ICRS coordinates from declination and right ascension
-    icrs_coords = ICRS(ra=right_ascensions * u.rad, dec=declinations * u.rad)
-
-    # Transform ICRS coordinates to AltAz coordinates for the observer location and time
-    altaz_coords = icrs_coords.transform_to(AltAz(obstime=observing_time, location=detector_location))
-
-    # Get zenith and azimuth from AltAz coordinates
-    zeniths = 90.0 * u.deg - altaz_coords.alt
-    coszen = np.cos(zeniths.value * np.pi / 180)
-
-    return np.sum(coszen < cos_zen_cut) / nsamples
+    if method == "analytic":
+        return float(cos_zenith_cdf(cos_zen_cut, sindec))
+    elif method == "astropy":
+        return np.sum(sample_coszen(sindec, nsamples) < cos_zen_cut) / nsamples
+    else:
+        raise ValueError(f"Unknown method {method}, use 'analytic' or 'astropy'")
 
 
 if __name__ == "__main__":
+    import pandas as pd
+
     zenith_dataframe = pd.DataFrame(columns=["cos(zen) low", "cos(zen) high", "cos(zen) center"])
 
     # Define the range for iterations
@@ -1,5 +1,15 @@
+import logging
+
+import numpy as np
 import pandas as pd
 
+from arca230.instrumentation import count, timed
+from arca230.irfcache import load_component
+from arca230.memo import memoised
+
+
+logger = logging.getLogger(__name__)
+
 
 class EnergyResponse:
     """
@@ -7,10 +17,19 @@ class EnergyResponse:
     a reconstructed energy distribution for each true neutrino energy.
     """
 
-    def __init__(self, file_path="../data/energyresponse_numuCC_track.csv"):
+    data_table = "eresponse_data"
+    grid_arrays = ("true_logE_edges", "reco_logE_edges", "migration_matrix")
+
+    def __init__(self, file_path="../data/energyresponse_numuCC_track.csv", cache_dir=None):
         self.file_path = file_path
+
         self.eresponse_data = None
-        self.load_eresponse_data()
+        self.true_logE_edges = None
+        self.reco_logE_edges = None
+        self.migration_matrix = None
+        load_component(
+            self, self.data_table, self.grid_arrays, self.load_eresponse_data, self.build_migration_matrix, cache_dir
+        )
 
     def load_eresponse_data(self):
         """
@@ -18,50 +37,118 @@ class EnergyResponse:
         """
         try:
             self.eresponse_data = pd.read_csv(self.file_path, delimiter=",")
-            print("Energy response data loaded successfully.")
+            logger.info("Energy response data loaded successfully.")
         except FileNotFoundError:
-            print(f"Error: File '{self.file_path}' not found.")
+            raise RuntimeError(f"File '{self.file_path}' not found.")
         except Exception as e:
-            print(f"An error occurred while loading the data: {e}")
+            raise RuntimeError(f"An error occurred while loading the data: {e}")
 
-    def fraction_between_energy(self, logE, cutoff_low_logerec, cutoff_high_logerec):
+    def build_migration_matrix(self):
         """
-        Filters the energy response data for the given true neutrino energy
-        and calculates the fraction of events reconstructed within the specified bounds
+        Builds the dense migration matrix from the energy response data. Row i contains the normalised
+        distribution of reconstructed energy bins for true neutrino energy bin i. True energy bins without
+        any response are left as zeros.
+        """
+        data = self.eresponse_data
+
+        self.true_logE_edges = np.union1d(data["log10(nu_E [GeV]) low"], data["log10(nu_E [GeV]) high"])
+        self.reco_logE_edges = np.union1d(data["log10(reco_E [GeV]) low"], data["log10(reco_E [GeV]) high"])
+
+        # locate each row through its bin center to be robust against rounding of the edges
+        index_true = np.searchsorted(self.true_logE_edges, data["log10(nu_E [GeV]) center"].to_numpy()) - 1
+        index_reco = np.searchsorted(self.reco_logE_edges, data["log10(reco_E [GeV]) center"].to_numpy()) - 1
+
+        migration = np.zeros((len(self.true_logE_edges) - 1, len(self.reco_logE_edges) - 1))
+        np.add.at(migration, (index_true, index_reco), data["dP/dlog10(nu_E [GeV])"].to_numpy())
+
+        norm = migration.sum(axis=1, keepdims=True)
+        self.migration_matrix = np.divide(migration, norm, out=np.zeros_like(migration), where=norm > 0)
+
+    def true_energy_index(self, logE):
+        """
+        Find the true neutrino energy bin of the migration matrix for the given energies
 
         Parameters:
-        - logE: log of the true neutrino energy in GeV
-        - cutoff_low_logerec: lower bound of the log of the reconstructed energy in GeV
-        - cutoff_high_logerec: higher bound of the log of the reconstructed energy in GeV
+        - logE: log of the true neutrino energy in GeV, scalar or array
 
         Returns:
-        - Fraction of events within specified reconstructed energy range
+        - Index of the true energy bin, -1 for energies outside the binning
+        """
+        logE = np.asarray(logE, dtype=float)
+        index = np.searchsorted(self.true_logE_edges, logE, side="right") - 1
+        outside = (index < 0) | (index >= len(self.true_logE_edges) - 1)
+        return np.where(outside, -1, index)
+
+    def overlap_matrix(self, low_logerec, high_logerec):
+        """
+        Calculates the fraction of each reconstructed energy bin of the migration matrix that overlaps with
+        the given reconstructed energy ranges
+
+        Parameters:
+        - low_logerec: lower bounds of the log of the reconstructed energy in GeV, array
+        - high_logerec: higher bounds of the log of the reconstructed energy in GeV, array
+
+        Returns:
+        - Matrix of shape (n_reco, n_ranges) with the overlap fractions
+        """
+        low_logerec = np.atleast_1d(np.asarray(low_logerec, dtype=float))
+        high_logerec = np.atleast_1d(np.asarray(high_logerec, dtype=float))
+
+        bin_low = self.reco_logE_edges[:-1, np.newaxis]
+        bin_high = self.reco_logE_edges[1:, np.newaxis]
+
+        intersection = np.minimum(bin_high, high_logerec) - np.maximum(bin_low, low_logerec)
+        return np.clip(intersection, 0, None) / (bin_high - bin_low)
+
+    @timed("EnergyResponse.response_matrix")
+    def response_matrix(self, logE, low_logerec, high_logerec):
         """
+        Calculates the fraction of events at each true neutrino energy that is reconstructed within each of the
+        given reconstructed energy ranges, including partial overlaps with the reconstructed energy bins
 
-        logE_mask = (self.eresponse_data["log10(nu_E [GeV]) low"] <= logE) & (self.eresponse_data["log10(nu_E [GeV]) high"] > logE)
+        Parameters:
+        - logE: log of the true neutrino energies in GeV, array of length n_true
+        - low_logerec: lower bounds of the log of the reconstructed energy in GeV, array of length n_ranges
+        - high_logerec: higher bounds of the log of the reconstructed energy in GeV, array of length n_ranges
 
-        filtered_rows = self.eresponse_data[logE_mask]
+        Returns:
+        - Matrix of shape (n_true, n_ranges) with the fraction of events in each range
+        """
+        index = self.true_energy_index(np.atleast_1d(logE))
 
-        weight = 0
-        norm = 0
+        migration = np.where((index >= 0)[:, np.newaxis], self.migration_matrix[index], 0)
+        return migration @ self.overlap_matrix(low_logerec, high_logerec)
 
-        for _, row in filtered_rows.iterrows():
-            logE_low = row["log10(reco_E [GeV]) low"]
-            logE_high = row["log10(reco_E [GeV]) high"]
+    def smear(self, rates, logE, low_logerec, high_logerec):
+        """
+        Converts rates binned in true neutrino energy to rates binned in reconstructed energy
 
-            # Calculate the intersection of the ranges
-            intersection_low = max(logE_low, cutoff_low_logerec)
-            intersection_high = min(logE_high, cutoff_high_logerec)
+        Parameters:
+        - rates: rates per true energy, array of shape (n_true,) or (n_true, n_columns) to smear
+          several event tables at once
+        - logE: log of the true neutrino energies in GeV of the rates, array of length n_true
+        - low_logerec: lower bounds of the log of the reconstructed energy in GeV, array of length n_ranges
+        - high_logerec: higher bounds of the log of the reconstructed energy in GeV, array of length n_ranges
 
-            # Calculate the fraction in the range
-            fraction_in_range = max(0, intersection_high - intersection_low) / (logE_high - logE_low)
+        Returns:
+        - Rates per reconstructed energy range, array of shape (n_ranges,) or (n_ranges, n_columns)
+        """
+        return self.response_matrix(logE, low_logerec, high_logerec).T @ np.asarray(rates, dtype=float)
 
-            norm += row["dP/dlog10(nu_E [GeV])"]
-            weight += row["dP/dlog10(nu_E [GeV])"] * fraction_in_range
+    def fraction_between_energy(self, logE, cutoff_low_logerec, cutoff_high_logerec):
+        """
+        Filters the energy response data for the given true neutrino energy
+        and calculates the fraction of events reconstructed within the specified bounds
 
-        if norm == 0:
-            return 0
-        return weight / norm
+        Parameters:
+        - logE: log of the true neutrino energy in GeV
+        - cutoff_low_logerec: lower bound of the log of the reconstructed energy in GeV
+        - cutoff_high_logerec: higher bound of the log of the reconstructed energy in GeV
+
+        Returns:
+        - Fraction of events within specified reconstructed energy range
+        """
+        return self.response_matrix(logE, cutoff_low_logerec, cutoff_high_logerec).item()
 
     def energy_response(self, logE):
         """
@@ -84,6 +171,8 @@ class EnergyResponse:
         )
         return filtered_rows
 
+    @timed("EnergyResponse.reconstruct_event_table")
+    @memoised
     def reconstruct_event_table(self, event_rate_table):
         """
         Copies an event rate table with columns
@@ -118,31 +207,13 @@ class EnergyResponse:
             inplace=True,
         )
 
-        reconstructed_dataframe["rate [livetime^-1]"] = 0
-        reconstructed_dataframe["rate [livetime^-1]"] = reconstructed_dataframe["rate [livetime^-1]"].astype(float)
-
-        reconstructed_dataframe["rate_in_cone [livetime^-1]"] = 0
-        reconstructed_dataframe["rate_in_cone [livetime^-1]"] = reconstructed_dataframe["rate_in_cone [livetime^-1]"].astype(float)
-
-        # iterate over each true energy
-        for _, row_true in event_rate_table.iterrows():
-            true_logE_center = row_true["log10(nu_E [GeV]) center"]
-
-            rate = row_true["rate [livetime^-1]"]
-            rate_in_cone = row_true["rate_in_cone [livetime^-1]"]
-
-            # iterate over reconstructed energy
-            for index_reco, row_reco in reconstructed_dataframe.iterrows():
-                reco_E_low = row_reco["log10(reco_E [GeV]) low"]
-                reco_E_high = row_reco["log10(reco_E [GeV]) high"]
-
-                # calculates how many events are within the reconstructed energy bin
-                reconstructed_rate = rate * self.fraction_between_energy(true_logE_center, reco_E_low, reco_E_high)
-                reconstructed_rate_in_cone = rate_in_cone * self.fraction_between_energy(
-                    true_logE_center, reco_E_low, reco_E_high
-                )
-
-                reconstructed_dataframe.at[index_reco, "rate [livetime^-1]"] += reconstructed_rate
-                reconstructed_dataframe.at[index_reco, "rate_in_cone [livetime^-1]"] += reconstructed_rate_in_cone
+        columns = ["rate [livetime^-1]", "rate_in_cone [livetime^-1]"]
+        reconstructed_dataframe[columns] = self.smear(
+            event_rate_table[columns].to_numpy(dtype=float),
+            event_rate_table["log10(nu_E [GeV]) center"].to_numpy(),
+            reconstructed_dataframe["log10(reco_E [GeV]) low"].to_numpy(),
+            reconstructed_dataframe["log10(reco_E [GeV]) high"].to_numpy(),
+        )
 
+        count("EnergyResponse.reconstruct_event_table.rows", len(reconstructed_dataframe))
         return reconstructed_dataframe
@@ -1,3 +1,5 @@
+from abc import ABC, abstractmethod
+
 import numpy as np
 
 
@@ -25,3 +27,230 @@ class PointSourceFlux:
         - number of neutrinos per energy in GeV
         """
         return self.norm * np.power(10, -self.gamma * loge)
+
+
+def integrate_dNdE(dNdE, logE_low, logE_high, order=8):
+    """
+    Integrate a flux over energy bins with Gauss-Legendre quadrature in log10(E)
+
+    Parameters:
+    - dNdE: function of log10(E [GeV]) returning the flux, with the energy dimensions last
+    - logE_low: low edges of the bins, array of length n_energy
+    - logE_high: high edges of the bins, array of length n_energy
+    - order: number of quadrature nodes per bin
+
+    Returns:
+    - Number of neutrinos per bin, array with shape (..., n_energy)
+    """
+    logE_low = np.asarray(logE_low, dtype=float)
+    logE_high = np.asarray(logE_high, dtype=float)
+
+    nodes, weights = np.polynomial.legendre.leggauss(order)
+    half_width = 0.5 * (logE_high - logE_low)[:, np.newaxis]
+    loge = 0.5 * (logE_high + logE_low)[:, np.newaxis] + half_width * nodes
+
+    # dE = ln(10) E dlog10(E)
+    jacobian = half_width * weights * np.log(10) * np.power(10, loge)
+    return np.sum(dNdE(loge) * jacobian, axis=-1)
+
+
+def power_law_integral(gamma, norm, logE0, logE_low, logE_high):
+    """
+    Integral of the power law norm * (E / E0)^-gamma between two energies, all arguments are broadcast
+
+    Parameters:
+    - gamma: spectral index
+    - norm: flux at the pivot energy E0
+    - logE0: log10 of the pivot energy in GeV
+    - logE_low: log10 of the low energy in GeV
+    - logE_high: log10 of the high energy in GeV
+
+    Returns:
+    - number of neutrinos between the energies
+    """
+    low = logE_low - logE0
+    high = logE_high - logE0
+
+    # E0 * [(E/E0)^(1-gamma) / (1-gamma)], or E0 * ln(E/E0) for gamma = 1
+    index = 1 - gamma
+    with np.errstate(divide="ignore", invalid="ignore"):
+        power_law = (np.power(10, index * high) - np.power(10, index * low)) / index
+    logarithmic = np.log(10) * (high - low)
+
+    return norm * np.power(10, logE0) * np.where(np.abs(index) < 1e-8, logarithmic, power_law)
+
+
+class SpectralModel(ABC):
+    """
+    Base class of the vectorised spectral models. Every parameter may be an array, all parameters are broadcast
+    against each other to a grid of hypotheses with shape self.shape. Evaluating the model for an array of
+    energies gives an array with shape self.shape + logE.shape.
+    """
+
+    parameter_names = ()
+
+    @property
+    def shape(self):
+        return np.broadcast_shapes(*(np.shape(getattr(self, name)) for name in self.parameter_names))
+
+    def parameter(self, name, ndim):
+        """
+        Parameter broadcast to the grid of hypotheses, with ndim trailing axes added for the energies
+        """
+        value = np.broadcast_to(np.asarray(getattr(self, name), dtype=float), self.shape)
+        return value.reshape(value.shape + (1,) * ndim)
+
+    @abstractmethod
+    def dNdE(self, logE):
+        """
+        Calculate the number of neutrinos per energy in GeV
+
+        Parameters:
+        - logE: log of the true neutrino energy in GeV, array
+
+        Returns:
+        - number of neutrinos per energy in GeV, array with shape self.shape + logE.shape
+        """
+
+    def integral(self, logE_low, logE_high):
+        """
+        Calculate the number of neutrinos per energy bin
+
+        Parameters:
+        - logE_low: low edges of the bins, array of length n_energy
+        - logE_high: high edges of the bins, array of length n_energy
+
+        Returns:
+        - number of neutrinos per bin, array with shape self.shape + (n_energy,)
+        """
+        return integrate_dNdE(self.dNdE, logE_low, logE_high)
+
+
+class PowerLaw(SpectralModel):
+    """
+    Power law norm * (E / E0)^-gamma, equal to PointSourceFlux for the default pivot energy of 1 GeV
+    """
+
+    parameter_names = ("gamma", "norm", "logE0")
+
+    def __init__(self, gamma, norm, logE0=0.0):
+        self.gamma = gamma
+        self.norm = norm
+        self.logE0 = logE0
+
+    def dNdE(self, loge):
+        loge = np.asarray(loge, dtype=float)
+        gamma, norm, logE0 = (self.parameter(name, loge.ndim) for name in self.parameter_names)
+        return norm * np.power(10, -gamma * (loge - logE0))
+
+    def integral(self, logE_low, logE_high):
+        gamma, norm, logE0 = (self.parameter(name, 1) for name in self.parameter_names)
+        return power_law_integral(gamma, norm, logE0, np.asarray(logE_low, dtype=float), np.asarray(logE_high, dtype=float))
+
+
+class BrokenPowerLaw(SpectralModel):
+    """
+    Broken power law norm * (E / E_break)^-gamma1 below and norm * (E / E_break)^-gamma2 above the break energy
+    """
+
+    parameter_names = ("gamma1", "gamma2", "logE_break", "norm")
+
+    def __init__(self, gamma1, gamma2, logE_break, norm):
+        self.gamma1 = gamma1
+        self.gamma2 = gamma2
+        self.logE_break = logE_break
+        self.norm = norm
+
+    def dNdE(self, loge):
+        loge = np.asarray(loge, dtype=float)
+        gamma1, gamma2, logE_break, norm = (self.parameter(name, loge.ndim) for name in self.parameter_names)
+        gamma = np.where(loge < logE_break, gamma1, gamma2)
+        return norm * np.power(10, -gamma * (loge - logE_break))
+
+    def integral(self, logE_low, logE_high):
+        # exact integral by splitting the bins at the break into two power laws
+        gamma1, gamma2, logE_break, norm = (self.parameter(name, 1) for name in self.parameter_names)
+        low = np.asarray(logE_low, dtype=float)
+        high = np.asarray(logE_high, dtype=float)
+
+        below = power_law_integral(gamma1, norm, logE_break, np.minimum(low, logE_break), np.minimum(high, logE_break))
+        above = power_law_integral(gamma2, norm, logE_break, np.maximum(low, logE_break), np.maximum(high, logE_break))
+        return below + above
+
+
+class ExponentialCutoffPowerLaw(SpectralModel):
+    """
+    Power law with exponential cutoff norm * (E / E0)^-gamma * exp(-E / E_cut)
+    """
+
+    parameter_names = ("gamma", "norm", "logE_cut", "logE0")
+
+    def __init__(self, gamma, norm, logE_cut, logE0=0.0):
+        self.gamma = gamma
+        self.norm = norm
+        self.logE_cut = logE_cut
+        self.logE0 = logE0
+
+    def dNdE(self, loge):
+        loge = np.asarray(loge, dtype=float)
+        gamma, norm, logE_cut, logE0 = (self.parameter(name, loge.ndim) for name in self.parameter_names)
+        return norm * np.power(10, -gamma * (loge - logE0)) * np.exp(-np.power(10, loge - logE_cut))
+
+
+class LogParabola(SpectralModel):
+    """
+    Log-parabola norm * (E / E0)^(-alpha - beta * log10(E / E0))
+    """
+
+    parameter_names = ("alpha", "beta", "norm", "logE0")
+
+    def __init__(self, alpha, beta, norm, logE0=0.0):
+        self.alpha = alpha
+        self.beta = beta
+        self.norm = norm
+        self.logE0 = logE0
+
+    def dNdE(self, loge):
+        loge = np.asarray(loge, dtype=float)
+        alpha, beta, norm, logE0 = (self.parameter(name, loge.ndim) for name in self.parameter_names)
+        x = loge - logE0
+        return norm * np.power(10, -(alpha + beta * x) * x)
+
+
+class TabulatedSpectrum(SpectralModel):
+    """
+    Spectrum given as table, interpolated linearly in log10(E) and log10(dN/dE) and zero outside the table.
+    Several spectra on the same energies are given as rows of the table.
+    """
+
+    def __init__(self, logE, dNdE, norm=1.0):
+        self.logE = np.asarray(logE, dtype=float)
+        self.table = np.asarray(dNdE, dtype=float)
+        self.norm = norm
+
+        if self.table.shape[-1] != len(self.logE) or np.any(np.diff(self.logE) <= 0):
+            raise ValueError("logE needs to be increasing and match the last axis of dNdE")
+        if np.any(self.table < 0):
+            raise ValueError("dNdE needs to be non-negative")
+
+    @property
+    def shape(self):
+        return np.broadcast_shapes(self.table.shape[:-1], np.shape(self.norm))
+
+    def dNdE(self, loge):
+        loge = np.asarray(loge, dtype=float)
+        norm = np.broadcast_to(np.asarray(self.norm, dtype=float), self.shape).reshape(self.shape + (1,) * loge.ndim)
+
+        index = np.clip(np.searchsorted(self.logE, loge) - 1, 0, len(self.logE) - 2)
+        weight = (loge - self.logE[index]) / (self.logE[index + 1] - self.logE[index])
+
+        # zero entries give log10 = -inf, the interpolation towards them is zero. A node with weight 0 is left out,
+        # as 0 * -inf would give nan at the tabulated energies
+        with np.errstate(divide="ignore", invalid="ignore"):
+            log_table = np.log10(self.table)
+            low = np.where(weight < 1, (1 - weight) * log_table[..., index], 0)
+            high = np.where(weight > 0, weight * log_table[..., index + 1], 0)
+        log_flux = low + high
+
+        inside = (loge >= self.logE[0]) & (loge <= self.logE[-1])
+        return norm * np.where(inside, np.power(10, log_flux), 0)
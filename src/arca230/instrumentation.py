@@ -0,0 +1,119 @@
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+
+# recorders of the active instrument() blocks, the instrumented functions only check whether this list is empty
+_recorders = []
+
+
+class Recorder:
+    """
+    Collects the timers and counters reported by the instrumented stages while it is active. Timers measure the
+    inclusive wall time per call, so a stage that calls another instrumented stage also contains its time.
+    """
+
+    def __init__(self, callback=None):
+        self.timers = {}  # name -> [number of calls, total seconds]
+        self.counters = {}  # name -> total count
+        self.callback = callback
+
+    def record_time(self, name, seconds):
+        timer = self.timers.setdefault(name, [0, 0.0])
+        timer[0] += 1
+        timer[1] += seconds
+        if self.callback is not None:
+            self.callback("time", name, seconds)
+
+    def record_count(self, name, n):
+        self.counters[name] = self.counters.get(name, 0) + n
+        if self.callback is not None:
+            self.callback("count", name, n)
+
+    def summary(self):
+        """
+        Returns:
+        - Table with the number of calls and time per timer and the value of every counter, as text
+        """
+        lines = [f"{'timer':<50} {'calls':>8} {'total [ms]':>12} {'per call [ms]':>14}"]
+        for name, (calls, seconds) in sorted(self.timers.items()):
+            lines.append(f"{name:<50} {calls:>8d} {1000 * seconds:>12.3f} {1000 * seconds / calls:>14.4f}")
+        lines.append(f"{'counter':<50} {'value':>8}")
+        for name, value in sorted(self.counters.items()):
+            lines.append(f"{name:<50} {value:>8d}")
+        return "\n".join(lines)
+
+
+@contextmanager
+def instrument(callback=None):
+    """
+    Collect timers and counters of the instrumented stages within a with block. Blocks can be nested, every
+    active recorder receives all measurements. Measurements in worker processes are not collected.
+
+    Parameters:
+    - callback: optional function called with the kind ('time' or 'count'), name and value of every measurement
+
+    Returns:
+    - Recorder with the measurements of the block
+    """
+    recorder = Recorder(callback)
+    _recorders.append(recorder)
+    try:
+        yield recorder
+    finally:
+        _recorders.remove(recorder)
+
+
+def count(name, n=1):
+    """
+    Add n to a counter of the active recorders
+    """
+    if _recorders:
+        for recorder in _recorders:
+            recorder.record_count(name, int(n))
+
+
+@contextmanager
+def timer(name):
+    """
+    Measure the wall time of a with block for the active recorders
+    """
+    if not _recorders:
+        yield
+        return
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        for recorder in _recorders:
+            recorder.record_time(name, elapsed)
+
+
+def timed(name):
+    """
+    Decorator that measures the wall time of every call of a function for the active recorders. Without active
+    recorders the only overhead is a check of an empty list.
+
+    Parameters:
+    - name: name of the timer
+    """
+
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _recorders:
+                return function(*args, **kwargs)
+
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                for recorder in _recorders:
+                    recorder.record_time(name, elapsed)
+
+        return wrapper
+
+    return decorator
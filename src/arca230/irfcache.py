@@ -0,0 +1,267 @@
+import argparse
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from arca230.instrumentation import count, timer
+
+
+logger = logging.getLogger(__name__)
+
+
+cache_format_version = 1
+
+# tables and arrays mapped from the shared memory of another process (see shared.py), csv path -> (table, arrays)
+_shared_components = {}
+
+
+def default_cache_dir():
+    """
+    The cache directory used when none is given explicitly, taken from the environment variable ARCA230_CACHE_DIR
+
+    Returns:
+    - Path of the cache directory or None when the binary cache is disabled
+    """
+    return os.environ.get("ARCA230_CACHE_DIR") or None
+
+
+def file_checksum(file_path):
+    """
+    Calculates the sha256 checksum of a file
+
+    Parameters:
+    - file_path: path to the file
+
+    Returns:
+    - Hexadecimal checksum
+    """
+    checksum = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            checksum.update(block)
+    return checksum.hexdigest()
+
+
+def cache_path(file_path, checksum, cache_dir):
+    """
+    Location of the binary cache for a csv file with the given checksum. The checksum is part of the name,
+    such that a changed csv file never matches an old cache.
+
+    Parameters:
+    - file_path: path to the csv file
+    - checksum: sha256 checksum of the csv file
+    - cache_dir: directory containing all caches
+
+    Returns:
+    - Path of the cache directory for this file
+    """
+    name = os.path.splitext(os.path.basename(file_path))[0]
+    return os.path.join(cache_dir, f"{name}-v{cache_format_version}-{checksum[:16]}")
+
+
+def write_cache(path, file_path, checksum, table, arrays):
+    """
+    Writes the table columns and gridded arrays as .npy files together with a json header. The cache is written
+    to a temporary directory first and moved in place, so concurrent readers never see a partial cache.
+
+    Parameters:
+    - path: cache directory to create
+    - file_path: path to the source csv file
+    - checksum: sha256 checksum of the source csv file
+    - table: dataframe read from the csv file
+    - arrays: dictionary with the gridded arrays
+    """
+    parent = os.path.dirname(path)
+    os.makedirs(parent, exist_ok=True)
+    tmp_path = tempfile.mkdtemp(dir=parent, prefix=".tmp-")
+
+    header = {
+        "format_version": cache_format_version,
+        "source": os.path.abspath(file_path),
+        "sha256": checksum,
+        "columns": [],
+        "arrays": {},
+    }
+
+    for i, column in enumerate(table.columns):
+        np.save(os.path.join(tmp_path, f"column{i}.npy"), table[column].to_numpy())
+        header["columns"].append(column)
+
+    for name, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        np.save(os.path.join(tmp_path, f"{name}.npy"), array)
+        header["arrays"][name] = {"shape": list(array.shape), "dtype": array.dtype.str}
+
+    with open(os.path.join(tmp_path, "header.json"), "w") as f:
+        json.dump(header, f, indent=2)
+
+    try:
+        os.rename(tmp_path, path)
+        logger.debug("Wrote binary cache %s", path)
+    except OSError:
+        # another process wrote the same cache in the meantime
+        shutil.rmtree(tmp_path, ignore_errors=True)
+
+
+def read_cache(path, checksum):
+    """
+    Reads a binary cache written by write_cache. The arrays are memory mapped read-only, so no data is copied.
+
+    Parameters:
+    - path: cache directory
+    - checksum: expected sha256 checksum of the source csv file
+
+    Returns:
+    - Tuple of the table as dataframe and a dictionary with the gridded arrays, or None if the cache is missing
+      or does not match the checksum
+    """
+    try:
+        with open(os.path.join(path, "header.json")) as f:
+            header = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+    if header.get("format_version") != cache_format_version or header.get("sha256") != checksum:
+        return None
+
+    columns = header["columns"]
+    table = pd.DataFrame(
+        {column: np.load(os.path.join(path, f"column{i}.npy"), mmap_mode="r") for i, column in enumerate(columns)},
+        copy=False,
+    )
+    arrays = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r") for name in header["arrays"]}
+
+    return table, arrays
+
+
+def register_shared(file_path, table, arrays):
+    """
+    Register the table and gridded arrays of a csv file that are mapped from shared memory. Components created
+    afterwards for this file use them instead of parsing the csv file or reading the binary cache.
+
+    Parameters:
+    - file_path: path to the csv file
+    - table: dataframe of the csv file
+    - arrays: dictionary with the gridded arrays
+    """
+    _shared_components[os.path.realpath(file_path)] = (table, arrays)
+
+
+def unregister_shared(file_path=None):
+    """
+    Stop using shared memory for a csv file, or for all files without file_path. Components that were already
+    created keep their arrays.
+    """
+    if file_path is None:
+        _shared_components.clear()
+    else:
+        _shared_components.pop(os.path.realpath(file_path), None)
+
+
+def load_component(component, table_name, array_names, load_table, build_arrays, cache_dir=None):
+    """
+    Loads the table and gridded arrays of an instrument response function component. When a cache directory is
+    configured, the arrays are taken from a matching binary cache, or built from the csv file and written to the
+    cache. Without cache directory the csv file is always parsed. Arrays registered with register_shared take
+    precedence over both.
+
+    Parameters:
+    - component: object with a file_path attribute on which the table and arrays are set as attributes
+    - table_name: attribute name of the dataframe
+    - array_names: attribute names of the gridded arrays
+    - load_table: function that reads the csv file into the table attribute
+    - build_arrays: function that builds the gridded arrays from the table attribute
+    - cache_dir: cache directory, defaults to default_cache_dir()
+
+    Returns:
+    - True if the component was loaded from the binary cache or shared memory
+    """
+    cache_dir = cache_dir or default_cache_dir()
+    name = type(component).__name__
+
+    with timer(f"{name}.load"):
+        if _shared_components:
+            shared = _shared_components.get(os.path.realpath(component.file_path))
+            if shared is not None:
+                table, arrays = shared
+                setattr(component, table_name, table)
+                for array_name in array_names:
+                    setattr(component, array_name, arrays[array_name])
+                count("irfcache.shared")
+                return True
+
+        if cache_dir is not None:
+            checksum = file_checksum(component.file_path)
+            path = cache_path(component.file_path, checksum, cache_dir)
+            cached = read_cache(path, checksum)
+
+            if cached is not None:
+                table, arrays = cached
+                setattr(component, table_name, table)
+                for array_name in array_names:
+                    setattr(component, array_name, arrays[array_name])
+                logger.debug("Loaded %s from binary cache %s", component.file_path, path)
+                count("irfcache.hit")
+                count(f"{name}.rows_loaded", len(table))
+                return True
+
+            count("irfcache.miss")
+
+        load_table()
+        build_arrays()
+        count(f"{name}.rows_loaded", len(getattr(component, table_name)))
+
+        if cache_dir is not None:
+            arrays = {array_name: getattr(component, array_name) for array_name in array_names}
+            write_cache(path, component.file_path, checksum, getattr(component, table_name), arrays)
+
+    return False
+
+
+def convert_directory(data_dir, cache_dir):
+    """
+    Converts all instrument response function csv files in a directory to the binary cache format
+
+    Parameters:
+    - data_dir: directory with the csv files
+    - cache_dir: directory in which the caches are written
+
+    Returns:
+    - List of converted csv files
+    """
+    from arca230.aeff import EffectiveArea
+    from arca230.background import BackgroundComponent
+    from arca230.energyresponse import EnergyResponse
+    from arca230.psf import PointSpreadFunction
+
+    components = {
+        "aeff": EffectiveArea,
+        "psf": PointSpreadFunction,
+        "energyresponse": EnergyResponse,
+        "bkg": BackgroundComponent,
+    }
+
+    converted = []
+    for file_name in sorted(os.listdir(data_dir)):
+        prefix = file_name.split("_")[0]
+        if file_name.endswith(".csv") and prefix in components:
+            components[prefix](file_path=os.path.join(data_dir, file_name), cache_dir=cache_dir)
+            converted.append(file_name)
+
+    return converted
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert the ARCA230 IRF csv files to the binary cache format")
+    parser.add_argument("data_dir", help="directory with the csv files")
+    parser.add_argument("cache_dir", help="directory in which the caches are written")
+    args = parser.parse_args()
+
+    for file_name in convert_directory(args.data_dir, args.cache_dir):
+        print(f"Converted {file_name}")
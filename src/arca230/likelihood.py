@@ -0,0 +1,247 @@
+import numpy as np
+
+from arca230.flux import PowerLaw
+from arca230.sweep import livetime_1yr
+
+
+def fit_signal_events(counts, template, background, iterations=50, tolerance=1e-8):
+    """
+    Fit the number of signal events on top of a fixed background for many trials at once. The negative log
+    likelihood is convex in ns, so Newton iterations starting from the total number of events converge
+    monotonically. Only the trials that did not converge yet are iterated.
+
+    Parameters:
+    - counts: observed events, array with shape (n_trials,) + template.shape
+    - template: signal expectation per bin normalised to one event, array of any shape
+    - background: background expectation per bin, array with the shape of the template
+    - iterations: maximum number of Newton iterations
+    - tolerance: stop when all steps are smaller than this number of events
+
+    Returns:
+    - Tuple of arrays with shape (n_trials,): best fit ns and test statistic
+    """
+    template = np.ravel(template)
+    background = np.ravel(background)
+    counts = np.asarray(counts).reshape(-1, len(template))
+
+    # bins without signal do not depend on ns and drop out of the fit and the test statistic
+    signal_bins = template > 0
+    template = template[signal_bins]
+    background = background[signal_bins]
+    counts = counts[:, signal_bins].astype(float)
+
+    def derivatives(ns, counts):
+        mu = ns[:, np.newaxis] * template + background
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ratio = np.where(counts > 0, counts / mu, 0)
+        return np.sum(template * (1 - ratio), axis=-1), np.sum(ratio / mu * template**2, axis=-1)
+
+    # ns = 0 is the best fit when the likelihood increases from there
+    first, _ = derivatives(np.zeros(len(counts)), counts)
+    active = np.flatnonzero(~(first >= 0))
+
+    ns = np.zeros(len(counts))
+    ns[active] = counts[active].sum(axis=-1)
+    for _ in range(iterations):
+        if len(active) == 0:
+            break
+        first, second = derivatives(ns[active], counts[active])
+        with np.errstate(divide="ignore", invalid="ignore"):
+            step = np.where(second > 0, first / second, 0)
+        ns[active] = np.maximum(ns[active] - step, 0.5 * ns[active])
+        active = active[np.abs(step) >= tolerance]
+
+    # 2 * (log L(ns) - log L(0)) = 2 * sum(n * log(1 + ns * template / background) - ns * template)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        log_ratio = np.where(counts > 0, np.log1p(ns[:, np.newaxis] * template / background), 0)
+    ts = 2 * np.sum(counts * log_ratio - ns[:, np.newaxis] * template, axis=-1)
+
+    return ns, ts
+
+
+class BinnedLikelihood:
+    """
+    Binned Poisson likelihood of the events within a search cone in bins of reconstructed energy for a power law
+    point source on top of the background. The free parameters are the number of signal events ns and the
+    spectral index gamma. Signal templates are precomputed on a fine grid of gamma and interpolated with cubic
+    Hermite splines, such that the likelihood has a continuous gradient.
+    """
+
+    def __init__(self, irfs, sindec, cone=1.0, livetime=livetime_1yr, gamma_grid=None):
+        """
+        Parameters:
+        - irfs: tuple with the EffectiveArea, PointSpreadFunction, EnergyResponse and BackgroundComponent
+        - sindec: Source location
+        - cone: size of the search cone in degrees
+        - livetime: in seconds
+        - gamma_grid: increasing and equally spaced spectral indices on which the templates are calculated,
+          defaults to 1 to 4 in steps of 0.01
+        """
+        aeff, psf, eres, bkg = irfs
+
+        self.sindec = sindec
+        self.cone = cone
+        self.livetime = livetime
+        self.gamma_grid = np.arange(1.0, 4.0001, 0.01) if gamma_grid is None else np.asarray(gamma_grid, dtype=float)
+        self.gamma_step = self.gamma_grid[1] - self.gamma_grid[0]
+        self.reco_logE_edges = bkg.logE_edges
+
+        # events per unit flux normalisation in each reconstructed energy bin, for all spectral indices at once
+        kernel = aeff.flux_kernel([sindec], livetime)[0]
+        fraction_in_cone = psf.containment_fraction(aeff.logE_centers, cone, fill_value=0)
+        response = eres.response_matrix(aeff.logE_centers, self.reco_logE_edges[:-1], self.reco_logE_edges[1:])
+        signal = aeff.bin_integrated_flux(PowerLaw(self.gamma_grid, 1)) @ ((kernel * fraction_in_cone)[:, np.newaxis] * response)
+
+        # templates are normalised to one event, the total is the number of events per unit flux normalisation
+        self.signal_total = signal.sum(axis=1)
+        if np.any(self.signal_total <= 0):
+            raise ValueError(f"No signal expected within {cone} degrees of sindec {sindec}")
+        self.signal_templates = signal / self.signal_total[:, np.newaxis]
+        self.signal_slopes = np.gradient(self.signal_templates, self.gamma_step, axis=0)
+
+        self.background = bkg.event_rate_matrix(sindec, [cone], livetime)[0, 0]
+
+    def signal_template(self, gamma):
+        """
+        Interpolate the normalised signal template and its derivative with respect to gamma
+
+        Parameters:
+        - gamma: spectral index, array
+
+        Returns:
+        - Tuple of arrays with shape gamma.shape + (n_energy,): template and derivative
+        """
+        gamma = np.asarray(gamma, dtype=float)
+        if np.any((gamma < self.gamma_grid[0]) | (gamma > self.gamma_grid[-1])):
+            raise ValueError(f"gamma needs to be within {self.gamma_grid[0]} and {self.gamma_grid[-1]}: {gamma}")
+
+        position = (gamma - self.gamma_grid[0]) / self.gamma_step
+        index = np.clip(position.astype(int), 0, len(self.gamma_grid) - 2)
+        t = (position - index)[..., np.newaxis]
+
+        low = self.signal_templates[index]
+        high = self.signal_templates[index + 1]
+        slope_low = self.signal_slopes[index] * self.gamma_step
+        slope_high = self.signal_slopes[index + 1] * self.gamma_step
+
+        template = (
+            (2 * t**3 - 3 * t**2 + 1) * low
+            + (t**3 - 2 * t**2 + t) * slope_low
+            + (-2 * t**3 + 3 * t**2) * high
+            + (t**3 - t**2) * slope_high
+        )
+        derivative = (
+            (6 * t**2 - 6 * t) * low
+            + (3 * t**2 - 4 * t + 1) * slope_low
+            + (-6 * t**2 + 6 * t) * high
+            + (3 * t**2 - 2 * t) * slope_high
+        ) / self.gamma_step
+
+        return template, derivative
+
+    def flux_normalisation(self, ns, gamma):
+        """
+        Convert a number of signal events to the flux normalisation in GeV-1 s-1 m-2 at 1 GeV
+        """
+        return ns / np.interp(gamma, self.gamma_grid, self.signal_total)
+
+    def expectation(self, ns, gamma):
+        """
+        Expected events per reconstructed energy bin, array with shape broadcast(ns, gamma).shape + (n_energy,)
+        """
+        template, _ = self.signal_template(gamma)
+        return np.asarray(ns, dtype=float)[..., np.newaxis] * template + self.background
+
+    def negative_log_likelihood(self, counts, ns, gamma):
+        """
+        Calculate the negative log likelihood, without the constant log(n!) terms, and its gradient. All
+        arguments are broadcast, so many trials and parameter values are evaluated at once.
+
+        Parameters:
+        - counts: observed events per reconstructed energy bin, array with shape (..., n_energy)
+        - ns: number of signal events, array
+        - gamma: spectral index, array
+
+        Returns:
+        - Tuple with the negative log likelihood and its gradients with respect to ns and gamma, arrays with the
+          broadcast shape of the arguments
+        """
+        counts = np.asarray(counts, dtype=float)
+        ns = np.asarray(ns, dtype=float)[..., np.newaxis]
+        template, derivative = self.signal_template(gamma)
+
+        mu = ns * template + self.background
+        observed = counts > 0
+        with np.errstate(divide="ignore", invalid="ignore"):
+            log_mu = np.where(observed, np.log(mu), 0)
+            ratio = np.where(observed, counts / mu, 0)
+
+        value = np.sum(mu - counts * log_mu, axis=-1)
+        gradient_ns = np.sum(template * (1 - ratio), axis=-1)
+        gradient_gamma = np.sum(ns * derivative * (1 - ratio), axis=-1)
+
+        return value, gradient_ns, gradient_gamma
+
+    def test_statistic(self, counts, ns, gamma):
+        """
+        Likelihood ratio test statistic 2 * (log L(ns, gamma) - log L(0)) of the given parameters
+        """
+        value, _, _ = self.negative_log_likelihood(counts, ns, gamma)
+        background_only, _, _ = self.negative_log_likelihood(counts, 0, self.gamma_grid[0])
+        return 2 * (background_only - value)
+
+    def fit_ns(self, counts, gamma, iterations=50, tolerance=1e-8):
+        """
+        Fit the number of signal events for a fixed spectral index, vectorised over trials (see fit_signal_events)
+
+        Parameters:
+        - counts: observed events per reconstructed energy bin, array with shape (n_trials, n_energy)
+        - gamma: spectral index
+        - iterations: maximum number of Newton iterations
+        - tolerance: stop when all steps are smaller than this number of events
+
+        Returns:
+        - Tuple of arrays with shape (n_trials,): best fit ns and test statistic
+        """
+        template, _ = self.signal_template(gamma)
+        return fit_signal_events(counts, template, self.background, iterations, tolerance)
+
+    def fit(self, counts, ns=None, gamma=2.0):
+        """
+        Fit the number of signal events and the spectral index with L-BFGS-B using the analytic gradient
+
+        Parameters:
+        - counts: observed events per reconstructed energy bin, array of length n_energy
+        - ns: starting value for the number of signal events, defaults to the fit at the starting gamma
+        - gamma: starting value for the spectral index
+
+        Returns:
+        - Dictionary with the best fit ns, gamma, flux normalisation, test statistic and negative log likelihood
+        """
+        from scipy.optimize import minimize
+
+        counts = np.asarray(counts, dtype=float)
+        if ns is None:
+            ns = self.fit_ns(counts, gamma)[0][0]
+
+        def objective(parameters):
+            value, gradient_ns, gradient_gamma = self.negative_log_likelihood(counts, parameters[0], parameters[1])
+            return float(value), np.array([gradient_ns, gradient_gamma], dtype=float)
+
+        result = minimize(
+            objective,
+            [ns, gamma],
+            jac=True,
+            method="L-BFGS-B",
+            bounds=[(0, None), (self.gamma_grid[0], self.gamma_grid[-1])],
+        )
+        best_ns, best_gamma = result.x
+
+        return {
+            "ns": best_ns,
+            "gamma": best_gamma,
+            "norm [GeV-1 s-1 m-2]": self.flux_normalisation(best_ns, best_gamma),
+            "ts": max(float(self.test_statistic(counts, best_ns, best_gamma)), 0.0),
+            "nll": result.fun,
+            "converged": result.success,
+        }
@@ -0,0 +1,278 @@
+import hashlib
+import logging
+import os
+import pickle
+import sys
+import tempfile
+from contextlib import contextmanager
+from functools import wraps
+
+import numpy as np
+
+from arca230.instrumentation import count
+
+
+logger = logging.getLogger(__name__)
+
+memo_format_version = 1
+
+# the cache is trimmed to this size, taken from the environment variable ARCA230_MEMO_MAX_BYTES
+default_max_bytes = 1 << 30
+
+# the size of the cache is checked after this number of writes per process
+eviction_interval = 32
+
+_disabled = 0
+_writes = 0
+_checksums = {}  # (path, mtime, size) -> sha256 of the file
+
+
+def memo_dir():
+    """
+    The directory of the memoised results: the environment variable ARCA230_MEMO_DIR, or the subdirectory
+    'derived' of the binary IRF cache directory (see irfcache.default_cache_dir)
+
+    Returns:
+    - Path of the directory, or None when memoisation is off. It is off without a configured directory, with the
+      environment variable ARCA230_NO_MEMO set or within a disabled() block
+    """
+    if _disabled or os.environ.get("ARCA230_NO_MEMO"):
+        return None
+
+    directory = os.environ.get("ARCA230_MEMO_DIR")
+    if directory:
+        return directory
+
+    from arca230.irfcache import default_cache_dir
+
+    cache_dir = default_cache_dir()
+    return os.path.join(cache_dir, "derived") if cache_dir else None
+
+
+def max_bytes():
+    return int(os.environ.get("ARCA230_MEMO_MAX_BYTES", default_max_bytes))
+
+
+@contextmanager
+def disabled():
+    """
+    Turn memoisation off within a with block, results are neither read from nor written to the cache
+    """
+    global _disabled
+    _disabled += 1
+    try:
+        yield
+    finally:
+        _disabled -= 1
+
+
+def source_checksum(file_path):
+    """
+    Checksum of an input file, calculated once per version of the file
+    """
+    from arca230.irfcache import file_checksum
+
+    status = os.stat(file_path)
+    key = (os.path.abspath(file_path), status.st_mtime_ns, status.st_size)
+    if key not in _checksums:
+        _checksums[key] = file_checksum(file_path)
+    return _checksums[key]
+
+
+def _update_hash(checksum, value):
+    # feed a canonical representation of the value to the hash, with the type as prefix to avoid collisions.
+    # pandas is only looked up when it was imported, otherwise the value cannot be a dataframe
+    pd = sys.modules.get("pandas")
+
+    if pd is not None and isinstance(value, pd.DataFrame):
+        checksum.update(b"dataframe")
+        _update_hash(checksum, list(value.columns))
+        checksum.update(pd.util.hash_pandas_object(value, index=True).to_numpy().tobytes())
+    elif pd is not None and isinstance(value, pd.Series):
+        checksum.update(b"series")
+        _update_hash(checksum, value.name)
+        checksum.update(pd.util.hash_pandas_object(value, index=True).to_numpy().tobytes())
+    elif isinstance(value, (np.ndarray, np.generic)):
+        value = np.ascontiguousarray(value)
+        checksum.update(f"array{value.dtype.str}{value.shape}".encode())
+        checksum.update(value.tobytes())
+    elif isinstance(value, (list, tuple)):
+        checksum.update(f"{type(value).__name__}{len(value)}".encode())
+        for item in value:
+            _update_hash(checksum, item)
+    elif isinstance(value, dict):
+        checksum.update(f"dict{len(value)}".encode())
+        for name in sorted(value):
+            _update_hash(checksum, name)
+            _update_hash(checksum, value[name])
+    elif value is None or isinstance(value, (bool, int, float, str)):
+        checksum.update(f"{type(value).__name__}:{value!r}".encode())
+    elif hasattr(value, "__dict__"):
+        # objects like fluxes are identified by their class and attributes
+        checksum.update(f"object{type(value).__module__}.{type(value).__qualname__}".encode())
+        _update_hash(checksum, vars(value))
+    else:
+        raise TypeError(f"Cannot memoise an argument of type {type(value).__name__}")
+
+
+def memo_key(name, source, args, kwargs):
+    """
+    Content address of a result: the sha256 of the format version, the function name, the checksum of the input
+    file and the arguments
+
+    Parameters:
+    - name: qualified name of the function
+    - source: checksum of the input file, or None for functions that do not depend on a file
+    - args: positional arguments
+    - kwargs: keyword arguments
+
+    Returns:
+    - Hexadecimal key
+    """
+    checksum = hashlib.sha256()
+    _update_hash(checksum, (memo_format_version, name, source, tuple(args), kwargs))
+    return checksum.hexdigest()
+
+
+def entry_path(directory, key):
+    return os.path.join(directory, key[:2], f"{key}.pkl")
+
+
+def read_entry(path):
+    """
+    Read a memoised result and mark it as recently used
+
+    Returns:
+    - Tuple (True, result) on a hit, (False, None) when the entry is missing or unreadable
+    """
+    try:
+        with open(path, "rb") as f:
+            result = pickle.load(f)
+    except FileNotFoundError:
+        return False, None
+    except Exception as e:
+        logger.warning("Ignoring unreadable memo entry %s: %s", path, e)
+        return False, None
+
+    try:
+        os.utime(path)
+    except OSError:
+        # the entry was evicted by another process in the meantime
+        pass
+    return True, result
+
+
+def write_entry(path, result):
+    """
+    Write a result to a temporary file first and move it in place, so concurrent readers never see a partial entry
+    """
+    global _writes
+
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+
+    handle, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+    try:
+        with os.fdopen(handle, "wb") as f:
+            pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    _writes += 1
+    if _writes % eviction_interval == 1:
+        evict(os.path.dirname(directory), max_bytes())
+
+
+def evict(directory, limit):
+    """
+    Remove the least recently used entries until the cache is at most 80% of limit
+
+    Parameters:
+    - directory: memo directory
+    - limit: maximum size in bytes
+
+    Returns:
+    - Number of removed entries
+    """
+    entries = []
+    for root, _, files in os.walk(directory):
+        for name in files:
+            if name.endswith(".pkl"):
+                try:
+                    status = os.stat(os.path.join(root, name))
+                except FileNotFoundError:
+                    continue
+                entries.append((status.st_mtime_ns, status.st_size, os.path.join(root, name)))
+
+    total = sum(size for _, size, _ in entries)
+    if total <= limit:
+        return 0
+
+    removed = 0
+    for _, size, path in sorted(entries):
+        if total <= 0.8 * limit:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+        removed += 1
+
+    logger.debug("Evicted %d memo entries from %s", removed, directory)
+    return removed
+
+
+def clear(directory=None):
+    """
+    Remove all memoised results
+
+    Parameters:
+    - directory: memo directory, defaults to memo_dir()
+    """
+    directory = directory or memo_dir()
+    if directory is not None and os.path.isdir(directory):
+        evict(directory, 0)
+
+
+def memoised(function):
+    """
+    Decorator that memoises the results of a function on disk. For methods of the IRF classes the checksum of
+    the csv file of the instance is part of the key, so a changed input file never matches old results.
+    Without a memo directory the function is called directly.
+    """
+    name = f"{function.__module__}.{function.__qualname__}"
+
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        directory = memo_dir()
+        if directory is None:
+            return function(*args, **kwargs)
+
+        # for methods the instance is identified by its input file instead of its attributes
+        file_path = getattr(args[0], "file_path", None) if args else None
+        try:
+            if file_path is not None:
+                key = memo_key(name, source_checksum(file_path), args[1:], kwargs)
+            else:
+                key = memo_key(name, None, args, kwargs)
+        except TypeError:
+            # arguments without a canonical representation are not memoised
+            count("memo.unhashable")
+            return function(*args, **kwargs)
+
+        path = entry_path(directory, key)
+        hit, result = read_entry(path)
+        if hit:
+            count("memo.hit")
+            return result
+
+        count("memo.miss")
+        result = function(*args, **kwargs)
+        write_entry(path, result)
+        return result
+
+    return wrapper
@@ -0,0 +1,126 @@
+import numpy as np
+import pandas as pd
+
+from arca230.sweep import livetime_1yr
+from arca230.utils import mean_limit, nobs_disc
+
+
+def event_tables(irfs, sindec, flux, cones, livetime=livetime_1yr):
+    """
+    Calculate the expected signal and background events per search cone and reconstructed energy bin of the
+    background for a single source. The background is integrated over each cone, also where it extends over
+    neighbouring sin(dec) bins (see BackgroundComponent.cone_event_rate_matrix)
+
+    Parameters:
+    - irfs: tuple with the EffectiveArea, PointSpreadFunction, EnergyResponse and BackgroundComponent
+    - sindec: Source location
+    - flux: PointSourceFlux object (see flux.py)
+    - cones: sizes of the search cone in degrees, at most 90, array of length n_cone
+    - livetime: in seconds
+
+    Returns:
+    - Tuple with the signal and background events, arrays with shape (n_cone, n_energy), and the reconstructed
+      energy bin edges
+    """
+    aeff, psf, eres, bkg = irfs
+    cones = np.atleast_1d(np.asarray(cones, dtype=float))
+    reco_edges = bkg.logE_edges
+
+    rates = aeff.event_rate_matrix(flux, sindec, livetime)[0]
+    fraction_in_cone = psf.containment_fraction(aeff.logE_centers[:, np.newaxis], cones, fill_value=0)
+    response = eres.response_matrix(aeff.logE_centers, reco_edges[:-1], reco_edges[1:])
+
+    signal = (rates[:, np.newaxis] * fraction_in_cone).T @ response
+    background = bkg.cone_event_rate_matrix(sindec, cones, livetime)[0]
+
+    return signal, background, reco_edges
+
+
+def cumulative_tables(signal, background):
+    """
+    Cumulative sums of the event tables along reconstructed energy with a leading zero, such that the events
+    between reconstructed energy edges lo and hi are table[..., hi] - table[..., lo]
+
+    Parameters:
+    - signal: signal events, array with shape (n_cone, n_energy)
+    - background: background events, array with shape (n_cone, n_energy)
+
+    Returns:
+    - Tuple of the cumulative signal and background, arrays with shape (n_cone, n_energy + 1)
+    """
+    cumulative_signal = np.zeros((signal.shape[0], signal.shape[1] + 1))
+    cumulative_signal[:, 1:] = np.cumsum(signal, axis=1)
+
+    cumulative_background = np.zeros((background.shape[0], background.shape[1] + 1))
+    cumulative_background[:, 1:] = np.cumsum(background, axis=1)
+
+    return cumulative_signal, cumulative_background
+
+
+def optimise_cuts(
+    irfs,
+    sindec,
+    flux,
+    cones=None,
+    livetime=livetime_1yr,
+    objective="discovery",
+    confidence_level=0.9,
+    significance=0.0026,
+    power=0.5,
+):
+    """
+    Search the search cone and reconstructed energy window that give the lowest discovery flux or mean limit
+    of the cut-and-count analysis for a source. All combinations of cone, E_min and E_max on the reconstructed
+    energy binning of the background are evaluated at once from cumulative signal and background tables.
+
+    Parameters:
+    - irfs: tuple with the EffectiveArea, PointSpreadFunction, EnergyResponse and BackgroundComponent
+    - sindec: Source location
+    - flux: PointSourceFlux object (see flux.py), the result is a flux normalisation in the same units
+    - cones: sizes of the search cone in degrees, array, defaults to 41 cones from 0.1 to 10 degrees
+    - livetime: in seconds
+    - objective: 'discovery' to minimise the discovery flux or 'limit' to minimise the mean limit on the flux
+    - confidence_level: confidence level of the limit
+    - significance: p-value for discovery
+    - power: probability to reach the significance for the discovery flux
+
+    Returns:
+    - Tuple with a dictionary describing the optimal cuts and a dataframe with all evaluated cuts
+    """
+    if objective not in ("discovery", "limit"):
+        raise ValueError(f"Unknown objective {objective}, use 'discovery' or 'limit'")
+
+    cones = np.logspace(-1, 1, 41) if cones is None else np.atleast_1d(np.asarray(cones, dtype=float))
+    signal, background, reco_edges = event_tables(irfs, sindec, flux, cones, livetime)
+    cumulative_signal, cumulative_background = cumulative_tables(signal, background)
+
+    # all energy windows lo < hi as index pairs into the reconstructed energy edges
+    low, high = np.triu_indices(len(reco_edges), k=1)
+
+    window_signal = cumulative_signal[:, high] - cumulative_signal[:, low]
+    window_background = np.clip(cumulative_background[:, high] - cumulative_background[:, low], 0, None)
+
+    if objective == "discovery":
+        nobs = nobs_disc(window_background, significance, power)
+    else:
+        nobs = mean_limit(window_background, confidence_level)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        window_flux = np.where(window_signal > 0, flux.norm * nobs / window_signal, np.inf)
+
+    table = pd.DataFrame(
+        {
+            "cone [degrees]": np.repeat(cones, len(low)),
+            "log10(reco_E [GeV]) min": np.tile(reco_edges[low], len(cones)),
+            "log10(reco_E [GeV]) max": np.tile(reco_edges[high], len(cones)),
+            "signal": window_signal.ravel(),
+            "background": window_background.ravel(),
+            "nobs": nobs.ravel(),
+            "flux [GeV-1 s-1 m-2]": window_flux.ravel(),
+        }
+    )
+
+    best = table.iloc[int(np.argmin(window_flux.ravel()))].to_dict()
+    best["objective"] = objective
+
+    return best, table
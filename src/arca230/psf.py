@@ -1,6 +1,14 @@
+import logging
+
 import pandas as pd
 import numpy as np
-from scipy.interpolate import interp1d
+
+from arca230.instrumentation import count, timed
+from arca230.irfcache import load_component
+from arca230.memo import memoised
+
+
+logger = logging.getLogger(__name__)
 
 
 class PointSpreadFunction:
@@ -10,13 +18,21 @@ class PointSpreadFunction:
     for different true neutrino energy ranges.
     """
 
-    def __init__(self, file_path="../data/psf_numuCC_track.csv"):
+    data_table = "psf_data"
+    grid_arrays = ("logE_edges", "log_psi_grid", "dp_domega", "containment")
+
+    def __init__(self, file_path="../data/psf_numuCC_track.csv", cache_dir=None):
         self.file_path = file_path
+
         self.psf_data = None
-        self.load_psf_data()
+        self.logE_edges = None
+        self.log_psi_grid = None
+        self.dp_domega = None
+        self.containment = None
+        load_component(self, self.data_table, self.grid_arrays, self.load_psf_data, self.build_psf_grid, cache_dir)
 
+        # the scipy interpolations are only created on first use, see get_interpolation_for_energy
         self.interpolations = {}
-        self.interpolate_psf()
 
     def load_psf_data(self):
         """
@@ -24,11 +40,11 @@ class PointSpreadFunction:
         """
         try:
             self.psf_data = pd.read_csv(self.file_path, delimiter=",")
-            print("Point Spread Function data loaded successfully.")
+            logger.info("Point Spread Function data loaded successfully.")
         except FileNotFoundError:
-            print(f"Error: File '{self.file_path}' not found.")
+            raise RuntimeError(f"File '{self.file_path}' not found.")
         except Exception as e:
-            print(f"An error occurred while loading the data: {e}")
+            raise RuntimeError(f"An error occurred while loading the data: {e}")
 
     def psf_response(self, logE):
         """
@@ -48,24 +64,63 @@ class PointSpreadFunction:
 
     def interpolate_psf(self):
         """
-        Interpolate the point spread function data and store the results for each unique energy range.
+        Interpolate the gridded point spread function and store the results for each unique energy range.
         """
-        for _, row in self.psf_data.iterrows():
-            logE_low = row["log10(nu_E [GeV]) low"]
-            logE_high = row["log10(nu_E [GeV]) high"]
+        from scipy.interpolate import interp1d
 
-            # Check if the pair is already encountered
-            if (logE_low, logE_high) in self.interpolations:
-                continue
+        for i in range(len(self.logE_edges) - 1):
+            self.interpolations[(self.logE_edges[i], self.logE_edges[i + 1])] = interp1d(
+                x=self.log_psi_grid, y=self.dp_domega[i], kind="linear", copy=False, assume_sorted=True
+            )
 
-            filtered_df = self.psf_data[
-                (self.psf_data["log10(nu_E [GeV]) low"] == logE_low)
-                & (self.psf_data["log10(nu_E [GeV]) high"] == logE_high)
-            ]
+    def build_psf_grid(self):
+        """
+        Store the point spread function as a dense array of dP/dOmega with shape (n_energy, n_psi), with the
+        true neutrino energy bin edges and the common log10(psi [degrees]) grid shared by all energy bins,
+        and build the containment table from it.
+        """
+        data = self.psf_data
 
-            self.interpolations[(logE_low, logE_high)] = interp1d(
-                x=filtered_df["log10(psi [degrees])"], y=filtered_df["dP/dOmega"], kind="linear"
-            )
+        self.logE_edges = np.union1d(data["log10(nu_E [GeV]) low"], data["log10(nu_E [GeV]) high"])
+        self.log_psi_grid = np.unique(data["log10(psi [degrees])"])
+
+        index_energy = np.searchsorted(self.logE_edges, data["log10(nu_E [GeV]) center"].to_numpy()) - 1
+        index_psi = np.searchsorted(self.log_psi_grid, data["log10(psi [degrees])"].to_numpy())
+
+        self.dp_domega = np.zeros((len(self.logE_edges) - 1, len(self.log_psi_grid)))
+        self.dp_domega[index_energy, index_psi] = data["dP/dOmega"].to_numpy()
+
+        self.build_containment_table()
+
+    def build_containment_table(self):
+        """
+        Integrate dP/dOmega over the sphere with the trapezoidal rule on the log10(psi [degrees]) grid and store the
+        normalised cumulative containment, i.e. the fraction of events within psi, for each energy bin.
+        Energy bins for which the point spread function integrates to zero are stored as zeros.
+        """
+        integrand = self.dp_domega * self.d_omega_d_loga(self.log_psi_grid)
+        steps = 0.5 * (integrand[:, 1:] + integrand[:, :-1]) * np.diff(self.log_psi_grid)
+
+        cumulative = np.zeros_like(integrand)
+        cumulative[:, 1:] = np.cumsum(steps, axis=1)
+
+        norm = cumulative[:, -1:]
+        self.containment = np.divide(cumulative, norm, out=np.zeros_like(cumulative), where=norm > 0)
+
+    def energy_index(self, logE):
+        """
+        Find the energy bins of the gridded point spread function for the given energies
+
+        Parameters:
+        - logE: the logarithm of the true neutrino energy, scalar or array
+
+        Returns:
+        - Index of the energy bin, -1 for energies outside the available ranges
+        """
+        logE = np.asarray(logE, dtype=float)
+        index = np.searchsorted(self.logE_edges, logE, side="right") - 1
+        outside = (index < 0) | (index >= len(self.logE_edges) - 1)
+        return np.where(outside, -1, index)
 
     def get_interpolation_for_energy(self, logE):
         """
@@ -77,12 +132,33 @@ class PointSpreadFunction:
         Returns:
         - Interpolation of dP/dOmega versus log(alpha) in degrees
         """
+        index = self.energy_index(logE)
+        if index < 0:
+            raise ValueError(f"No interpolation found for energy {logE}.")
 
-        for (logE_low, logE_high), interp_func in self.interpolations.items():
-            if logE_low <= logE < logE_high:
-                return interp_func
+        if not self.interpolations:
+            self.interpolate_psf()
+
+        return self.interpolations[(self.logE_edges[index], self.logE_edges[index + 1])]
+
+    def interpolate_grid(self, table, index, loga):
+        """
+        Linear interpolation in log10(psi [degrees]) of a table stored on the common psi grid. Angles outside the
+        grid are clamped to the first and last grid point.
+
+        Parameters:
+        - table: array with shape (n_energy, n_psi)
+        - index: energy bin index, array
+        - loga: logarithm of the angle with the source in degrees, array broadcastable with index
+
+        Returns:
+        - Interpolated values with the broadcast shape of index and loga
+        """
+        grid = self.log_psi_grid
+        j = np.clip(np.searchsorted(grid, loga, side="right") - 1, 0, len(grid) - 2)
+        t = np.clip((loga - grid[j]) / (grid[j + 1] - grid[j]), 0, 1)
 
-        raise ValueError(f"No interpolation found for energy {logE}.")
+        return (1 - t) * table[index, j] + t * table[index, j + 1]
 
     def integrate_sphere(self, logE, min_angle=1e-4, max_angle=179.99, nsteps=500):
         """
@@ -121,10 +197,8 @@ class PointSpreadFunction:
         - Jacobian d Omega / d log(a)
         """
         a = np.power(10, loga) * np.pi / 180
-        if a > np.pi:
-            return 0
-            # we need to take care about non physical angles > 180 deg
-        return np.sin(a) * 2 * np.pi * np.log(10) * a
+        # we need to take care about non physical angles > 180 deg
+        return np.where(a > np.pi, 0, np.sin(a) * 2 * np.pi * np.log(10) * a)
 
     def eval(self, logE, loga):
         """
@@ -141,6 +215,90 @@ class PointSpreadFunction:
 
         return interp_func(loga)
 
+    def eval_batch(self, logE, loga, fill_value=0.0):
+        """
+        Vectorised version of eval for arrays of energies and angles, e.g. for the events of an unbinned likelihood.
+        The inputs are broadcast against each other. Energies outside the available ranges and angles beyond the
+        end of the grid (180 degrees) get fill_value, angles below the start of the grid get the innermost value.
+
+        Parameters:
+        - logE: logarithm of the true neutrino energy in GeV, array
+        - loga: logarithm of the angle with the source in degrees, array
+        - fill_value: value returned for energies or angles outside the point spread function
+
+        Returns:
+        - dP/dOmega with the broadcast shape of logE and loga
+        """
+        logE, loga = np.broadcast_arrays(np.asarray(logE, dtype=float), np.asarray(loga, dtype=float))
+
+        index = self.energy_index(logE)
+        outside = (index < 0) | (loga > self.log_psi_grid[-1]) | np.isnan(loga)
+
+        values = self.interpolate_grid(self.dp_domega, index, loga)
+        return np.where(outside, fill_value, values)
+
+    @timed("PointSpreadFunction.containment_fraction")
+    def containment_fraction(self, logE, angle_max, fill_value=None):
+        """
+        Look up the fraction of events within angle_max from the precomputed containment table. The inputs are
+        broadcast against each other, so a scan over many cone sizes and energies is a single call.
+
+        Parameters:
+        - logE: logarithm of the true neutrino energy in GeV, scalar or array
+        - angle_max: cone_size in degrees, scalar or array
+        - fill_value: value returned for energies outside the point spread function, by default these raise
+
+        Returns:
+        - Fraction of events within angle_max, with the broadcast shape of the inputs
+        """
+        logE, angle_max = np.broadcast_arrays(np.asarray(logE, dtype=float), np.asarray(angle_max, dtype=float))
+
+        index = self.energy_index(logE)
+        if fill_value is None and np.any(index < 0):
+            raise ValueError(f"No point spread function found for energy {logE[index < 0]}.")
+
+        with np.errstate(divide="ignore"):
+            loga = np.log10(angle_max)
+
+        values = self.interpolate_grid(self.containment, index, loga)
+        if fill_value is None:
+            return values
+        return np.where(index < 0, fill_value, values)
+
+    def containment_radius(self, logE, fraction):
+        """
+        Inverse of containment_fraction: the cone size that contains the given fraction of events,
+        e.g. fraction=0.5 for the median angular error. The inputs are broadcast against each other.
+
+        Parameters:
+        - logE: logarithm of the true neutrino energy in GeV, scalar or array
+        - fraction: fraction of events within the cone between 0 and 1, scalar or array
+
+        Returns:
+        - Cone size in degrees, with the broadcast shape of the inputs. NaN for energy bins without events.
+        """
+        logE, fraction = np.broadcast_arrays(np.asarray(logE, dtype=float), np.asarray(fraction, dtype=float))
+
+        if np.any((fraction < 0) | (fraction > 1)):
+            raise ValueError(f"fraction should be between 0 and 1 {fraction}")
+
+        index = self.energy_index(logE)
+        if np.any(index < 0):
+            raise ValueError(f"No point spread function found for energy {logE[index < 0]}.")
+
+        # offset each energy bin by 2 to search all monotonic containment curves at once in one flat array
+        n_psi = len(self.log_psi_grid)
+        flat = (self.containment + 2 * np.arange(len(self.containment))[:, np.newaxis]).ravel()
+        position = np.searchsorted(flat, 2 * index + fraction, side="left") - index * n_psi
+        j = np.clip(position, 1, n_psi - 1)
+
+        low = self.containment[index, j - 1]
+        high = self.containment[index, j]
+        t = np.divide(fraction - low, high - low, out=np.zeros_like(fraction), where=high > low)
+        loga = self.log_psi_grid[j - 1] + t * (self.log_psi_grid[j] - self.log_psi_grid[j - 1])
+
+        return np.where(self.containment[index, -1] > 0, np.power(10, loga), np.nan)
+
     def fraction_below_angle(self, logE, angle_max):
         """
         Calculate the fraction of events below a given angle_max in degrees
@@ -152,12 +310,10 @@ class PointSpreadFunction:
         Returns:
         - Fraction of events within angle_max
         """
-        c = self.integrate_sphere(logE)
-        if c == 0:
-            return 0
-        else:
-            return self.integrate_sphere(logE, 1e-4, angle_max) / c
+        return self.containment_fraction(logE, angle_max).item()
 
+    @timed("PointSpreadFunction.event_table_within_cone")
+    @memoised
     def event_table_within_cone(self, event_rate_table, angle_max):
         """
         Copies an event rate table with columns
@@ -174,14 +330,9 @@ class PointSpreadFunction:
 
         reconstructed_dataframe = event_rate_table[["log10(nu_E [GeV]) low", "log10(nu_E [GeV]) center", "log10(nu_E [GeV]) high", "rate [livetime^-1]"]].copy()
 
-        reconstructed_dataframe["fraction_in_cone"] = 0.0
-        reconstructed_dataframe["rate_in_cone [livetime^-1]"] = 0.0
-
-        for index, row in reconstructed_dataframe.iterrows():
-            true_logE_center = row["log10(nu_E [GeV]) center"]
-            event_rate = row["rate [livetime^-1]"]
-            fraction_below_angle = self.fraction_below_angle(true_logE_center, angle_max)
-            reconstructed_dataframe.at[index, "fraction_in_cone"] = fraction_below_angle
-            reconstructed_dataframe.at[index, "rate_in_cone [livetime^-1]"] = fraction_below_angle * event_rate
+        fraction_in_cone = self.containment_fraction(reconstructed_dataframe["log10(nu_E [GeV]) center"].to_numpy(), angle_max)
+        reconstructed_dataframe["fraction_in_cone"] = fraction_in_cone
+        reconstructed_dataframe["rate_in_cone [livetime^-1]"] = fraction_in_cone * reconstructed_dataframe["rate [livetime^-1]"]
 
+        count("PointSpreadFunction.event_table_within_cone.rows", len(reconstructed_dataframe))
         return reconstructed_dataframe
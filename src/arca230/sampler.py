@@ -0,0 +1,185 @@
+import numpy as np
+
+from arca230.sweep import livetime_1yr
+
+
+event_dtype = np.dtype(
+    [
+        ("true_logE", np.float32),  # log10(nu_E [GeV])
+        ("reco_logE", np.float32),  # log10(reco_E [GeV])
+        ("psi", np.float32),  # angular distance to the source in degrees
+        ("sindec", np.float32),  # sin(dec) of the reconstructed direction
+    ]
+)
+
+
+def inverse_cdf(cdf, x, rows, u):
+    """
+    Invert piecewise linear cumulative distributions stored as rows of a table, for many rows at once. All rows
+    are searched at once by offsetting row i of the table by i, which keeps the flattened table sorted.
+
+    Parameters:
+    - cdf: cumulative distributions from 0 to 1, array with shape (n_rows, n_points)
+    - x: values at which the cdf is given, array with shape (n_rows, n_points) or (n_points,)
+    - rows: row of each sample, integer array
+    - u: uniform random numbers in [0, 1), array with the shape of rows
+
+    Returns:
+    - Sampled values, array with the shape of rows
+    """
+    n_rows, n_points = cdf.shape
+    flat_cdf = (cdf + np.arange(n_rows)[:, np.newaxis]).ravel()
+    flat_x = np.broadcast_to(x, cdf.shape).ravel()
+
+    target = rows + u
+    position = np.searchsorted(flat_cdf, target, side="right") - 1
+    position = np.clip(position, rows * n_points, rows * n_points + n_points - 2)
+
+    step = flat_cdf[position + 1] - flat_cdf[position]
+    t = np.divide(target - flat_cdf[position], step, out=np.zeros_like(target), where=step > 0)
+    return flat_x[position] + np.clip(t, 0, 1) * (flat_x[position + 1] - flat_x[position])
+
+
+def inverse_cdf_table(cdf, x, n_quantiles=4096):
+    """
+    Tabulate the inverse of piecewise linear cumulative distributions on an equidistant grid of probabilities
+
+    Parameters:
+    - cdf: cumulative distributions from 0 to 1, array with shape (n_rows, n_points)
+    - x: values at which the cdf is given, array with shape (n_rows, n_points) or (n_points,)
+    - n_quantiles: number of probabilities from 0 to 1
+
+    Returns:
+    - Array with shape (n_rows, n_quantiles) with the values at the probabilities
+    """
+    n_rows = len(cdf)
+    rows = np.repeat(np.arange(n_rows), n_quantiles)
+    u = np.tile(np.linspace(0, 1, n_quantiles), n_rows)
+
+    # rows without entries have a zero cdf, which gives the first value
+    return inverse_cdf(cdf, x, rows, np.minimum(u, 1 - 1e-12)).reshape(n_rows, n_quantiles)
+
+
+def sample_inverse_cdf_table(table, rows, u):
+    """
+    Sample from tabulated inverse cdfs with linear interpolation between the probabilities. No search is needed,
+    which makes this the fast path for large numbers of samples.
+
+    Parameters:
+    - table: values at equidistant probabilities from 0 to 1, array with shape (n_rows, n_quantiles)
+    - rows: row of each sample, integer array
+    - u: uniform random numbers in [0, 1), array with the shape of rows
+
+    Returns:
+    - Sampled values, array with the shape of rows
+    """
+    n_quantiles = table.shape[1]
+    position = u * (n_quantiles - 1)
+    index = np.minimum(position.astype(np.intp), n_quantiles - 2)
+    t = position - index
+
+    flat = table.ravel()
+    index += rows * n_quantiles
+    return flat[index] + t * (flat[index + 1] - flat[index])
+
+
+class EventSampler:
+    """
+    Generates unbinned signal events of a point source from the instrument response functions. Events are drawn
+    per true energy bin of the effective area: the true energy from the flux within the bin, the reconstructed
+    energy from the migration matrix and the angular distance from the point spread function of that bin. All
+    distributions are precomputed as inverse cdf tables on an equidistant grid of probabilities, so sampling is a
+    few vectorised table lookups without searching.
+    """
+
+    def __init__(self, irfs, sindec, flux, livetime=livetime_1yr, energy_points=64, n_quantiles=4096):
+        """
+        Parameters:
+        - irfs: tuple with the EffectiveArea, PointSpreadFunction, EnergyResponse and BackgroundComponent
+        - sindec: Source location
+        - flux: spectral model (see flux.py) with a single set of parameters, or PointSourceFlux
+        - livetime: in seconds
+        - energy_points: number of points of the true energy cdf within each bin
+        - n_quantiles: number of probabilities of the inverse cdf tables
+        """
+        aeff, psf, eres, _ = irfs
+        self.sindec = sindec
+
+        # true energy bins without point spread function or energy response produce no events, like in
+        # sweep.expected_events
+        psf_rows = psf.energy_index(aeff.logE_centers)
+        eres_rows = eres.true_energy_index(aeff.logE_centers)
+        covered = (psf_rows >= 0) & (eres_rows >= 0)
+        covered[covered] &= psf.containment[psf_rows[covered], -1] > 0
+        covered[covered] &= eres.migration_matrix[eres_rows[covered]].sum(axis=1) > 0
+
+        rates = np.ravel(aeff.bin_integrated_flux(flux) * aeff.flux_kernel([sindec], livetime)[0])
+        rates = np.where(covered, rates, 0)
+
+        self.expected_events = rates.sum()
+        if self.expected_events <= 0:
+            raise ValueError(f"No events expected at sindec {sindec}")
+        self.bin_cdf = np.cumsum(rates) / self.expected_events
+        self.psf_rows = np.where(covered, psf_rows, 0)
+        self.eres_rows = np.where(covered, eres_rows, 0)
+
+        # true energy within each bin from dN/dlog10(E) on a fine grid
+        fraction = np.linspace(0, 1, energy_points)
+        energy_grid = aeff.logE_edges[:-1, np.newaxis] + np.diff(aeff.logE_edges)[:, np.newaxis] * fraction
+        density = np.reshape(flux.dNdE(energy_grid), energy_grid.shape) * np.power(10, energy_grid)
+        cumulative = np.zeros_like(density)
+        cumulative[:, 1:] = np.cumsum(0.5 * (density[:, 1:] + density[:, :-1]) * np.diff(energy_grid, axis=1), axis=1)
+        self.true_logE_table = inverse_cdf_table(cumulative / cumulative[:, -1:], energy_grid, n_quantiles)
+
+        # reconstructed energies are uniform in log10(E) within the bins of the migration matrix
+        reco_cdf = np.zeros((len(eres.migration_matrix), len(eres.reco_logE_edges)))
+        reco_cdf[:, 1:] = np.cumsum(eres.migration_matrix, axis=1)
+        self.reco_logE_table = inverse_cdf_table(reco_cdf, eres.reco_logE_edges, n_quantiles)
+
+        self.log_psi_table = inverse_cdf_table(psf.containment, psf.log_psi_grid, n_quantiles)
+
+    def sample(self, n_events, rng):
+        """
+        Draw a number of events
+
+        Parameters:
+        - n_events: number of events
+        - rng: numpy.random.Generator
+
+        Returns:
+        - Record array of length n_events with the fields of event_dtype
+        """
+        bins = np.minimum(np.searchsorted(self.bin_cdf, rng.random(n_events), side="right"), len(self.bin_cdf) - 1)
+        u = rng.random((4, n_events))
+
+        events = np.empty(n_events, dtype=event_dtype).view(np.recarray)
+        events.true_logE = sample_inverse_cdf_table(self.true_logE_table, bins, u[0])
+        events.reco_logE = sample_inverse_cdf_table(self.reco_logE_table, self.eres_rows[bins], u[1])
+
+        psi = np.radians(np.power(10, sample_inverse_cdf_table(self.log_psi_table, self.psf_rows[bins], u[2])))
+        events.psi = np.degrees(psi)
+
+        # reconstructed direction at distance psi from the source in a random direction
+        cos_dec = np.sqrt(1 - self.sindec**2)
+        events.sindec = np.clip(self.sindec * np.cos(psi) + cos_dec * np.sin(psi) * np.cos(2 * np.pi * u[3]), -1, 1)
+
+        return events
+
+    def events(self, n_events=None, chunk_size=1000000, seed=None):
+        """
+        Generate events in chunks, such that memory use does not depend on the number of events
+
+        Parameters:
+        - n_events: total number of events, defaults to a Poisson number with the expected number of events
+        - chunk_size: maximum number of events per chunk
+        - seed: seed of numpy.random.default_rng
+
+        Returns:
+        - Generator of record arrays with the fields of event_dtype
+        """
+        rng = np.random.default_rng(seed)
+        if n_events is None:
+            n_events = rng.poisson(self.expected_events)
+
+        for start in range(0, n_events, chunk_size):
+            yield self.sample(min(chunk_size, n_events - start), rng)
@@ -0,0 +1,163 @@
+import logging
+import mmap
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from arca230.instrumentation import count
+from arca230.irfcache import register_shared, unregister_shared
+
+
+logger = logging.getLogger(__name__)
+
+# arrays start at multiples of this number of bytes in the shared file
+alignment = 64
+
+
+def default_shared_dir():
+    """
+    Directory of the shared files: /dev/shm when it exists, such that the arrays are held in memory only,
+    otherwise the temporary directory. The page cache makes the mapping shared in both cases.
+    """
+    return "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+
+
+def _components(irfs):
+    # a list of IRF components, IRFBundles or tuples of components
+    for item in irfs:
+        if hasattr(item, "grid_arrays"):
+            yield item
+        else:
+            yield from _components(item)
+
+
+class SharedIRFs:
+    """
+    Publishes the tables and gridded arrays of loaded IRF components in a single file in shared memory. Worker
+    processes map the file read-only with attach(handle), after which the IRF classes take their arrays from the
+    mapping instead of parsing the csv files, so every worker shares the same physical memory. The file is removed
+    with close() or at the end of a with block; workers that attached keep their mapping until they exit.
+
+    Example:
+        with SharedIRFs.publish([load_bundle("track")]) as shared:
+            with ProcessPoolExecutor(initializer=attach, initargs=(shared.handle,)) as pool:
+                ...
+    """
+
+    def __init__(self, path, handle):
+        self.path = path
+        self.handle = handle
+
+    @classmethod
+    def publish(cls, irfs, directory=None):
+        """
+        Copy the tables and gridded arrays of IRF components into a new shared file
+
+        Parameters:
+        - irfs: list of IRFBundles, tuples of components or components
+        - directory: directory of the shared file, defaults to default_shared_dir()
+
+        Returns:
+        - SharedIRFs, its handle is a small picklable dictionary to pass to the workers
+        """
+        entries = []
+        blocks = []
+        size = 0
+
+        def reserve(array):
+            nonlocal size
+            array = np.ascontiguousarray(array)
+            offset = -(-size // alignment) * alignment
+            blocks.append((offset, array))
+            size = offset + array.nbytes
+            return {"offset": offset, "shape": list(array.shape), "dtype": array.dtype.str}
+
+        for component in _components(irfs):
+            table = getattr(component, component.data_table)
+            status = os.stat(component.file_path)
+            entries.append(
+                {
+                    "file_path": os.path.realpath(component.file_path),
+                    "mtime_ns": status.st_mtime_ns,
+                    "size": status.st_size,
+                    "columns": [(column, reserve(table[column].to_numpy())) for column in table.columns],
+                    "arrays": {name: reserve(getattr(component, name)) for name in component.grid_arrays},
+                }
+            )
+
+        handle, path = tempfile.mkstemp(dir=directory or default_shared_dir(), prefix="arca230-irfs-", suffix=".bin")
+        try:
+            with os.fdopen(handle, "wb+") as f:
+                f.truncate(max(size, 1))
+                with mmap.mmap(f.fileno(), max(size, 1)) as mapping:
+                    for offset, array in blocks:
+                        mapping[offset : offset + array.nbytes] = array.tobytes()
+        except BaseException:
+            os.remove(path)
+            raise
+
+        logger.info("Published %d IRF components, %d bytes, in %s", len(entries), size, path)
+        return cls(path, {"path": path, "size": size, "components": entries})
+
+    def close(self):
+        """
+        Remove the shared file. Processes that already mapped it keep their data until they detach and exit.
+        """
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def attach(handle):
+    """
+    Map a file published with SharedIRFs.publish read-only and register its arrays, such that IRF components
+    created afterwards in this process use them without copies. Components whose csv file changed since
+    publishing are skipped and loaded as usual. Can be used as initializer of a process pool.
+
+    Parameters:
+    - handle: SharedIRFs.handle
+
+    Returns:
+    - Number of registered components
+    """
+    with open(handle["path"], "rb") as f:
+        mapping = mmap.mmap(f.fileno(), max(handle["size"], 1), access=mmap.ACCESS_READ)
+
+    def view(block):
+        # arrays on a read-only mapping are read-only themselves and keep the mapping alive
+        dtype = np.dtype(block["dtype"])
+        return np.frombuffer(mapping, dtype, int(np.prod(block["shape"])), block["offset"]).reshape(block["shape"])
+
+    registered = 0
+    for entry in handle["components"]:
+        try:
+            status = os.stat(entry["file_path"])
+            changed = (status.st_mtime_ns, status.st_size) != (entry["mtime_ns"], entry["size"])
+        except FileNotFoundError:
+            changed = False
+        if changed:
+            logger.warning("%s changed since it was published, it is loaded from the csv file", entry["file_path"])
+            continue
+
+        table = pd.DataFrame({column: view(block) for column, block in entry["columns"]}, copy=False)
+        arrays = {name: view(block) for name, block in entry["arrays"].items()}
+        register_shared(entry["file_path"], table, arrays)
+        registered += 1
+
+    count("shared.attached", registered)
+    return registered
+
+
+def detach():
+    """
+    Stop using the shared arrays for new components. The mapping is released when the components that use it
+    are deleted.
+    """
+    unregister_shared()
@@ -0,0 +1,387 @@
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import nullcontext
+
+import numpy as np
+import pandas as pd
+
+from arca230.bundle import livetime_1yr, load_bundle
+from arca230.flux import PointSourceFlux
+from arca230.instrumentation import count, timed
+from arca230.shared import SharedIRFs, attach
+from arca230.utils import mean_limit, nobs_disc
+
+
+logger = logging.getLogger(__name__)
+
+result_columns = [
+    "channel",
+    "sindec",
+    "cone [degrees]",
+    "gamma",
+    "livetime [s]",
+    "signal [norm^-1]",
+    "background",
+    "mean_limit_nobs",
+    "mean_limit_flux [GeV-1 s-1 m-2]",
+    "discovery_nobs",
+    "discovery_flux [GeV-1 s-1 m-2]",
+]
+
+# rows of these columns identify a point of the sweep, used to resume an interrupted sweep
+key_columns = ["channel", "gamma", "livetime [s]", "sindec"]
+
+
+def load_channel(channel, data_dir=None, cache_dir=None):
+    """
+    Loads the four instrument response functions of a channel, once per process (see bundle.load_bundle)
+
+    Parameters:
+    - channel: 'track' or 'shower'
+    - data_dir: directory with the csv files, located with bundle.find_data_dir when not given
+    - cache_dir: directory of the binary cache (see irfcache.py)
+
+    Returns:
+    - IRFBundle, which unpacks like a tuple with the EffectiveArea, PointSpreadFunction, EnergyResponse and
+      BackgroundComponent
+    """
+    return load_bundle(channel, data_dir, cache_dir)
+
+
+def signal_kernel(irfs, sindec, livetime=livetime_1yr):
+    """
+    Signal events per unit of dN/dE at the true energy bin centers, before the search cone is applied. The
+    expected signal of any flux is the sum over true energy of this kernel times dN/dE and the fraction of the
+    point spread function within the cone, see expected_events.
+
+    Parameters:
+    - irfs: tuple with the EffectiveArea, PointSpreadFunction, EnergyResponse and BackgroundComponent
+    - sindec: Source locations, array of length n_sindec
+    - livetime: in seconds
+
+    Returns:
+    - Array with shape (n_sindec, n_energy) in GeV
+    """
+    aeff, psf, eres, bkg = irfs
+    aeff_matrix = aeff.effective_area_matrix(np.atleast_1d(np.asarray(sindec, dtype=float)))
+
+    # reconstructed energies are binned like the event table, which only keeps bins with effective area
+    response = eres.response_matrix(aeff.logE_centers, aeff.logE_edges[:-1], aeff.logE_edges[1:])
+    reco_bins = aeff_matrix > 0
+
+    # sum_ij rates[s, i] * response[i, j] * reco_bins[s, j], contracted over the reconstructed energy as a
+    # matrix product instead of a three operand loop
+    return aeff_matrix * aeff.energy_bin_width * livetime * (reco_bins @ response.T)
+
+
+@timed("sweep.expected_events")
+def expected_events(irfs, sindec, cones, gamma, livetime=livetime_1yr, flux=None):
+    """
+    Calculate the expected signal and background events within the search cones. This is the vectorised
+    equivalent of EffectiveArea.event_rate -> PointSpreadFunction.event_table_within_cone ->
+    EnergyResponse.reconstruct_event_table -> BackgroundComponent.event_rate, summed over energy.
+
+    Parameters:
+    - irfs: tuple with the EffectiveArea, PointSpreadFunction, EnergyResponse and BackgroundComponent
+    - sindec: Source locations, array of length n_sindec
+    - cones: sizes of the search cone in degrees, array of length n_cone
+    - gamma: spectral index of the power law flux
+    - livetime: in seconds
+    - flux: optional spectral model (see flux.py) with a normalisation of 1, used instead of the power law
+
+    Returns:
+    - Tuple of arrays with shape (n_sindec, n_cone): signal events for a flux normalisation of
+      1 GeV-1 s-1 m-2, and background events
+    """
+    aeff, psf, eres, bkg = irfs
+    sindec = np.atleast_1d(np.asarray(sindec, dtype=float))
+    cones = np.atleast_1d(np.asarray(cones, dtype=float))
+
+    if flux is None:
+        flux = PointSourceFlux(gamma, 1)
+
+    kernel = signal_kernel(irfs, sindec, livetime)
+
+    # the point spread function does not cover true energies without effective area
+    fraction_in_cone = psf.containment_fraction(aeff.logE_centers[:, np.newaxis], cones, fill_value=0)
+
+    signal = (kernel * np.reshape(flux.dNdE(aeff.logE_centers), -1)) @ fraction_in_cone
+    background = bkg.event_rate_matrix(sindec, cones, livetime).sum(axis=2)
+
+    return signal, background
+
+
+@timed("sweep.sensitivity_table")
+def sensitivity_table(
+    irfs, sindec, cones, gamma, livetime=livetime_1yr, confidence_level=0.9, significance=0.0026, power=0.5, flux=None
+):
+    """
+    Calculate the mean limit and discovery potential of the cut-and-count analysis for all combinations
+    of source locations and search cones
+
+    Parameters:
+    - irfs: tuple with the EffectiveArea, PointSpreadFunction, EnergyResponse and BackgroundComponent
+    - sindec: Source locations, array
+    - cones: sizes of the search cone in degrees, array
+    - gamma: spectral index of the power law flux
+    - livetime: in seconds
+    - confidence_level: confidence level of the limit
+    - significance: p-value for discovery
+    - power: probability to reach the significance for the discovery flux
+    - flux: optional spectral model (see flux.py) with a normalisation of 1, used instead of the power law
+
+    Returns:
+    - Dataframe with one row per source location and search cone
+    """
+    sindec = np.atleast_1d(np.asarray(sindec, dtype=float))
+    cones = np.atleast_1d(np.asarray(cones, dtype=float))
+
+    signal, background = expected_events(irfs, sindec, cones, gamma, livetime, flux)
+
+    limit_nobs = mean_limit(background, confidence_level)
+    discovery_nobs = nobs_disc(background, significance, power)
+
+    with np.errstate(divide="ignore"):
+        table = pd.DataFrame(
+            {
+                "sindec": np.repeat(sindec, len(cones)),
+                "cone [degrees]": np.tile(cones, len(sindec)),
+                "gamma": float(gamma),
+                "livetime [s]": float(livetime),
+                "signal [norm^-1]": signal.ravel(),
+                "background": background.ravel(),
+                "mean_limit_nobs": limit_nobs.ravel(),
+                "mean_limit_flux [GeV-1 s-1 m-2]": (limit_nobs / signal).ravel(),
+                "discovery_nobs": discovery_nobs.ravel(),
+                "discovery_flux [GeV-1 s-1 m-2]": (discovery_nobs / signal).ravel(),
+            }
+        )
+
+    return table
+
+
+class CsvResultWriter:
+    """
+    Appends the rows of a sweep to a csv file. Each block of rows is written and flushed at once.
+    """
+
+    def __init__(self, path, columns=result_columns):
+        self.path = path
+        self.columns = columns
+
+    def completed(self):
+        """
+        Returns:
+        - Dataframe with the rows already present in the output
+        """
+        if not os.path.exists(self.path) or os.path.getsize(self.path) == 0:
+            return pd.DataFrame(columns=self.columns)
+
+        # a sweep interrupted while writing may leave an incomplete last line, which is dropped
+        rows = pd.read_csv(self.path, on_bad_lines="skip", float_precision="round_trip")
+        return rows.dropna(subset=self.columns[-1:])
+
+    def open(self, resume, keep=None):
+        """
+        Start the output, on resume the rows of the points in keep stay and all other rows are removed. The file
+        is rewritten under a temporary name and replaced at once, so an interruption never loses finished rows.
+
+        Parameters:
+        - resume: keep rows of the existing output instead of overwriting it
+        - keep: function of the dataframe of existing rows giving a boolean mask of the rows to keep, all by default
+        """
+        if not resume or not os.path.exists(self.path):
+            with open(self.path, "w") as f:
+                f.write(",".join(self.columns) + "\n")
+            return
+
+        rows = self.completed()
+        if keep is not None:
+            rows = rows[keep(rows)]
+        with open(self.path + ".tmp", "w") as f:
+            rows.to_csv(f, index=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(self.path + ".tmp", self.path)
+
+    def write(self, rows):
+        with open(self.path, "a") as f:
+            rows[self.columns].to_csv(f, header=False, index=False)
+            f.flush()
+            os.fsync(f.fileno())
+
+
+class ParquetResultWriter:
+    """
+    Writes the rows of a sweep as a directory of Parquet files, one file per block of rows.
+    Requires pyarrow or fastparquet.
+    """
+
+    def __init__(self, path, columns=result_columns):
+        self.path = path
+        self.columns = columns
+        self.part = 0
+
+    def completed(self):
+        """
+        Returns:
+        - Dataframe with the rows already present in the output
+        """
+        parts = sorted(f for f in os.listdir(self.path) if f.endswith(".parquet")) if os.path.isdir(self.path) else []
+        if not parts:
+            return pd.DataFrame(columns=self.columns)
+        return pd.concat([pd.read_parquet(os.path.join(self.path, f)) for f in parts], ignore_index=True)
+
+    def open(self, resume, keep=None):
+        """
+        Start the output, on resume the rows of the points in keep stay and all other rows are removed. Parts with
+        rows to remove are replaced by one new part, which is written before the old parts are removed.
+
+        Parameters:
+        - resume: keep rows of the existing output instead of overwriting it
+        - keep: function of the dataframe of existing rows giving a boolean mask of the rows to keep, all by default
+        """
+        os.makedirs(self.path, exist_ok=True)
+        parts = sorted(f for f in os.listdir(self.path) if f.endswith(".parquet"))
+        self.part = max((int(f[5:-8]) + 1 for f in parts if f.startswith("part-")), default=0)
+
+        if resume and keep is not None and parts:
+            rows = self.completed()
+            mask = np.asarray(keep(rows), dtype=bool)
+            if mask.all():
+                return
+            if mask.any():
+                self.write(rows[mask])
+        elif resume:
+            return
+
+        for f in parts:
+            os.remove(os.path.join(self.path, f))
+
+    def write(self, rows):
+        # write to a temporary name first, such that an interrupted write never leaves a corrupt part
+        name = os.path.join(self.path, f"part-{self.part:06d}.parquet")
+        rows[self.columns].to_parquet(name + ".tmp", index=False)
+        os.replace(name + ".tmp", name)
+        self.part += 1
+
+
+_worker_irfs = {}
+
+
+def _init_worker(channels, data_dir, cache_dir, shared_handle=None):
+    # with the fork start method the IRFs loaded by the parent process are inherited and not loaded again,
+    # otherwise they are mapped from the shared memory published by the parent when available
+    if shared_handle is not None and any(channel not in _worker_irfs for channel in channels):
+        attach(shared_handle)
+    for channel in channels:
+        if channel not in _worker_irfs:
+            _worker_irfs[channel] = load_channel(channel, data_dir, cache_dir)
+
+
+def _run_task(channel, sindec, cones, gamma, livetime, statistics):
+    table = sensitivity_table(_worker_irfs[channel], sindec, cones, gamma, livetime, **statistics)
+    table.insert(0, "channel", channel)
+    return table
+
+
+def run_sweep(
+    output,
+    sindec,
+    cones,
+    gammas,
+    livetimes=(livetime_1yr,),
+    channels=("track",),
+    data_dir=None,
+    cache_dir=None,
+    jobs=None,
+    chunk_size=20,
+    resume=True,
+    progress=None,
+    shared_memory=True,
+    confidence_level=0.9,
+    significance=0.0026,
+    power=0.5,
+):
+    """
+    Calculate the sensitivity and discovery potential over a grid of source locations, search cones, spectral
+    indices, livetimes and channels. The grid is split in tasks of chunk_size source locations that run on a
+    process pool. Rows are written to the output as soon as a task finishes, and a sweep that was interrupted
+    continues with the missing points when it is started again with resume=True.
+
+    Parameters:
+    - output: path of the output, a csv file or a directory of Parquet files if the path ends with '.parquet'
+    - sindec: Source locations, array
+    - cones: sizes of the search cone in degrees, array
+    - gammas: spectral indices of the power law flux, array
+    - livetimes: livetimes in seconds, array
+    - channels: list of channels, 'track' and/or 'shower'
+    - data_dir: directory with the csv files, defaults to the data directory of the repository
+    - cache_dir: directory of the binary cache (see irfcache.py)
+    - jobs: number of worker processes, defaults to the number of cpus. With jobs=1 no pool is started
+    - chunk_size: number of source locations per task
+    - resume: continue an existing output instead of overwriting it
+    - progress: optional function called with the number of finished and total tasks
+    - shared_memory: publish the IRFs in shared memory for the worker processes (see shared.py), such that the
+      memory per worker does not grow with the IRF tables
+    - confidence_level: confidence level of the limit
+    - significance: p-value for discovery
+    - power: probability to reach the significance for the discovery flux
+
+    Returns:
+    - Number of rows written
+    """
+    sindec = np.atleast_1d(np.asarray(sindec, dtype=float))
+    statistics = {"confidence_level": confidence_level, "significance": significance, "power": power}
+
+    writer = ParquetResultWriter(output) if str(output).endswith(".parquet") else CsvResultWriter(output)
+
+    # points with all cones present in the output are done, the rows of the other points are removed and the
+    # points calculated again
+    done = set()
+    if resume:
+        rows = writer.completed()
+        counts = rows.groupby(key_columns).size()
+        done = {key for key, count in counts.items() if count >= len(np.atleast_1d(cones))}
+
+    def keep(rows):
+        return np.array([key in done for key in rows[key_columns].itertuples(index=False, name=None)], dtype=bool)
+
+    writer.open(resume, keep)
+
+    tasks = []
+    for channel in channels:
+        for gamma in np.atleast_1d(gammas):
+            for livetime in np.atleast_1d(livetimes):
+                todo = [s for s in sindec if (channel, float(gamma), float(livetime), float(s)) not in done]
+                for start in range(0, len(todo), chunk_size):
+                    tasks.append((channel, np.array(todo[start : start + chunk_size]), cones, gamma, livetime, statistics))
+
+    logger.info("Sweep with %d tasks, %d points already done", len(tasks), len(done))
+    _init_worker(channels, data_dir, cache_dir)
+
+    written = 0
+    if jobs == 1:
+        for i, task in enumerate(tasks):
+            rows = _run_task(*task)
+            writer.write(rows)
+            written += len(rows)
+            count("sweep.rows_written", len(rows))
+            if progress is not None:
+                progress(i + 1, len(tasks))
+    else:
+        shared = SharedIRFs.publish([_worker_irfs[channel] for channel in channels]) if shared_memory else nullcontext()
+        with shared:
+            initargs = (channels, data_dir, cache_dir, shared.handle if shared_memory else None)
+            with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker, initargs=initargs) as pool:
+                futures = [pool.submit(_run_task, *task) for task in tasks]
+                for i, future in enumerate(as_completed(futures)):
+                    rows = future.result()
+                    writer.write(rows)
+                    written += len(rows)
+                    count("sweep.rows_written", len(rows))
+                    if progress is not None:
+                        progress(i + 1, len(tasks))
+
+    return written
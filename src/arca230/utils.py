@@ -1,5 +1,14 @@
+from functools import lru_cache
+
 import numpy as np
-from scipy.stats import chi2, poisson
+
+from arca230.instrumentation import count, timed
+
+# results of mean_limit and nobs_disc per single mu0, (mu0, cl) -> limit and (mu0, alpha, beta, tolerance) -> mu_lds.
+# A cache is emptied when it exceeds max_cached_values entries.
+max_cached_values = 1 << 20
+_mean_limit_cache = {}
+_nobs_disc_cache = {}
 
 
 def create_histogram(x_low, x_high, y):
@@ -27,65 +36,170 @@ def limit(k, mu0, cl=0.90):
     on signal resulting from observing k events.
 
     Parameters:
-    - k: observed events
-    - mu0: number of background events
+    - k: observed events, scalar or array
+    - mu0: number of background events, scalar or array
     - cl: confidence level
 
     Returns:
     - Limit on the signal events
     """
-    q = chi2.ppf(cl, 2 * k + 2)
-    return 0.5 * q - mu0
+    from scipy.special import gammaincinv
+
+    # 0.5 * chi2.ppf(cl, 2 * k + 2) expressed as the quantile of the gamma distribution
+    return gammaincinv(np.asarray(k) + 1, cl) - mu0
+
+
+@lru_cache(maxsize=64)
+def _limit_table(kmax, cl):
+    # limit(k, 0, cl) for k = 0 ... kmax - 1
+    from scipy.special import gammaincinv
+
+    return gammaincinv(np.arange(kmax) + 1, cl)
+
+
+def clear_caches():
+    """
+    Empties the per value caches of mean_limit and nobs_disc
+    """
+    _mean_limit_cache.clear()
+    _nobs_disc_cache.clear()
+
+
+def _cached_per_value(cache, name, unique_mu0, parameters, compute):
+    # looks up every mu0 in cache and evaluates only the misses, in a single call of compute
+    keys = [(mu, *parameters) for mu in unique_mu0.tolist()]
+    cached = [cache.get(key) for key in keys]
+    missing = [i for i, value in enumerate(cached) if value is None]
+    count(f"utils.{name}.cache_misses", len(missing))
+
+    result = np.array([np.nan if value is None else value for value in cached])
+    if missing:
+        result[missing] = compute(unique_mu0[missing], *parameters)
+        if len(cache) + len(missing) > max_cached_values:
+            cache.clear()
+        cache.update((keys[i], value) for i, value in zip(missing, result[missing].tolist()))
+
+    return result
+
+
+def _mean_limit(mu0, cl):
+    from scipy.special import gammaln, xlogy
+
+    # the sum runs up to the same kmax as the original loop over k, terms far below mu0 are negligible
+    kmax = np.maximum(20, mu0 + 5 * np.sqrt(mu0)).astype(int)
+    kmin = np.clip(np.floor(mu0 - 10 * np.sqrt(mu0) - 10), 0, None).astype(int)
+
+    limits = _limit_table(int(kmax.max()), cl)
+    width = int((kmax - kmin).max())
+
+    result = np.zeros(len(mu0))
+    chunk = max(1, (1 << 20) // width)  # bound the memory of the (n_mu0, width) work arrays
+
+    for start in range(0, len(mu0), chunk):
+        mu = mu0[start : start + chunk, np.newaxis]
+        k = kmin[start : start + chunk, np.newaxis] + np.arange(width)
+        valid = k < kmax[start : start + chunk, np.newaxis]
+        k = np.where(valid, k, 0)
+
+        pmf = np.exp(xlogy(k, mu) - mu - gammaln(k + 1))
+        result[start : start + chunk] = np.sum(np.where(valid, pmf * (limits[k] - mu), 0), axis=1)
+
+    return result
 
 
+@timed("utils.mean_limit")
 def mean_limit(mu0, confidence_level=0.90):
     """
-    Given the background is mu0, compute the mean limit with corresponding confidence level
+    Given the background is mu0, compute the mean limit with corresponding confidence level.
+    Arrays of mu0 are evaluated at once, results are memoised per mu0 and confidence level.
 
     Parameters:
-    - mu0: number of background events
+    - mu0: number of background events, scalar or array
     - cl: confidence level
 
     Returns:
-    - Mean limit on the signal events
+    - Mean limit on the signal events, with the shape of mu0
     """
-    c = 0
+    mu0 = np.asarray(mu0, dtype=float)
+    unique_mu0, inverse = np.unique(mu0, return_inverse=True)
+    count("utils.mean_limit.values", mu0.size)
 
-    kmax = int(max(20, mu0 + 5 * np.sqrt(mu0)))
+    result = _cached_per_value(_mean_limit_cache, "mean_limit", unique_mu0, (float(confidence_level),), _mean_limit)
+    result = result[inverse].reshape(mu0.shape)
+    return result.item() if result.ndim == 0 else result
 
-    for k in range(kmax):
-        l = limit(k, mu0, confidence_level)
-        c += poisson.pmf(k, mu0) * l
 
-    return c
-
-
-def nobs_disc(mu0, alpha, beta):
+def critical_nobs(mu0, alpha):
     """
-    Given the background is mu0, compute the least detected number of signal events (mu_lds)
-    for a significance and power
+    Given the background is mu0, compute the least number of observed events for which the p-value is below alpha
 
     Parameters:
-    - mu0: number of background events
+    - mu0: number of background events, array
     - alpha: significance p-value
-    - beta: power
 
     Returns:
-    - Minimum number of signal events for alpha discovery
+    - Critical number of observed events, array of integers
     """
-    nmax = 100000
-    n_crit = None
+    from scipy.special import gammainc, pdtrik
+
+    mu0 = np.asarray(mu0, dtype=float)
+
+    # start from the continuous poisson quantile and correct for the discreteness, the p-value of
+    # n observed events is P(N > n) = gammainc(n + 1, mu0)
+    n_obs = np.nan_to_num(np.ceil(pdtrik(1 - alpha, mu0)), nan=0).astype(int)
+    n_obs = np.clip(n_obs, 0, None)
+
+    too_low = gammainc(n_obs + 1, mu0) >= alpha
+    while np.any(too_low):
+        n_obs = n_obs + too_low
+        too_low = gammainc(n_obs + 1, mu0) >= alpha
+
+    too_high = (n_obs > 0) & (gammainc(n_obs, mu0) < alpha)
+    while np.any(too_high):
+        n_obs = n_obs - too_high
+        too_high = (n_obs > 0) & (gammainc(n_obs, mu0) < alpha)
+
+    return n_obs + 1
+
+
+def _nobs_disc(mu0, alpha, beta, tolerance):
+    from scipy.special import gammaincinv
+
+    n_crit = critical_nobs(mu0, alpha)
 
-    for n_obs in range(nmax):
-        pvalue = 1 - poisson.cdf(n_obs, mu=mu0)
-        if pvalue < alpha:
-            n_crit = 1 + n_obs
-            break
+    # the signal for which P(N >= n_crit) = 1 - beta, with P(N >= n) = gammainc(n, mu0 + mu_lds)
+    mu_lds = gammaincinv(n_crit, 1 - beta) - mu0
 
-    for cont in range(nmax):
-        mu_lds = cont * 0.1  # optimize step size
-        p = 1 - poisson.cdf(n_crit - 1, mu=mu0 + mu_lds)
-        if p > (1 - beta):
-            break
+    if tolerance:
+        mu_lds = np.where(mu_lds < 0, 0, (np.floor(mu_lds / tolerance) + 1) * tolerance)
+    else:
+        mu_lds = np.clip(mu_lds, 0, None)
 
     return mu_lds
+
+
+@timed("utils.nobs_disc")
+def nobs_disc(mu0, alpha, beta, tolerance=None):
+    """
+    Given the background is mu0, compute the least detected number of signal events (mu_lds)
+    for a significance and power. Arrays of mu0 are evaluated at once, results are memoised
+    per mu0, alpha, beta and tolerance.
+
+    Parameters:
+    - mu0: number of background events, scalar or array
+    - alpha: significance p-value
+    - beta: power
+    - tolerance: resolution of mu_lds. By default the exact root is returned, otherwise mu_lds is the
+      first multiple of tolerance above the root. A tolerance of 0.1 reproduces the former fixed scan.
+
+    Returns:
+    - Minimum number of signal events for alpha discovery, with the shape of mu0
+    """
+    mu0 = np.asarray(mu0, dtype=float)
+    unique_mu0, inverse = np.unique(mu0, return_inverse=True)
+    count("utils.nobs_disc.values", mu0.size)
+
+    parameters = (float(alpha), float(beta), tolerance)
+    result = _cached_per_value(_nobs_disc_cache, "nobs_disc", unique_mu0, parameters, _nobs_disc)
+    result = result[inverse].reshape(mu0.shape)
+    return result.item() if result.ndim == 0 else result
@@ -0,0 +1,20 @@
+import pytest
+
+from arca230.bundle import load_bundle
+
+
+@pytest.fixture(autouse=True)
+def no_caches(monkeypatch):
+    # tests never read or write the binary cache or the memoised results of the user
+    for name in ("ARCA230_CACHE_DIR", "ARCA230_MEMO_DIR", "ARCA230_NO_MEMO", "ARCA230_MEMO_MAX_BYTES"):
+        monkeypatch.delenv(name, raising=False)
+
+
+@pytest.fixture(scope="session")
+def track():
+    return load_bundle("track")
+
+
+@pytest.fixture(scope="session")
+def shower():
+    return load_bundle("shower")
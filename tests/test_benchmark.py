@@ -0,0 +1,37 @@
+import pytest
+
+from arca230.benchmark import check_import_budgets, joint_regression_checks, regression_checks
+from arca230.bundle import load_bundle
+
+
+def failed(checks):
+    return [
+        f"{name} deviates by {deviation:.3g}, tolerance {tolerance:.3g}"
+        for name, deviation, tolerance in checks
+        if not deviation <= tolerance
+    ]
+
+
+@pytest.mark.parametrize("channel", ["track", "shower"])
+def test_regression_checks(channel):
+    # golden outputs, float64 columns and every stage against its reference implementation
+    checks = regression_checks(load_bundle(channel), channel)
+    assert {name for name, _, _ in checks} >= {
+        "golden discovery_nobs",
+        "golden mean_limit_nobs",
+        "event_table_within_cone float64 columns",
+    }
+    assert not failed(checks)
+
+
+def test_joint_regression_checks(track, shower):
+    # the default and exact joint cone searches against the evaluation of all cone combinations
+    checks = joint_regression_checks([track, shower])
+    assert any("path vs all cone combinations" in name for name, _, _ in checks)
+    assert any("exact vs all cone combinations" in name for name, _, _ in checks)
+    assert not failed(checks)
+
+
+def test_import_budgets():
+    timings = check_import_budgets()
+    assert "arca230.benchmark" in timings
@@ -0,0 +1,128 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from arca230.bundle import livetime_1yr
+from arca230.cli import expand_jobs, job_columns, job_tasks, main, parse_sources, read_job_file, spectrum_from_config
+
+job_toml = """
+output = "results.csv"
+[defaults]
+channels = ["track", "shower"]
+cones = [0.5, 1.0]
+spectra = [2.0, {model = "ExponentialCutoffPowerLaw", gamma = 2.0, logE_cut = 6.0}]
+livetime_years = [1, 10]
+
+[[jobs]]
+name = "catalog"
+sources = [{name = "NGC 1068", dec = -0.01}, {name = "TXS 0506+056", sindec = 0.099}]
+
+[[jobs]]
+name = "scan"
+sindec = {start = -0.9, stop = 0.9, num = 5}
+spectra = [2.5]
+channels = "track"
+"""
+
+
+def test_read_toml_and_json(tmp_path):
+    toml_path = tmp_path / "jobs.toml"
+    toml_path.write_text(job_toml)
+    config = read_job_file(str(toml_path))
+
+    json_path = tmp_path / "jobs.json"
+    json_path.write_text(json.dumps(config))
+    assert read_job_file(str(json_path)) == config
+
+    yaml_path = tmp_path / "jobs.yaml"
+    yaml_path.write_text("jobs: []")
+    with pytest.raises(ValueError, match="Unknown format"):
+        read_job_file(str(yaml_path))
+
+
+def test_expand_jobs(tmp_path):
+    path = tmp_path / "jobs.toml"
+    path.write_text(job_toml)
+    catalog, scan = expand_jobs(read_job_file(str(path)))
+
+    assert catalog["names"] == ["NGC 1068", "TXS 0506+056"]
+    np.testing.assert_allclose(catalog["sindec"], [np.sin(np.radians(-0.01)), 0.099])
+    assert catalog["channels"] == ["track", "shower"]
+    assert catalog["livetimes"] == [livetime_1yr, 10 * livetime_1yr]
+    assert catalog["statistics"] == {"confidence_level": 0.9, "significance": 0.0026, "power": 0.5}
+
+    assert scan["names"] == [""] * 5
+    np.testing.assert_allclose(scan["sindec"], np.linspace(-0.9, 0.9, 5))
+    assert scan["channels"] == ["track"]
+    assert scan["spectra"] == [2.5]
+
+    # 2 channels x 2 spectra x 2 livetimes for the catalog, 1 x 1 x 2 for the scan
+    assert len(job_tasks([catalog, scan])) == 10
+    assert len(job_tasks([scan], chunk_size=2)) == 6
+
+
+@pytest.mark.parametrize(
+    "job, message",
+    [
+        ({}, "no sources"),
+        ({"sources": [0.5]}, "is not a table"),
+        ({"sources": [{"name": "a"}]}, "neither 'dec' nor 'sindec'"),
+        ({"sindec": {"start": 0, "stop": 1}}, "misses num"),
+        ({"sindec": {"start": 0, "stop": 1, "num": "many"}}, "is not numeric"),
+        ({"sindec": [0.5, 1.5]}, r"\|sin\(dec\)\| > 1"),
+    ],
+)
+def test_invalid_sources(job, message):
+    with pytest.raises(ValueError, match=message):
+        parse_sources({"name": "job", **job})
+
+
+@pytest.mark.parametrize(
+    "job, message",
+    [
+        ({"sindec": [0.5], "gamma": 2.0}, "Unknown keys in job job-0: gamma"),
+        ({"sindec": [0.5], "channels": ["cascade"]}, "Unknown channel cascade"),
+        ({"sindec": [0.5], "cones": [0]}, r"within \(0, 90\]"),
+        ({"sindec": [0.5], "spectra": [{"model": "Gaussian"}]}, "Unknown spectral model Gaussian"),
+        ({"sindec": [0.5], "spectra": [{"model": "PowerLaw", "gamma": 2, "norm": 1}]}, "remove 'norm'"),
+        ({"sindec": [0.5], "spectra": [{"model": "PowerLaw", "index": 2}]}, "Invalid parameters of PowerLaw"),
+    ],
+)
+def test_invalid_jobs(job, message):
+    with pytest.raises(ValueError, match=message):
+        expand_jobs({"jobs": [job]})
+
+    with pytest.raises(ValueError, match="no \\[\\[jobs\\]\\]"):
+        expand_jobs({"defaults": job})
+
+
+def test_spectrum_labels():
+    assert spectrum_from_config(2)[0] == "PowerLaw(gamma=2)"
+    label, model = spectrum_from_config({"model": "LogParabola", "alpha": 2.0, "beta": 0.1, "label": "lp"})
+    assert label == "lp"
+    assert model.norm == 1.0
+
+
+def test_main(tmp_path, capsys):
+    path = tmp_path / "jobs.json"
+    output = tmp_path / "results.csv"
+    path.write_text(
+        json.dumps({"jobs": [{"name": "point", "sources": [{"name": "a", "sindec": 0.5}], "cones": [1, 2]}]})
+    )
+
+    assert main([str(path), "-o", str(output), "-j", "1", "--no-progress"]) == 0
+    table = pd.read_csv(output)
+    assert list(table.columns) == job_columns
+    assert list(table["source"]) == ["a", "a"]
+    assert list(table["cone [degrees]"]) == [1, 2]
+    assert "Wrote 2 rows" in capsys.readouterr().err
+
+
+def test_main_reports_errors(tmp_path, capsys):
+    path = tmp_path / "jobs.json"
+    path.write_text(json.dumps({"jobs": [{"name": "broken", "sources": ["NGC 1068"]}]}))
+
+    assert main([str(path), "-o", str(tmp_path / "results.csv")]) == 1
+    assert "arca230: error: Source 0 of job broken is not a table" in capsys.readouterr().err
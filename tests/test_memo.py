@@ -0,0 +1,115 @@
+import os
+
+import numpy as np
+import pytest
+
+from arca230 import memo
+from arca230.instrumentation import instrument
+
+calls = []
+
+
+@memo.memoised
+def square(values):
+    calls.append(values)
+    return np.square(values)
+
+
+@memo.memoised
+def identity(value):
+    calls.append(value)
+    return value
+
+
+@pytest.fixture
+def memo_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv("ARCA230_MEMO_DIR", str(tmp_path))
+    calls.clear()
+    return tmp_path
+
+
+def entries(directory):
+    return sorted(path for path in directory.rglob("*.pkl"))
+
+
+def test_hit_after_miss(memo_dir):
+    with instrument() as recorder:
+        first = square(np.arange(5.0))
+        second = square(np.arange(5.0))
+        square(np.arange(6.0))
+
+    np.testing.assert_array_equal(first, second)
+    assert len(calls) == 2
+    assert recorder.counters == {"memo.miss": 2, "memo.hit": 1}
+    assert len(entries(memo_dir)) == 2
+
+
+def test_key_depends_on_type_and_dtype():
+    keys = {
+        memo.memo_key("f", None, (value,), {})
+        for value in (1, 1.0, "1", True, np.array([1.0]), np.array([1], dtype=np.int32), [1.0], (1.0,))
+    }
+    assert len(keys) == 8
+
+
+def test_disabled(memo_dir):
+    with memo.disabled():
+        assert memo.memo_dir() is None
+        square(np.arange(5.0))
+        square(np.arange(5.0))
+
+    assert len(calls) == 2
+    assert entries(memo_dir) == []
+
+
+def test_environment_opt_out(memo_dir, monkeypatch):
+    monkeypatch.setenv("ARCA230_NO_MEMO", "1")
+    square(np.arange(5.0))
+    square(np.arange(5.0))
+
+    assert len(calls) == 2
+    assert entries(memo_dir) == []
+
+
+def test_unhashable_arguments_are_not_memoised(memo_dir):
+    with instrument() as recorder:
+        identity(object)
+
+    assert calls == [object]
+    assert recorder.counters == {"memo.unhashable": 1}
+    assert entries(memo_dir) == []
+
+
+def test_evict_least_recently_used(tmp_path):
+    for i in range(10):
+        path = memo.entry_path(str(tmp_path), f"{i:02d}{'0' * 62}")
+        memo.write_entry(path, np.zeros(1000))
+        os.utime(path, ns=(i * 10**9, i * 10**9))
+    size = os.path.getsize(path)
+
+    # reading an entry marks it as recently used
+    hit, _ = memo.read_entry(memo.entry_path(str(tmp_path), "00" + "0" * 62))
+    assert hit
+
+    removed = memo.evict(str(tmp_path), 5 * size)
+    remaining = [path.name[:2] for path in entries(tmp_path)]
+    assert removed == 6
+    assert remaining == ["00", "07", "08", "09"]
+    assert memo.evict(str(tmp_path), 5 * size) == 0
+
+
+def test_eviction_on_write(memo_dir, monkeypatch):
+    monkeypatch.setattr(memo, "_writes", 0)
+    monkeypatch.setenv("ARCA230_MEMO_MAX_BYTES", "1")
+
+    # the first write of a process checks the size of the cache, the next eviction_interval - 1 writes do not
+    square(np.arange(5.0))
+    assert entries(memo_dir) == []
+    square(np.arange(6.0))
+    assert len(entries(memo_dir)) == 1
+
+
+def test_clear(memo_dir):
+    square(np.arange(5.0))
+    memo.clear()
+    assert entries(memo_dir) == []
@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+from arca230.flux import PowerLaw
+from arca230.sampler import EventSampler, event_dtype, inverse_cdf, inverse_cdf_table, sample_inverse_cdf_table
+from arca230.sweep import expected_events
+
+
+@pytest.fixture(scope="module")
+def sampler(track):
+    return EventSampler(track, 0.3, PowerLaw(2.0, 1.0))
+
+
+def test_inverse_cdf():
+    x = np.array([0.0, 1.0, 3.0])
+    cdf = np.array([[0.0, 0.5, 1.0], [0.0, 0.0, 1.0]])
+    rows = np.array([0, 0, 0, 1, 1])
+    u = np.array([0.0, 0.25, 0.75, 0.5, 0.999])
+    np.testing.assert_allclose(inverse_cdf(cdf, x, rows, u), [0.0, 0.5, 2.0, 2.0, 2.998])
+
+    table = inverse_cdf_table(cdf, x, n_quantiles=5)
+    np.testing.assert_allclose(sample_inverse_cdf_table(table, rows, u), inverse_cdf(cdf, x, rows, u), atol=1e-9)
+
+
+def test_events(sampler):
+    chunks = list(sampler.events(25000, chunk_size=10000, seed=3))
+    assert [len(chunk) for chunk in chunks] == [10000, 10000, 5000]
+    assert all(chunk.dtype == event_dtype for chunk in chunks)
+
+    events = np.concatenate(chunks)
+    assert np.all(np.isfinite(events.view(np.float32).reshape(-1, 4)))
+    assert np.all(events["psi"] >= 0)
+    assert np.all(np.abs(events["sindec"]) <= 1)
+
+    repeated = np.concatenate(list(sampler.events(25000, chunk_size=10000, seed=3)))
+    np.testing.assert_array_equal(events, repeated)
+
+
+def test_poisson_number_of_events(sampler):
+    n_events = sum(len(chunk) for chunk in sampler.events(seed=5))
+    assert abs(n_events - sampler.expected_events) < 5 * np.sqrt(sampler.expected_events)
+
+
+def test_fraction_in_cone(sampler, track):
+    # the angular distances follow the point spread function used for the expected events in a cone
+    cones = [0.5, 1.0, 2.0, 90.0]
+    signal, _ = expected_events(track, [0.3], cones, 2.0)
+    psi = np.concatenate([chunk["psi"] for chunk in sampler.events(200000, seed=1)])
+    fraction = [np.mean(psi < cone) / np.mean(psi < 90) for cone in cones[:-1]]
+    np.testing.assert_allclose(fraction, signal[0, :-1] / signal[0, -1], atol=0.01)
+
+
+def test_no_events(track):
+    with pytest.raises(ValueError, match="No events expected"):
+        EventSampler(track, 0.3, PowerLaw(2.0, 0.0))
@@ -0,0 +1,79 @@
+import os
+import shutil
+
+import numpy as np
+import pytest
+
+from arca230.aeff import EffectiveArea
+from arca230.bundle import IRFBundle, data_file_names
+from arca230.instrumentation import instrument
+from arca230.shared import SharedIRFs, attach, detach
+from arca230.sweep import expected_events
+
+
+@pytest.fixture
+def bundle(tmp_path, track):
+    # a copy of the csv files, such that they can be modified
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    for file_name in data_file_names("track").values():
+        shutil.copy2(os.path.join(track.data_dir, file_name), data_dir)
+    return IRFBundle.load("track", str(data_dir))
+
+
+@pytest.fixture
+def shared(tmp_path, bundle):
+    with SharedIRFs.publish([bundle], directory=str(tmp_path)) as shared:
+        yield shared
+    detach()
+
+
+def test_attach(shared, bundle):
+    assert attach(shared.handle) == 4
+
+    with instrument() as recorder:
+        mapped = IRFBundle.load("track", bundle.data_dir)
+    assert recorder.counters["irfcache.shared"] == 4
+
+    for component, original in zip(mapped, bundle):
+        table = getattr(component, component.data_table)
+        assert table.equals(getattr(original, original.data_table))
+        for name in component.grid_arrays:
+            array = getattr(component, name)
+            np.testing.assert_array_equal(array, getattr(original, name))
+            assert not array.flags.writeable
+
+    sindec = np.linspace(-0.9, 0.9, 5)
+    for result, reference in zip(
+        expected_events(mapped, sindec, [1.0], 2.0), expected_events(bundle, sindec, [1.0], 2.0)
+    ):
+        np.testing.assert_array_equal(result, reference)
+
+
+def test_detach(shared, bundle):
+    attach(shared.handle)
+    detach()
+
+    with instrument() as recorder:
+        aeff = EffectiveArea(bundle.aeff.file_path)
+    assert "irfcache.shared" not in recorder.counters
+    assert aeff.aeff_grid.flags.writeable
+
+
+def test_close_keeps_attached_arrays(shared, bundle):
+    attach(shared.handle)
+    aeff = EffectiveArea(bundle.aeff.file_path)
+    shared.close()
+
+    assert not os.path.exists(shared.path)
+    np.testing.assert_array_equal(aeff.aeff_grid, bundle.aeff.aeff_grid)
+
+
+def test_changed_file_is_not_attached(shared, bundle):
+    # a csv file modified after publishing is loaded from the file again
+    os.utime(bundle.bkg.file_path, ns=(0, 0))
+    assert attach(shared.handle) == 3
+
+    with instrument() as recorder:
+        IRFBundle.load("track", bundle.data_dir)
+    assert recorder.counters["irfcache.shared"] == 3
@@ -0,0 +1,58 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from arca230.sweep import key_columns, run_sweep
+
+sindec = np.linspace(-0.9, 0.9, 7)
+cones = [0.5, 1.0, 2.0]
+gammas = [2.0, 2.5]
+
+
+def run(output, resume=True, jobs=1):
+    return run_sweep(str(output), sindec, cones, gammas, jobs=jobs, chunk_size=3, resume=resume)
+
+
+def read(output):
+    return pd.read_csv(output, float_precision="round_trip").sort_values(key_columns + ["cone [degrees]"])
+
+
+@pytest.fixture(scope="module")
+def complete(tmp_path_factory):
+    output = tmp_path_factory.mktemp("sweep") / "complete.csv"
+    assert run(output) == len(sindec) * len(cones) * len(gammas)
+    return read(output)
+
+
+def test_resume_complete_sweep(tmp_path, complete):
+    output = tmp_path / "sweep.csv"
+    run(output)
+    assert run(output) == 0
+    pd.testing.assert_frame_equal(read(output), complete)
+
+
+def test_resume_interrupted_sweep(tmp_path, complete):
+    output = tmp_path / "sweep.csv"
+    run(output)
+
+    # an interruption in the middle of a line leaves an incomplete line and a point with only some of its cones
+    lines = output.read_text().splitlines(keepends=True)
+    output.write_text("".join(lines[:11]) + lines[11][: len(lines[11]) // 2])
+
+    assert run(output) == len(complete) - 9
+    result = read(output)
+    assert not result.duplicated(key_columns + ["cone [degrees]"]).any()
+    pd.testing.assert_frame_equal(result.reset_index(drop=True), complete.reset_index(drop=True))
+
+
+def test_no_resume_overwrites(tmp_path, complete):
+    output = tmp_path / "sweep.csv"
+    run(output)
+    assert run(output, resume=False) == len(complete)
+    assert len(read(output)) == len(complete)
+
+
+def test_process_pool(tmp_path, complete):
+    output = tmp_path / "sweep.csv"
+    run(output, jobs=2)
+    pd.testing.assert_frame_equal(read(output).reset_index(drop=True), complete.reset_index(drop=True))
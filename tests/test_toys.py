@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+
+from arca230.toys import p_value, run_pseudo_experiments, sample_counts, toy_expectations, ts_threshold
+
+
+@pytest.fixture(scope="module")
+def expectations(track):
+    return toy_expectations(track, 0.3, 2.0, cones=[0.5, 1.0, 2.0])
+
+
+def test_toy_expectations(expectations):
+    signal, background = expectations
+    assert signal.shape == background.shape
+    assert signal.shape[0] == 3
+    assert np.all(signal >= 0) and np.all(background >= 0)
+
+
+def test_seed_reproducibility(expectations):
+    signal, background = expectations
+    first = run_pseudo_experiments(signal, background, 2500, seed=42, chunk_size=1000)
+    second = run_pseudo_experiments(signal, background, 2500, seed=42, chunk_size=1000)
+    other = run_pseudo_experiments(signal, background, 2500, seed=43, chunk_size=1000)
+
+    assert first.dtype == np.float32
+    np.testing.assert_array_equal(first, second)
+    assert not np.array_equal(first, other)
+
+
+def test_independent_of_processes(expectations):
+    signal, background = expectations
+    serial = run_pseudo_experiments(signal, background, 2500, ns=3.0, seed=7, chunk_size=1000)
+    parallel = run_pseudo_experiments(signal, background, 2500, ns=3.0, seed=7, jobs=2, chunk_size=1000)
+    np.testing.assert_array_equal(serial, parallel)
+
+
+def test_signal_increases_ts(expectations):
+    signal, background = expectations
+    background_ts = run_pseudo_experiments(signal, background, 5000, seed=1)
+    signal_ts = run_pseudo_experiments(signal, background, 5000, ns=10.0, seed=2)
+
+    assert np.all(background_ts >= 0)
+    assert np.median(signal_ts) > ts_threshold(background_ts, 0.5)
+    assert np.median(p_value(background_ts, signal_ts)) < 0.05
+
+
+def test_sample_counts():
+    rng = np.random.default_rng(0)
+    template = np.array([[0.25, 0.75], [0.0, 0.0]])
+    background = np.array([[1.0, 2.0], [3.0, 0.0]])
+    counts = sample_counts(template, background, 4.0, 20000, rng)
+
+    assert counts.shape == (20000, 2, 2)
+    np.testing.assert_allclose(counts.mean(axis=0), 4.0 * template + background, rtol=0.03, atol=1e-12)
+
+
+def test_p_value_and_threshold():
+    background_ts = np.arange(100.0)
+    np.testing.assert_array_equal(p_value(background_ts, [0.0, 50.0, 99.0, 100.0]), [1.0, 0.5, 0.01, 0.0])
+    assert ts_threshold(background_ts, 0.5) == pytest.approx(49.5)